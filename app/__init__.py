@@ -1,14 +1,18 @@
 from flask import Flask
 import os
 from app.extensions import db, migrate, login_manager
+from app.schema import upgrade_schema
 from .blueprints.main import bp as main_bp
 from .blueprints.auth import bp as auth_bp
 from .blueprints.teacher import bp as teacher_bp
 from .blueprints.student import bp as student_bp
 from app.models import User, Teacher, Student
 from dotenv import load_dotenv
-from app.core.rag_pipeline import RAGPipeline
-from app.core.langchain_agents import FeedbackAgents
+from app.core.grading_queue import grading_queue
+from app.core.bulk_grading import bulk_grader
+from app.core.ai_telemetry import ai_telemetry
+from app.core.services import ai_services
+from app.cli import rag_cli, grading_cli, ai_log_cli
 
 # Load environment variables (e.g., OPENAI_API_KEY)
 load_dotenv()
@@ -25,9 +29,18 @@ def create_app(config_class="app.config.Config"):
 
     with app.app_context():
         db.create_all()
+        # Columns added to existing tables (create_all only creates missing tables)
+        upgrade_schema(db.engine)
 
-    pipeline = RAGPipeline(persist_directory="./submissions_db")
-    agents = FeedbackAgents()
+    # Per-call AI latency/token log (batched writes)
+    ai_telemetry.init_app(app)
+
+    # Background grading workers (jobs are stored in the app database)
+    grading_queue.init_app(app)
+    bulk_grader.init_app(app)
+
+    # RAG pipeline and feedback agents are created lazily on first use
+    ai_services.init_app(app)
 
     # Blueprints
     app.register_blueprint(auth_bp)
@@ -35,6 +48,11 @@ def create_app(config_class="app.config.Config"):
     app.register_blueprint(student_bp, url_prefix="/student")
     app.register_blueprint(main_bp)
 
+    # CLI commands (flask rag ..., flask grading ..., flask ai-log ...)
+    app.cli.add_command(rag_cli)
+    app.cli.add_command(grading_cli)
+    app.cli.add_command(ai_log_cli)
+
     # ép môi trường development
     os.environ["FLASK_ENV"] = "development"
     app.debug = True
@@ -1,10 +1,18 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, abort, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
 from datetime import datetime
 from app.extensions import db
-from app.models import Task, Submission, Question
-from . import bp, pipeline, agents
+from app.models import Task, Submission, Question, GradingJob
+from app.core.ai_telemetry import ai_log_context
+from app.core.bulk_grading import grading_fingerprint
+from app.core.grading_queue import grading_queue
+from app.core.keys import stable_submission_id
+from app.core.services import ai_services
+from app.core.task_references import grading_context
+from . import bp
 import json
+import time
+import uuid
 
 
 # 📘 Student Writing Test Page
@@ -94,6 +102,9 @@ def view_task_details(task_id):
 
 # NEW ASS UPDATES
 
+# Seconds a streamed submission waits for its event stream before a worker takes it
+STREAM_CLAIM_WINDOW = 10
+
 @bp.route('/tasks/submit_test/<int:task_id>', methods=['POST'])
 @login_required
 def submit_test(task_id):
@@ -105,7 +116,6 @@ def submit_test(task_id):
     # metadata
     timestamp = datetime.utcnow().isoformat()
     assignment_id = f"task_{task_id}"
-    submission_id = f"{student_id}_{assignment_id}_{timestamp}"
     jlpt_level = request.form.get('jlpt_level', 'N5')
 
     if not submission:
@@ -129,58 +139,215 @@ def submit_test(task_id):
     task.is_done = True
     db.session.commit()
 
-    try:
-        # 1. Save to vectorstore
-        pipeline.add_submission(
-            submission_id=submission_id,
-            content=content,
-            metadata={
-                "student_id": student_id,
-                "assignment_id": assignment_id,
-                "type": "student_submission",
-                "timestamp": timestamp
-            }
-        )
+    # Keyed by the DB row so resubmits replace the previous chunks
+    submission_id = stable_submission_id(submission.id)
 
-        # 2. Get reference context
-        context = pipeline.get_context_for_submission(
-            query=content[:200],
-            k=3,
-            filter_dict={
-                "assignment_id": assignment_id,
-                "type": "reference"
-            }
-        )
+    # Grading runs on the background worker pool; the browser polls for the result.
+    # A client that will open the event stream gets a short head start to claim the job itself.
+    stream = request.form.get('stream') == '1'
+    job = grading_queue.enqueue(submission.id, {
+        "content": content,
+        "jlpt_level": jlpt_level,
+        "student_id": student_id,
+        "assignment_id": assignment_id,
+        "task_id": task.id,
+        "vector_submission_id": submission_id,
+        "timestamp": timestamp,
+        "fingerprint": grading_fingerprint(content, jlpt_level, task, current_app.config),
+    }, delay=STREAM_CLAIM_WINDOW if stream else 0)
 
-        # 3. Run feedback agents
-        feedback_results = agents.run_multi_agents(
-            text=content,
-            context=context,
-            jlpt_level=jlpt_level
-        )
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            "job_id": job.id,
+            "submission_id": submission.id,
+            "status": job.status,
+            "status_url": url_for('student.grading_job_status', job_id=job.id),
+            "events_url": url_for('student.grading_events', job_id=job.id),
+            "progress_url": url_for('student.grading_progress', job_id=job.id),
+        }), 202
 
-        # 4. Save AI feedback and score
-        submission.ai_feedback = feedback_results['feedback']['feedback_text']
-        submission.ai_score = feedback_results['overall_score']
-        db.session.commit()
+    return redirect(url_for('student.grading_progress', job_id=job.id))
 
-        # After getting submission
-        if submission and submission.status == 'submitted':
-            flash("You have already submitted this test.", "info")
-            return redirect(url_for('student.view_tasks', task_id=task_id))
 
-        return render_template(
-            "feedback.html",
-            submission=submission,
-            feedback=feedback_results,
-            task=task
-        )
+def _prepare_grading(payload):
+    """Index the submission and fetch its reference context."""
+    assignment_id = payload["assignment_id"]
+
+    # 1. Save to vectorstore (only new/changed chunks are embedded)
+    ai_services.pipeline.upsert_submission(
+        submission_id=payload["vector_submission_id"],
+        content=payload["content"],
+        metadata={
+            "student_id": payload["student_id"],
+            "assignment_id": assignment_id,
+            "type": "student_submission",
+            "timestamp": payload["timestamp"]
+        }
+    )
+
+    # 2. Reference context: the task's precomputed bundle (no vector search), or for
+    #    tasks without one, a search over the essay (one query per paragraph in 'multi' mode)
+    task = db.session.get(Task, payload["task_id"]) if payload.get("task_id") else None
+    context = grading_context(task, payload["content"])
+    if context is not None:
+        return context
+    return ai_services.pipeline.get_context_for_submission(
+        query=payload["content"],
+        k=3,
+        filter_dict={
+            "assignment_id": assignment_id,
+            "type": "reference"
+        }
+    )
+
+
+def _save_grading(submission, feedback_results):
+    """Copy the AI feedback and score onto the submission (committed with the job)."""
+    feedback = feedback_results.get('feedback', {})
+    submission.ai_feedback = feedback.get('feedback_text') or feedback.get('raw', '')
+    submission.ai_score = feedback_results['overall_score']
+
+
+@grading_queue.job_handler
+def grade_submission(job):
+    """Embed, retrieve context and run the feedback agents for one queued submission."""
+    payload = json.loads(job.payload)
+    context = _prepare_grading(payload)
+
+    # 3. Run feedback agents
+    feedback_results = ai_services.agents.run_multi_agents(
+        text=payload["content"],
+        context=context,
+        jlpt_level=payload["jlpt_level"],
+        # Forced re-grades ask the model again rather than replaying cached responses
+        refresh=payload.get("force", False)
+    )
+
+    # 4. Save AI feedback and score
+    _save_grading(job.submission, feedback_results)
+    return feedback_results
+
+
+def _get_own_job_or_404(job_id):
+    job = GradingJob.query.get_or_404(job_id)
+    if job.submission.student_id != current_user.id:
+        abort(404)
+    return job
 
-    except Exception as e:
-        # Rollback on error and show error message
-        db.session.rollback()
-        flash(f"An error occurred while processing your submission: {str(e)}", "danger")
-        return redirect(url_for('student.view_tasks', task_id=task_id))
+
+@bp.route('/grading/<int:job_id>')
+@login_required
+def grading_progress(job_id):
+    job = _get_own_job_or_404(job_id)
+    return render_template('student/grading_progress.html', job=job)
+
+
+@bp.route('/api/grading_jobs/<int:job_id>')
+@login_required
+def grading_job_status(job_id):
+    job = _get_own_job_or_404(job_id)
+    data = job.to_dict()
+    if job.status == 'done':
+        data["ai_score"] = job.submission.ai_score
+        data["feedback_url"] = url_for('student.grading_feedback', job_id=job.id)
+    return jsonify(data)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@bp.route('/grading/<int:job_id>/events')
+@login_required
+def grading_events(job_id):
+    """
+    Server-Sent Events for a grading job.
+
+    If the job is still queued this request claims it and runs the agents
+    itself, pushing each agent's result as it completes and the final feedback
+    token by token. Otherwise (a worker already has it) it reports status
+    changes until the job finishes, with a ': ping' comment every
+    GRADING_EVENTS_KEEPALIVE_SECONDS so proxies keep the connection open, and
+    gives up with a 'timeout' event after GRADING_EVENTS_MAX_WAIT_SECONDS.
+    """
+    job = _get_own_job_or_404(job_id)
+
+    def live(job):
+        job_id, worker_id = job.id, job.worker_id
+        try:
+            payload = json.loads(job.payload)
+            yield _sse("status", {"status": "running"})
+            with grading_queue.heartbeat(job), ai_log_context(job.submission_id):
+                context = _prepare_grading(payload)
+                for event in ai_services.agents.stream_multi_agents(
+                        text=payload["content"],
+                        context=context,
+                        jlpt_level=payload["jlpt_level"]):
+                    if event["event"] == "done":
+                        results = event["results"]
+                        _save_grading(job.submission, results)
+                        grading_queue.complete(job, results, worker_id)
+                        yield _sse("done", {"feedback_url": url_for('student.grading_feedback', job_id=job_id),
+                                            "overall_score": results["overall_score"]})
+                    else:
+                        yield _sse(event.pop("event"), event)
+        except GeneratorExit:
+            # Browser went away mid-grading: let a background worker finish it.
+            grading_queue.release(job_id)
+            raise
+        except Exception as e:
+            grading_queue.fail(job_id, e, worker_id)
+            yield _sse("error", {"error": str(e)})
+
+    keepalive = current_app.config.get('GRADING_EVENTS_KEEPALIVE_SECONDS', 15)
+    max_wait = current_app.config.get('GRADING_EVENTS_MAX_WAIT_SECONDS', 600)
+
+    def follow(job_id):
+        last_status = None
+        started = last_sent = time.monotonic()
+        while True:
+            db.session.expire_all()
+            job = db.session.get(GradingJob, job_id)
+            if job.status != last_status:
+                last_status = job.status
+                last_sent = time.monotonic()
+                yield _sse("status", job.to_dict())
+            if job.status == 'done':
+                yield _sse("done", {"feedback_url": url_for('student.grading_feedback', job_id=job_id),
+                                    "overall_score": job.submission.ai_score})
+                return
+            if job.status == 'failed':
+                yield _sse("error", {"error": job.error})
+                return
+            now = time.monotonic()
+            if now - started >= max_wait:
+                yield _sse("timeout", {"status": job.status,
+                                       "status_url": url_for('student.grading_job_status', job_id=job_id)})
+                return
+            if now - last_sent >= keepalive:
+                yield ": ping\n\n"
+                last_sent = now
+            time.sleep(1)
+
+    claimed = grading_queue.claim(job.id, f"stream-{uuid.uuid4().hex[:8]}")
+    events = live(claimed) if claimed is not None else follow(job.id)
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@bp.route('/grading/<int:job_id>/feedback')
+@login_required
+def grading_feedback(job_id):
+    job = _get_own_job_or_404(job_id)
+    if job.status != 'done':
+        return redirect(url_for('student.grading_progress', job_id=job.id))
+
+    return render_template(
+        "student/feedback.html",
+        submission=job.submission,
+        feedback=json.loads(job.result),
+        task=Task.query.get(job.submission.task_id)
+    )
 
 
 @bp.route("/api/feedback")
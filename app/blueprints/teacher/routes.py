@@ -1,9 +1,13 @@
-from flask import render_template, request, redirect, url_for, flash
+from flask import render_template, request, redirect, url_for, flash, jsonify, abort, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
 from datetime import datetime
 from app.extensions import db
 from app.models import Task, Question, Teacher, Submission, Student, User
+from app.core.bulk_grading import bulk_grader
+from app.core.task_references import refresh_task_references_in_background, remove_task_references
+from app.core.services import ai_services
 from . import bp
+import json
 
 # --- Create a task (with multiple questions) ---
 @bp.route('/create_task', methods=['GET', 'POST'])
@@ -70,6 +74,9 @@ def create_task():
 
         db.session.commit()
 
+        # Index questions/hints/sample answers as reference material for grading
+        refresh_task_references_in_background(new_task, current_app._get_current_object())
+
         flash(f'Task created successfully with {added_count} questions!', 'success')
         return redirect(url_for('teacher.view_tasks'))
 
@@ -125,6 +132,7 @@ def edit_task(task_id):
             task.due_date = None
 
         db.session.commit()
+        refresh_task_references_in_background(task, current_app._get_current_object())
         flash('Task updated successfully!', 'success')
         return redirect(url_for('teacher.view_tasks'))
 
@@ -141,6 +149,10 @@ def delete_task(task_id):
     task = Task.query.get_or_404(task_id)
     db.session.delete(task)
     db.session.commit()
+    try:
+        remove_task_references(task_id)
+    except Exception as e:
+        print(f"Removing reference material for task {task_id} failed: {e}")
     flash('Task deleted successfully.', 'success')
     return redirect(url_for('teacher.view_tasks'))
 
@@ -168,4 +180,112 @@ def view_submissions(task_id):
 
     return render_template('teacher/view_submissions.html',
                            task=task,
-                           submissions=submissions)
\ No newline at end of file
+                           submissions=submissions)
+
+
+# --- Bulk AI re-grade ---
+def _get_own_task_or_404(task_id):
+    task = Task.query.get_or_404(task_id)
+    if task.created_by != current_user.id:
+        abort(404)
+    return task
+
+
+@bp.route('/task/<int:task_id>/regrade', methods=['GET', 'POST'])
+@login_required
+def regrade_task(task_id):
+    if current_user.role != 'teacher':
+        flash('Access denied. Teachers only.', 'danger')
+        return redirect(url_for('main.index'))
+
+    task = _get_own_task_or_404(task_id)
+    run = bulk_grader.latest_run(task.id)
+
+    if request.method == 'POST':
+        if bulk_grader.is_live(run):
+            flash('A re-grade for this task is already running.', 'info')
+        else:
+            # An interrupted run continues from its checkpoint
+            run = bulk_grader.start_run(task.id,
+                                        started_by=current_user.id,
+                                        force=request.form.get('force') == '1',
+                                        resume=request.form.get('restart') != '1')
+            bulk_grader.run_in_background(run.id)
+            flash(f'Re-grading {run.total} submission(s) in the background.', 'success')
+
+        if request.is_json or request.accept_mimetypes.best == 'application/json':
+            return jsonify(run.to_dict()), 202
+        return redirect(url_for('teacher.regrade_task', task_id=task.id))
+
+    return render_template('teacher/regrade_task.html', task=task, run=run)
+
+
+@bp.route('/api/task/<int:task_id>/regrade')
+@login_required
+def regrade_status(task_id):
+    if current_user.role != 'teacher':
+        abort(403)
+    task = _get_own_task_or_404(task_id)
+    run = bulk_grader.latest_run(task.id)
+    return jsonify(run.to_dict() if run else {"status": None})
+
+
+@bp.route('/task/<int:task_id>/regrade/cancel', methods=['POST'])
+@login_required
+def cancel_regrade(task_id):
+    if current_user.role != 'teacher':
+        flash('Access denied. Teachers only.', 'danger')
+        return redirect(url_for('main.index'))
+
+    task = _get_own_task_or_404(task_id)
+    run = bulk_grader.latest_run(task.id)
+    if run is not None and run.status == 'running':
+        bulk_grader.cancel(run)
+        flash('Re-grade cancelled; submissions already graded keep their new grade.', 'info')
+    return redirect(url_for('teacher.regrade_task', task_id=task.id))
+
+
+# --- Questions across a task's submissions ---
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@bp.route('/api/task/<int:task_id>/ask', methods=['GET', 'POST'])
+@login_required
+def ask_submissions(task_id):
+    """
+    Answer a question about the task's student submissions.
+
+    GET ?question=... streams the answer token by token as Server-Sent Events
+    ("token" events, then "done"); POST {"question": ...} returns it as JSON.
+    """
+    if current_user.role != 'teacher':
+        abort(403)
+    task = _get_own_task_or_404(task_id)
+
+    data = request.args if request.method == 'GET' else (request.get_json(silent=True) or request.form)
+    question = (data.get('question') or '').strip()
+    if not question:
+        return jsonify({"error": "question is required"}), 400
+
+    pipeline = ai_services.pipeline
+    filter_dict = {"assignment_id": f"task_{task.id}", "type": "student_submission"}
+
+    if request.method == 'POST':
+        try:
+            return jsonify({"answer": pipeline.answer_question(question, filter_dict)})
+        except Exception as e:
+            print(f"Submission Q&A for task {task.id} failed: {e}")
+            return jsonify({"error": "Could not answer the question right now."}), 502
+
+    def events():
+        try:
+            for piece in pipeline.stream_answer(question, filter_dict):
+                yield _sse("token", {"text": piece})
+            yield _sse("done", {})
+        except Exception as e:
+            print(f"Submission Q&A for task {task.id} failed: {e}")
+            yield _sse("error", {"error": "Could not answer the question right now."})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,154 @@
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+
+from app.models import Submission, Task
+from app.core.ai_telemetry import ai_telemetry
+from app.core.bulk_grading import bulk_grader
+from app.core.grading_queue import grading_queue
+from app.core.keys import stable_submission_id
+from app.core.rate_limiter import get_rate_limiter
+from app.core.services import ai_services
+from app.core.task_references import refresh_task_references
+
+rag_cli = AppGroup('rag', help='Maintenance commands for the submissions vectorstore.')
+grading_cli = AppGroup('grading', help='AI grading commands.')
+ai_log_cli = AppGroup('ai-log', help='Latency and token reports from the AI call log.')
+
+
+@rag_cli.command('compact')
+def compact_vectorstore():
+    """Remove duplicate submission chunks and move survivors to stable IDs."""
+    def resolve(meta):
+        assignment_id = str(meta.get("assignment_id", ""))
+        if not assignment_id.startswith("task_"):
+            return None
+        submission = Submission.query.filter_by(
+            task_id=int(assignment_id[len("task_"):]),
+            student_id=meta.get("student_id")
+        ).first()
+        return stable_submission_id(submission.id) if submission else None
+
+    stats = ai_services.pipeline.compact_submissions(resolve_id=resolve)
+    click.echo(f"Removed {stats['submissions_removed']} superseded submissions "
+               f"({stats['chunks_deleted']} chunks), re-keyed {stats['submissions_rekeyed']}.")
+
+
+@rag_cli.command('repartition')
+@click.option('--page-size', type=int, default=1000, show_default=True, help='Chunks copied per page.')
+@click.option('--delete-source', is_flag=True, help='Drop the old collections once they are copied.')
+@click.option('--from-backend', type=click.Choice(['chroma', 'numpy']), default=None,
+              help='Copy every collection of this backend into VECTORSTORE_BACKEND.')
+def repartition_vectorstore(page_size, delete_source, from_backend):
+    """Move stored chunks into the VECTORSTORE_PARTITIONING layout without re-embedding."""
+    pipeline = ai_services.pipeline
+    stats = pipeline.repartition(page_size=page_size, delete_source=delete_source, source_backend=from_backend)
+    click.echo(f"Copied {stats['chunks_copied']} chunks from {stats['sources']} collection(s) "
+               f"into {stats['partitions']} '{pipeline.partitioning}' {pipeline.backend} collection(s).")
+
+
+@rag_cli.command('index-references')
+@click.option('--task-id', type=int, default=None, help='Only this task (default: every task).')
+def index_references(task_id):
+    """Index task questions, hints and sample answers as reference material."""
+    tasks = [Task.query.get(task_id)] if task_id is not None else Task.query.order_by(Task.id).all()
+    if tasks == [None]:
+        raise click.ClickException(f"Task {task_id} not found")
+    for task in tasks:
+        stats = refresh_task_references(task)
+        click.echo(f"Task {task.id} '{task.title}': {stats}")
+
+
+@rag_cli.command('status')
+def services_status():
+    """Show startup timings and cache statistics of the AI services."""
+    pipeline = ai_services.pipeline
+    agents = ai_services.agents
+    click.echo(f"Timings: {ai_services.timings()}")
+    click.echo(f"Submissions indexed: {pipeline.count_submissions()}")
+    click.echo(f"Lexical index: {pipeline.lexical_index.count()} chunks (search mode: {pipeline.search_mode})")
+    if pipeline.partitioning != "none":
+        partitions = pipeline.partition_stats()
+        click.echo(f"Partitions ({pipeline.partitioning}): {len(partitions)} collections, "
+                   f"{sum(partitions.values())} chunks")
+    if pipeline.embedding_cache is not None:
+        click.echo(f"Embedding cache: {pipeline.embedding_cache.stats()}")
+    if pipeline.retrieval_cache is not None:
+        click.echo(f"Retrieval cache: {pipeline.retrieval_cache.stats()}")
+    if pipeline.answer_cache is not None:
+        click.echo(f"Q&A answer cache: {pipeline.answer_cache.stats()}")
+    click.echo(f"LLM response cache: {agents.cache_stats()}")
+    click.echo(f"Rate limiter: {get_rate_limiter().stats()}")
+
+
+def _format_progress(run):
+    info = run.to_dict()
+    eta = f", ETA {info['eta_seconds']}s" if info['eta_seconds'] is not None else ""
+    return (f"{run.processed}/{run.total} processed "
+            f"(graded {run.graded}, unchanged {run.skipped}, failed {run.failed}) "
+            f"- {info['graded_per_minute']}/min{eta}")
+
+
+@grading_cli.command('regrade')
+@click.argument('task_id', type=int)
+@click.option('--workers', type=int, default=None, help='Concurrent gradings (default BULK_GRADING_WORKERS).')
+@click.option('--force', is_flag=True, help='Re-grade submissions even if nothing changed.')
+@click.option('--restart', is_flag=True, help='Start over instead of resuming an interrupted run.')
+def regrade_task(task_id, workers, force, restart):
+    """Re-run AI grading for every submission of TASK_ID."""
+    task = Task.query.get(task_id)
+    if task is None:
+        raise click.ClickException(f"Task {task_id} not found")
+
+    latest = bulk_grader.latest_run(task_id)
+    if bulk_grader.is_live(latest) and not restart:
+        raise click.ClickException(
+            f"Run #{latest.id} is still in progress ({_format_progress(latest)}). It can be resumed once "
+            f"its heartbeat is older than GRADING_JOB_LEASE_SECONDS, or pass --restart to start over.")
+
+    run = bulk_grader.start_run(task_id, force=force, workers=workers, resume=not restart)
+    if run.processed:
+        click.echo(f"Resuming run #{run.id} after submission {run.last_submission_id}: {_format_progress(run)}")
+    else:
+        click.echo(f"Run #{run.id}: re-grading {run.total} submission(s) of '{task.title}' "
+                   f"with {run.workers} worker(s)")
+
+    run = bulk_grader.run(run.id, progress=lambda r: click.echo(_format_progress(r)))
+    click.echo(f"Run #{run.id} {run.status}: {_format_progress(run)}")
+
+
+@grading_cli.command('worker')
+@click.option('--workers', type=int, default=None, help='Worker threads (default GRADING_WORKERS).')
+def grading_worker(workers):
+    """Process queued grading jobs in the foreground until interrupted."""
+    grading_queue.start(workers)
+    click.echo(f"Grading worker running with {workers or grading_queue.app.config['GRADING_WORKERS']} thread(s); "
+               f"Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        click.echo("Stopping after the current jobs...")
+        grading_queue.stop()
+
+
+@ai_log_cli.command('stats')
+@click.option('--hours', type=float, default=24.0, help='Report window ending now.')
+@click.option('--by', 'group_by', type=click.Choice(['agent', 'model']), default='agent')
+def ai_log_stats(hours, group_by):
+    """Latency percentiles, token totals and cache hits per agent or model."""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    report = ai_telemetry.summary(since, group_by=group_by)
+    if not report:
+        click.echo(f"No AI calls logged in the last {hours:g}h.")
+        return
+
+    label = (lambda r: f"{r['kind']}:{r['agent']} [{r['model']}]") if group_by == 'agent' else (lambda r: str(r['model']))
+    width = max(len(label(r)) for r in report)
+    click.echo(f"{'':{width}}  {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+               f"{'prompt tok':>11} {'compl tok':>10} {'cached':>7} {'errors':>7}")
+    for r in report:
+        click.echo(f"{label(r):{width}}  {r['calls']:>6} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} "
+                   f"{r['prompt_tokens']:>11} {r['completion_tokens']:>10} {r['cache_hits']:>7} {r['errors']:>7}")
@@ -11,8 +11,80 @@ class Config:
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     OPENAI_MODEL = os.getenv('OPENAI_MODEL')
     OPENAI_EMBED_MODEL = os.getenv('OPENAI_EMBED_MODEL')
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+    # Shared keep-alive pool for all OpenAI calls; default covers every grading worker's agents
+    OPENAI_POOL_SIZE = int(os.getenv('OPENAI_POOL_SIZE') or
+                           int(os.getenv('GRADING_WORKERS', '2')) * int(os.getenv('AGENT_MAX_CONCURRENCY', '5')) + 4)
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+    OPENAI_READ_TIMEOUT = float(os.getenv('OPENAI_READ_TIMEOUT', '120'))
+    OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '60'))
     CHROMA_DIR = os.getenv('CHROMA_DIR', './chroma_db')
+    SUBMISSIONS_DB_DIR = os.getenv('SUBMISSIONS_DB_DIR', './submissions_db')
     DEFAULT_JLPT_LEVEL = os.getenv('DEFAULT_JLPT_LEVEL','N5')
+    AGENT_PARALLEL = os.getenv('AGENT_PARALLEL', '1') == '1'
+    AGENT_MAX_CONCURRENCY = int(os.getenv('AGENT_MAX_CONCURRENCY', '5'))
+    AGENT_TIMEOUT = float(os.getenv('AGENT_TIMEOUT', '60'))
+    SCORING_MODE = os.getenv('SCORING_MODE', 'local')  # 'local' or 'llm'
+    ANALYSIS_MODE = os.getenv('ANALYSIS_MODE', 'agents')  # 'agents' or 'combined'
+    # Token budgets for retrieved context / analysis JSON inside each prompt
+    PROMPT_CONTEXT_TOKENS = int(os.getenv('PROMPT_CONTEXT_TOKENS', '1500'))
+    PROMPT_ANALYSIS_TOKENS = int(os.getenv('PROMPT_ANALYSIS_TOKENS', '1200'))
+    # Size of the per-task reference bundle (questions, hints, sample answers)
+    REFERENCE_CONTEXT_TOKENS = int(os.getenv('REFERENCE_CONTEXT_TOKENS', '1500'))
+    RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'multi')  # 'single' or 'multi' (per-paragraph queries)
+    RETRIEVAL_MAX_QUERIES = int(os.getenv('RETRIEVAL_MAX_QUERIES', '5'))
+    SEARCH_MODE = os.getenv('SEARCH_MODE', 'hybrid')  # 'vector', 'hybrid' or 'lexical' (local BM25 only)
+    # 'none' (one filtered collection), 'assignment' or 'assignment_type' (one collection per partition)
+    VECTORSTORE_PARTITIONING = os.getenv('VECTORSTORE_PARTITIONING', 'none')
+    VECTORSTORE_MAX_OPEN_COLLECTIONS = int(os.getenv('VECTORSTORE_MAX_OPEN_COLLECTIONS', '32'))
+    VECTORSTORE_BACKEND = os.getenv('VECTORSTORE_BACKEND', 'chroma')  # 'chroma' or 'numpy' (float16 memmap)
+    # Matryoshka output size of the embedding model (changing it needs a re-embed of the store)
+    EMBEDDING_DIMENSIONS = int(os.getenv('EMBEDDING_DIMENSIONS')) if os.getenv('EMBEDDING_DIMENSIONS') else None
+    # numpy backend: reduced first-pass vectors, reranked against full precision kept on disk
+    VECTOR_QUANTIZATION = os.getenv('VECTOR_QUANTIZATION', 'float16')  # 'float16' or 'int8'
+    VECTOR_SEARCH_DIMENSIONS = (int(os.getenv('VECTOR_SEARCH_DIMENSIONS'))
+                                if os.getenv('VECTOR_SEARCH_DIMENSIONS') else None)
+    VECTOR_RERANK_FACTOR = int(os.getenv('VECTOR_RERANK_FACTOR', '4'))
+    # Retrieval results cached per (query, k, filter); writes invalidate only the filters they match
+    RETRIEVAL_CACHE = os.getenv('RETRIEVAL_CACHE', '1') == '1'
+    RETRIEVAL_CACHE_SIZE = int(os.getenv('RETRIEVAL_CACHE_SIZE', '1000'))
+    RETRIEVAL_CACHE_SHARED = os.getenv('RETRIEVAL_CACHE_SHARED', '0') == '1'  # share entries across workers via SQLite
+    # Teacher Q&A over submissions: compiled chains kept per filter, answers cached per filter generation
+    QA_CHAIN_CACHE_SIZE = int(os.getenv('QA_CHAIN_CACHE_SIZE', '32'))
+    QA_ANSWER_CACHE_SIZE = int(os.getenv('QA_ANSWER_CACHE_SIZE', '256'))
+    QA_ANSWER_CACHE_TTL = float(os.getenv('QA_ANSWER_CACHE_TTL', '86400'))
+    # Keep only the retrieved sentences most similar to the essay (offline TF-IDF)
+    CONTEXT_COMPRESSION = os.getenv('CONTEXT_COMPRESSION', '1') == '1'
+    CONTEXT_COMPRESSION_MAX_CHARS = int(os.getenv('CONTEXT_COMPRESSION_MAX_CHARS', '1200'))
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1') == '1'
+    LLM_CACHE_SIZE = int(os.getenv('LLM_CACHE_SIZE', '1024'))
+    LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', '86400'))
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH')  # SQLite file for the persistent tier
+    # Shared by all worker processes on the host; 0 disables a limit
+    LLM_RATE_LIMIT_ENABLED = os.getenv('LLM_RATE_LIMIT_ENABLED', '1') == '1'
+    LLM_RATE_LIMIT_PATH = os.getenv('LLM_RATE_LIMIT_PATH', './instance/rate_limit.sqlite3')
+    LLM_RATE_LIMITS = {
+        'chat': (int(os.getenv('LLM_RATE_LIMIT_RPM', '500')), int(os.getenv('LLM_RATE_LIMIT_TPM', '200000'))),
+        'embeddings': (int(os.getenv('EMBED_RATE_LIMIT_RPM', '3000')), int(os.getenv('EMBED_RATE_LIMIT_TPM', '1000000'))),
+    }
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '5'))
+    AI_LOG_ENABLED = os.getenv('AI_LOG_ENABLED', '1') == '1'
+    AI_LOG_BATCH_SIZE = int(os.getenv('AI_LOG_BATCH_SIZE', '50'))
+    AI_LOG_FLUSH_INTERVAL = float(os.getenv('AI_LOG_FLUSH_INTERVAL', '2'))
+    AI_LOG_QUEUE_SIZE = int(os.getenv('AI_LOG_QUEUE_SIZE', '10000'))
+    AI_LOG_PAYLOADS = os.getenv('AI_LOG_PAYLOADS', '0') == '1'  # also store prompts/responses
+    # Per serving process, started on its first request (`flask grading worker` for a dedicated process)
+    GRADING_WORKERS = int(os.getenv('GRADING_WORKERS', '2'))
+    GRADING_MAX_ATTEMPTS = int(os.getenv('GRADING_MAX_ATTEMPTS', '3'))
+    GRADING_BACKOFF_SECONDS = float(os.getenv('GRADING_BACKOFF_SECONDS', '5'))
+    GRADING_POLL_INTERVAL = float(os.getenv('GRADING_POLL_INTERVAL', '1'))
+    GRADING_JOB_LEASE_SECONDS = int(os.getenv('GRADING_JOB_LEASE_SECONDS', '600'))
+    # Grading event streams that follow another worker's job: keepalive comment interval, and how
+    # long to follow before sending a 'timeout' event and closing (the client may reconnect)
+    GRADING_EVENTS_KEEPALIVE_SECONDS = float(os.getenv('GRADING_EVENTS_KEEPALIVE_SECONDS', '15'))
+    GRADING_EVENTS_MAX_WAIT_SECONDS = float(os.getenv('GRADING_EVENTS_MAX_WAIT_SECONDS', '600'))
+    BULK_GRADING_WORKERS = int(os.getenv('BULK_GRADING_WORKERS', '4'))
+    BULK_GRADING_PAGE_SIZE = int(os.getenv('BULK_GRADING_PAGE_SIZE', '0'))  # 0 = 4 per worker
 
 
 config = Config()
\ No newline at end of file
@@ -0,0 +1,251 @@
+# ai_telemetry.py
+# Per-call latency/token instrumentation for LLM, embedding and retrieval calls, persisted to AILog
+
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.extensions import db
+
+# Record currently being measured (inner layers such as caches annotate it)
+_current_record = contextvars.ContextVar("ai_log_record", default=None)
+# Submission the current calls are made for
+_submission_id = contextvars.ContextVar("ai_log_submission_id", default=None)
+
+PAYLOAD_MAX_CHARS = 4000
+
+
+@contextlib.contextmanager
+def ai_log_context(submission_id: Optional[int] = None):
+    """Attribute AI calls made in the enclosed block to a submission."""
+    token = _submission_id.set(submission_id)
+    try:
+        yield
+    finally:
+        _submission_id.reset(token)
+
+
+def annotate(**fields):
+    """Add fields (e.g. cache_hit) to the record being tracked, if any."""
+    record = _current_record.get()
+    if record is not None:
+        record.update(fields)
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class AITelemetry:
+    """
+    Collects one record per AI call and writes them to ``ai_log`` in batches.
+
+    Calls only put the record on an in-memory queue; a background thread
+    inserts whole batches (AI_LOG_BATCH_SIZE rows or every
+    AI_LOG_FLUSH_INTERVAL seconds), so request latency is not affected. If
+    the queue is full, records are dropped and counted rather than blocking.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.dropped = 0
+        self.written = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AI_LOG_ENABLED', True)
+        app.config.setdefault('AI_LOG_BATCH_SIZE', 50)
+        app.config.setdefault('AI_LOG_FLUSH_INTERVAL', 2.0)
+        app.config.setdefault('AI_LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('AI_LOG_PAYLOADS', False)
+        app.extensions['ai_telemetry'] = self
+        self.app = app
+        self.enabled = bool(app.config['AI_LOG_ENABLED'])
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+    @contextlib.contextmanager
+    def track(self, kind: str, agent: str, model: Optional[str] = None, **fields) -> Iterator[Dict]:
+        """
+        Measure the enclosed call and log it.
+
+        Yields the record dict so the caller can fill in tokens or a response.
+        Exceptions are recorded in ``error`` and re-raised.
+        """
+        record = {"kind": kind, "agent": agent, "model": model, "cache_hit": False, **fields}
+        token = _current_record.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            if not isinstance(e, GeneratorExit):
+                record["error"] = f"{type(e).__name__}: {e}"[:1000]
+            raise
+        finally:
+            record["latency_ms"] = (time.perf_counter() - start) * 1000
+            _current_record.reset(token)
+            self.record(record)
+
+    def record(self, record: Dict):
+        if not self.enabled or self.app is None:
+            return
+        row = {
+            "submission_id": record.get("submission_id", _submission_id.get()),
+            "timestamp": datetime.utcnow(),
+            "kind": record.get("kind"),
+            "agent": record.get("agent"),
+            "model": record.get("model"),
+            "latency_ms": round(record.get("latency_ms") or 0.0, 3),
+            # Cache hits cost nothing, whatever the caller estimated up front
+            "prompt_tokens": 0 if record.get("cache_hit") else record.get("prompt_tokens"),
+            "completion_tokens": 0 if record.get("cache_hit") else record.get("completion_tokens"),
+            "cache_hit": bool(record.get("cache_hit")),
+            "error": record.get("error"),
+            "prompt": None,
+            "ai_response": None,
+        }
+        if self.app.config['AI_LOG_PAYLOADS']:
+            row["prompt"] = _truncate(record.get("prompt"))
+            row["ai_response"] = _truncate(record.get("response"))
+        try:
+            self._ensure_writer().put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    # ------------------------------------------------------------------
+    # Batched writer
+    # ------------------------------------------------------------------
+    def _ensure_writer(self) -> queue.Queue:
+        # The writer thread does not survive fork(); start one per process
+        if self._thread is None or self._pid != os.getpid():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.app.config['AI_LOG_QUEUE_SIZE'])
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._writer_loop, name="ai-log-writer", daemon=True)
+                    self._thread.start()
+        return self._queue
+
+    def _writer_loop(self):
+        batch_size = self.app.config['AI_LOG_BATCH_SIZE']
+        interval = self.app.config['AI_LOG_FLUSH_INTERVAL']
+        q = self._queue
+        while True:
+            rows = [q.get()]
+            deadline = time.monotonic() + interval
+            while len(rows) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(rows)
+            for _ in rows:
+                q.task_done()
+
+    def _write(self, rows: List[Dict]):
+        from app.models import AILog
+
+        with self.app.app_context():
+            try:
+                db.session.execute(AILog.__table__.insert(), rows)
+                db.session.commit()
+                self.written += len(rows)
+            except Exception as e:
+                db.session.rollback()
+                self.dropped += len(rows)
+                print(f"AI log write failed ({len(rows)} rows dropped): {e}")
+            finally:
+                db.session.remove()
+
+    def flush(self, timeout: float = 10.0):
+        """Wait until queued records are written (used by CLI commands and tests)."""
+        q = self._queue
+        if q is None or self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while q.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    # ------------------------------------------------------------------
+    # Aggregation
+    # ------------------------------------------------------------------
+    def summary(self, since: datetime, until: Optional[datetime] = None,
+                group_by: str = "agent") -> List[Dict]:
+        """
+        Latency percentiles and token totals per group over a time window.
+
+        Args:
+            since: Window start (UTC)
+            until: Window end (UTC, default now)
+            group_by: 'agent' (kind + agent + model) or 'model'
+
+        Returns:
+            One dict per group, slowest p95 first
+        """
+        from app.models import AILog
+
+        columns = [AILog.kind, AILog.agent, AILog.model] if group_by == "agent" else [AILog.model]
+        query = (db.session.query(*columns, AILog.latency_ms, AILog.prompt_tokens,
+                                  AILog.completion_tokens, AILog.cache_hit, AILog.error)
+                 .filter(AILog.timestamp >= since, AILog.latency_ms.isnot(None)))
+        if until is not None:
+            query = query.filter(AILog.timestamp < until)
+
+        groups: Dict[tuple, Dict[str, Any]] = {}
+        for row in query.yield_per(1000):
+            key = tuple(row[:len(columns)])
+            latency, prompt_tokens, completion_tokens, cache_hit, error = row[len(columns):]
+            g = groups.setdefault(key, {"latencies": [], "prompt_tokens": 0, "completion_tokens": 0,
+                                        "cache_hits": 0, "errors": 0})
+            g["latencies"].append(latency)
+            g["prompt_tokens"] += prompt_tokens or 0
+            g["completion_tokens"] += completion_tokens or 0
+            g["cache_hits"] += 1 if cache_hit else 0
+            g["errors"] += 1 if error else 0
+
+        names = [c.key for c in columns]
+        report = []
+        for key, g in groups.items():
+            latencies = sorted(g.pop("latencies"))
+            report.append({
+                **dict(zip(names, key)),
+                "calls": len(latencies),
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+                "p99_ms": round(percentile(latencies, 99), 1),
+                "total_seconds": round(sum(latencies) / 1000, 2),
+                **g,
+            })
+        report.sort(key=lambda r: r["p95_ms"], reverse=True)
+        return report
+
+
+def _truncate(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, default=str)
+    return value[:PAYLOAD_MAX_CHARS]
+
+
+ai_telemetry = AITelemetry()
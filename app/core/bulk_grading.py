@@ -0,0 +1,272 @@
+# bulk_grading.py
+# Resumable re-grading of every submission for a task on a bounded worker pool
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from app.extensions import db
+from app.core.grading_queue import grading_queue
+from app.core.keys import normalize_text, stable_submission_id
+from app.core.rate_limiter import BULK
+
+
+def grading_fingerprint(content: str, jlpt_level: str, task, app_config: Dict) -> str:
+    """
+    Hash of everything that determines a grade: the text, the level, the task's
+    rubric/reference answers and the grading configuration. A submission whose
+    fingerprint matches its last successful grade does not need re-grading.
+    """
+    questions = sorted(task.questions, key=lambda q: q.id)
+    parts = {
+        "content": normalize_text(content or ""),
+        "jlpt_level": jlpt_level,
+        "task": {
+            "description": task.description,
+            "questions": [[q.question_text, q.hint, q.sample_answer] for q in questions],
+        },
+        "config": {key: app_config.get(key) for key in ("OPENAI_MODEL", "ANALYSIS_MODE", "SCORING_MODE")},
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class BulkGrader:
+    """
+    Re-grade all submissions of a task.
+
+    Submissions are read in id order, one page at a time, and each page is
+    graded on a thread pool through the grading queue (so results land in the
+    usual GradingJob/Submission rows). After every page the run's checkpoint
+    (``last_submission_id``) and counters are committed, so an interrupted run
+    continues where it stopped. LLM calls run in the rate limiter's bulk lane,
+    behind interactive student grading.
+    """
+
+    def __init__(self, app=None, queue=grading_queue):
+        self.app = None
+        self.queue = queue
+        self._threads: Dict[int, threading.Thread] = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BULK_GRADING_WORKERS', 4)
+        app.config.setdefault('BULK_GRADING_PAGE_SIZE', 0)  # 0 = 4 submissions per worker
+        app.config.setdefault('DEFAULT_JLPT_LEVEL', 'N5')
+        app.extensions['bulk_grader'] = self
+        self.app = app
+
+    # ------------------------------------------------------------------
+    # Run bookkeeping
+    # ------------------------------------------------------------------
+    def latest_run(self, task_id: int):
+        from app.models import BulkGradingRun
+
+        return (BulkGradingRun.query.filter_by(task_id=task_id)
+                .order_by(BulkGradingRun.id.desc()).first())
+
+    def is_live(self, run) -> bool:
+        """True if the run is being processed somewhere (its heartbeat is recent)."""
+        lease = self.app.config.get('GRADING_JOB_LEASE_SECONDS', 600)
+        return (run is not None and run.status == 'running'
+                and run.updated_at > datetime.utcnow() - timedelta(seconds=lease))
+
+    def start_run(self, task_id: int, started_by: Optional[int] = None, force: bool = False,
+                  workers: Optional[int] = None, resume: bool = True):
+        """
+        Create a run for a task, or pick up its interrupted one.
+
+        Args:
+            task_id: Task whose submissions are re-graded
+            started_by: User id of the teacher starting the run
+            force: Re-grade even submissions whose fingerprint is unchanged
+            workers: Concurrent gradings (default BULK_GRADING_WORKERS)
+            resume: Continue an unfinished run from its checkpoint instead of starting over
+
+        Returns:
+            The BulkGradingRun to process
+        """
+        from app.models import BulkGradingRun
+
+        latest = self.latest_run(task_id)
+        if latest is not None and latest.status == 'running' and (resume or self.is_live(latest)):
+            if workers:
+                latest.workers = workers
+            latest.updated_at = datetime.utcnow()
+            db.session.commit()
+            return latest
+        if latest is not None and latest.status == 'running':
+            latest.status = 'cancelled'
+
+        run = BulkGradingRun(
+            task_id=task_id,
+            started_by=started_by,
+            force=force,
+            workers=workers or self.app.config['BULK_GRADING_WORKERS'],
+            total=self._submissions(task_id).count(),
+        )
+        db.session.add(run)
+        db.session.commit()
+        return run
+
+    def cancel(self, run):
+        if run.status == 'running':
+            run.status = 'cancelled'
+            run.finished_at = datetime.utcnow()
+            db.session.commit()
+
+    def _submissions(self, task_id: int):
+        from app.models import Submission
+
+        return Submission.query.filter(Submission.task_id == task_id, Submission.status != 'draft')
+
+    def _next_page(self, task_id: int, after_id: int, limit: int) -> List:
+        """Keyset pagination: the next `limit` submissions with id > after_id."""
+        from app.models import Submission
+
+        return (self._submissions(task_id)
+                .filter(Submission.id > after_id)
+                .order_by(Submission.id)
+                .limit(limit).all())
+
+    # ------------------------------------------------------------------
+    # Processing
+    # ------------------------------------------------------------------
+    def run(self, run_id: int, progress: Optional[Callable] = None):
+        """
+        Process a run to completion (or until cancelled). Must be called inside an app context.
+
+        Args:
+            run_id: BulkGradingRun id
+            progress: Optional callback receiving the run after each checkpoint
+        """
+        from app.models import BulkGradingRun
+
+        run = db.session.get(BulkGradingRun, run_id)
+        page_size = self.app.config['BULK_GRADING_PAGE_SIZE'] or run.workers * 4
+        executor = ThreadPoolExecutor(max_workers=run.workers, thread_name_prefix=f"bulk-grade-{run_id}")
+        try:
+            while True:
+                db.session.refresh(run)
+                if run.status != 'running':
+                    break
+                page = self._next_page(run.task_id, run.last_submission_id, page_size)
+                if not page:
+                    run.status = 'done'
+                    run.finished_at = datetime.utcnow()
+                    db.session.commit()
+                    break
+
+                todo, skipped = self._plan_page(run, page)
+                started = time.monotonic()
+                outcomes = list(executor.map(self._grade_one, todo))
+                graded = sum(outcomes)
+
+                run.grading_seconds += time.monotonic() - started
+                run.graded += graded
+                run.failed += len(outcomes) - graded
+                run.skipped += skipped
+                run.last_submission_id = page[-1].id
+                run.total = max(run.total, run.processed)
+                run.updated_at = datetime.utcnow()
+                db.session.commit()
+                if progress is not None:
+                    progress(run)
+        except Exception as e:
+            db.session.rollback()
+            run.status = 'failed'
+            run.error = str(e)
+            run.finished_at = datetime.utcnow()
+            db.session.commit()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+        return run
+
+    def _plan_page(self, run, page: List):
+        """Split a page into payloads to grade and a count of unchanged submissions."""
+        from app.models import GradingJob
+
+        # Latest successful grade per submission
+        last_payloads = {}
+        done_jobs = (GradingJob.query
+                     .filter(GradingJob.submission_id.in_([s.id for s in page]), GradingJob.status == 'done')
+                     .order_by(GradingJob.id))
+        for job in done_jobs:
+            last_payloads[job.submission_id] = json.loads(job.payload or "{}")
+
+        todo, skipped = [], 0
+        for submission in page:
+            previous = last_payloads.get(submission.id, {})
+            jlpt_level = previous.get("jlpt_level") or self.app.config['DEFAULT_JLPT_LEVEL']
+            fingerprint = grading_fingerprint(submission.content, jlpt_level, run.task, self.app.config)
+            if not run.force and previous.get("fingerprint") == fingerprint:
+                skipped += 1
+                continue
+            todo.append((submission.id, {
+                "content": submission.content or "",
+                "jlpt_level": jlpt_level,
+                "student_id": submission.student_id,
+                "assignment_id": f"task_{submission.task_id}",
+                "task_id": submission.task_id,
+                "vector_submission_id": stable_submission_id(submission.id),
+                "timestamp": (submission.updated_at or datetime.utcnow()).isoformat(),
+                "fingerprint": fingerprint,
+                "force": run.force,
+                "priority": BULK,
+                "bulk_run_id": run.id,
+            }))
+        return todo, skipped
+
+    def _grade_one(self, item) -> bool:
+        """Grade one submission through the queue on this thread. Returns True on success."""
+        from app.models import GradingJob
+
+        submission_id, payload = item
+        with self.app.app_context():
+            try:
+                # Enqueue out of the background workers' reach, then claim it here.
+                # One attempt: transient API errors are already retried by the rate
+                # limiter, and the next bulk run picks up anything that failed.
+                lease = self.app.config.get('GRADING_JOB_LEASE_SECONDS', 600)
+                job = self.queue.enqueue(submission_id, payload, max_attempts=1, delay=lease)
+                job = self.queue.claim(job.id, f"bulk-{uuid.uuid4().hex[:8]}")
+                if job is None:
+                    return False
+                job_id = job.id
+                self.queue.process(job)
+                return db.session.get(GradingJob, job_id).status == 'done'
+            except Exception as e:
+                print(f"Bulk grading of submission {submission_id} failed: {e}")
+                db.session.rollback()
+                return False
+            finally:
+                db.session.remove()
+
+    def run_in_background(self, run_id: int) -> threading.Thread:
+        """Process a run on a daemon thread of this process (used by the teacher UI)."""
+        thread = self._threads.get(run_id)
+        if thread is not None and thread.is_alive():
+            return thread
+
+        def target():
+            with self.app.app_context():
+                try:
+                    self.run(run_id)
+                except Exception as e:
+                    print(f"Bulk grading run {run_id} failed: {e}")
+                finally:
+                    db.session.remove()
+
+        thread = threading.Thread(target=target, name=f"bulk-grading-{run_id}", daemon=True)
+        thread.start()
+        self._threads[run_id] = thread
+        return thread
+
+
+bulk_grader = BulkGrader()
@@ -0,0 +1,139 @@
+# context_compression.py
+# Offline extractive compression of retrieved context (character n-gram TF-IDF, NumPy)
+
+import math
+import re
+from collections import Counter
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from app.config import config
+    CONTEXT_COMPRESSION_MAX_CHARS = config.CONTEXT_COMPRESSION_MAX_CHARS
+except ImportError:
+    CONTEXT_COMPRESSION_MAX_CHARS = 1200
+
+# Sentence ends: Japanese/full-width punctuation, ASCII ., ! and ? followed by space, or a line break
+_SENTENCE_END = re.compile(r'(?<=[。！？!?])|(?<=\.)\s+|\n+')
+_SPACE = re.compile(r'\s+')
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = (2, 3)) -> List[str]:
+    """Overlapping character n-grams (whitespace removed); works without a Japanese tokenizer."""
+    text = _SPACE.sub("", text.lower())
+    low, high = ngram_range
+    grams = []
+    for n in range(low, high + 1):
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    if not grams and text:
+        grams.append(text)
+    return grams
+
+
+class ContextCompressor:
+    """
+    Keep only the retrieved sentences that are most similar to the essay.
+
+    Sentences from all chunks are scored by cosine similarity of character
+    n-gram TF-IDF vectors against the essay. The best ones are kept up to a
+    character budget and returned in their original order, with chunk
+    boundaries preserved as blank lines.
+    """
+
+    def __init__(self,
+                 max_chars: int = CONTEXT_COMPRESSION_MAX_CHARS,
+                 ngram_range: Tuple[int, int] = (2, 3),
+                 min_sentence_chars: int = 4,
+                 separator: str = "\n\n"):
+        """
+        Args:
+            max_chars: Character budget for the compressed context
+            ngram_range: Character n-gram sizes used for TF-IDF
+            min_sentence_chars: Shorter fragments (headings, bullets) are dropped
+            separator: Chunk separator used by get_context_for_submission
+        """
+        self.max_chars = max_chars
+        self.ngram_range = ngram_range
+        self.min_sentence_chars = min_sentence_chars
+        self.separator = separator
+
+    def score_sentences(self, query: str, sentences: List[str]) -> np.ndarray:
+        """
+        Cosine similarity of each sentence to the query in TF-IDF space.
+
+        Vectors are kept sparse (n-gram -> weight): the dot product only
+        touches the query's n-grams, so nothing scales with sentences x vocabulary.
+        """
+        counts = [Counter(char_ngrams(sentence, self.ngram_range)) for sentence in sentences]
+        df = Counter()
+        for grams in counts:
+            df.update(grams.keys())
+        if not df:
+            return np.zeros(len(sentences), dtype=np.float32)
+        idf = {gram: math.log((1.0 + len(sentences)) / (1.0 + n)) + 1.0 for gram, n in df.items()}
+
+        # Sublinear tf keeps long sentences from winning on repetition alone
+        query_counts = Counter(gram for gram in char_ngrams(query, self.ngram_range) if gram in idf)
+        q = {gram: math.log1p(n) * idf[gram] for gram, n in query_counts.items()}
+        q_norm = math.sqrt(sum(w * w for w in q.values())) or 1.0
+
+        scores = np.zeros(len(sentences), dtype=np.float32)
+        for row, grams in enumerate(counts):
+            norm = math.sqrt(sum((math.log1p(n) * idf[gram]) ** 2 for gram, n in grams.items()))
+            if norm:
+                dot = sum(math.log1p(grams[gram]) * idf[gram] * w for gram, w in q.items() if gram in grams)
+                scores[row] = dot / (norm * q_norm)
+        return scores
+
+    def compress(self, query: str, context: str, max_chars: Optional[int] = None) -> str:
+        """
+        Args:
+            query: Text to rank against (the student's essay)
+            context: Retrieved chunks joined by `separator`
+            max_chars: Override the character budget
+
+        Returns:
+            The selected sentences, in original order
+        """
+        budget = self.max_chars if max_chars is None else max_chars
+        if not context or len(context) <= budget or not query:
+            return context
+
+        # (chunk index, sentence) in document order, without duplicates
+        items = []
+        seen = set()
+        for chunk_index, chunk in enumerate(context.split(self.separator)):
+            for sentence in split_sentences(chunk):
+                if len(sentence) >= self.min_sentence_chars and sentence not in seen:
+                    seen.add(sentence)
+                    items.append((chunk_index, sentence))
+        if not items:
+            return context[:budget]
+
+        scores = self.score_sentences(query, [sentence for _, sentence in items])
+        chosen = []
+        used = 0
+        for i in np.argsort(-scores, kind="stable"):
+            length = len(items[i][1]) + 1
+            if used + length > budget:
+                continue
+            chosen.append(int(i))
+            used += length
+        if not chosen:
+            # Every sentence is over budget on its own: cut the best one
+            return items[int(np.argmax(scores))][1][:budget]
+
+        parts = []
+        previous_chunk = None
+        for i in sorted(chosen):
+            chunk_index, sentence = items[i]
+            if previous_chunk is not None:
+                parts.append(self.separator if chunk_index != previous_chunk else "\n")
+            parts.append(sentence)
+            previous_chunk = chunk_index
+        return "".join(parts)
@@ -0,0 +1,167 @@
+# embedding_cache.py
+# Persistent, content-addressed cache in front of the embedding model
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.ai_telemetry import annotate
+from app.core.keys import normalize_text
+from app.core.tokens import estimate_tokens
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed embedding store keyed by (model, dimensions, text hash).
+
+    Vectors are stored as float32 blobs. When the number of entries exceeds
+    max_entries the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        """
+        Args:
+            path: SQLite file for the cache
+            max_entries: Maximum number of cached vectors before LRU eviction
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, dimensions: Optional[int], text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{model}:{dimensions or 'default'}:{digest}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up cached vectors; touches the hits so they stay recently used."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()],
+            )
+            self._count += self._conn.total_changes - before
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        excess = self._count - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "entries": self._count,
+            "max_entries": self.max_entries,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying model."""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache,
+                 model: Optional[str] = None, dimensions: Optional[int] = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or getattr(embeddings, "model", type(embeddings).__name__)
+        self.dimensions = dimensions if dimensions is not None else getattr(embeddings, "dimensions", None)
+
+    def _key(self, text: str) -> str:
+        return self.cache.make_key(self.model, self.dimensions, text)
+
+    def embed_documents(self, texts: List[str], chunk_size: Optional[int] = None, **kwargs) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        found = self.cache.get_many(keys)
+
+        # Embed each distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        # Only the texts actually sent to the model are billed
+        annotate(cache_hit=not missing, prompt_tokens=sum(estimate_tokens(t) for t in missing.values()))
+        if missing:
+            if chunk_size is not None:
+                kwargs["chunk_size"] = chunk_size
+            vectors = self.embeddings.embed_documents(list(missing.values()), **kwargs)
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        found = self.cache.get_many([key])
+        annotate(cache_hit=key in found)
+        if key in found:
+            return found[key]
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
+
+    def stats(self) -> Dict:
+        return self.cache.stats()
@@ -0,0 +1,392 @@
+# grading_queue.py
+# DB-backed grading job queue with an in-process worker pool
+
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import func
+
+from app.extensions import db
+from app.core.ai_telemetry import ai_log_context
+from app.core.rate_limiter import INTERACTIVE, llm_priority
+
+
+class GradingQueue:
+    """
+    Persistent grading job queue.
+
+    Jobs live in the ``grading_job`` table, so no external broker is needed and
+    queued work survives a restart. Each process runs a small pool of worker
+    threads that claim jobs with a conditional UPDATE, which keeps several
+    workers (or several gunicorn processes sharing one database) from picking
+    up the same job.
+
+    Workers start with the first request a process serves, so CLI commands
+    (`flask db upgrade`, `flask rag ...`) never claim jobs. `flask grading
+    worker` runs a dedicated worker process.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._handler: Optional[Callable] = None
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._last_recovery = float('-inf')
+        self._start_lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('GRADING_WORKERS', 2)
+        app.config.setdefault('GRADING_MAX_ATTEMPTS', 3)
+        app.config.setdefault('GRADING_BACKOFF_SECONDS', 5.0)
+        app.config.setdefault('GRADING_POLL_INTERVAL', 1.0)
+        app.config.setdefault('GRADING_JOB_LEASE_SECONDS', 600)
+        app.extensions['grading_queue'] = self
+        self.app = app
+
+        if app.config['GRADING_WORKERS'] > 0:
+            app.before_request(self._start_for_requests)
+
+    def _start_for_requests(self):
+        """Start this process's pool on its first request (servers only, never CLI commands)."""
+        if not self._threads:
+            self.start()
+
+    def job_handler(self, fn: Callable) -> Callable:
+        """
+        Register the function that grades one job.
+
+        The handler receives a claimed GradingJob inside an app context and returns
+        a JSON-serializable result; raising marks the attempt as failed.
+        """
+        self._handler = fn
+        return fn
+
+    def enqueue(self, submission_id: int, payload: Dict, max_attempts: Optional[int] = None,
+                delay: float = 0):
+        """
+        Queue a submission for grading and wake an idle worker.
+
+        Args:
+            submission_id: DB id of the Submission to grade
+            payload: Grading inputs (content, jlpt_level, assignment_id, ...)
+            max_attempts: Override GRADING_MAX_ATTEMPTS for this job
+            delay: Seconds before workers may pick the job up (gives a streaming
+                request the chance to claim it first)
+
+        Returns:
+            The new GradingJob
+        """
+        from app.models import GradingJob
+
+        job = GradingJob(
+            submission_id=submission_id,
+            status='queued',
+            payload=json.dumps(payload, ensure_ascii=False),
+            max_attempts=max_attempts or self.app.config['GRADING_MAX_ATTEMPTS'],
+            available_at=datetime.utcnow() + timedelta(seconds=delay),
+        )
+        db.session.add(job)
+        db.session.commit()
+        if not delay:
+            self._wakeup.set()
+        return job
+
+    # ------------------------------------------------------------------
+    # Worker pool
+    # ------------------------------------------------------------------
+    def start(self, workers: Optional[int] = None):
+        """
+        Start the worker pool (no-op if it is running).
+
+        Args:
+            workers: Threads to run (default GRADING_WORKERS)
+        """
+        with self._start_lock:
+            if any(t.is_alive() for t in self._threads):
+                return
+            self._stop.clear()
+            self._threads = [self._start_worker(i)
+                             for i in range(workers if workers is not None else self.app.config['GRADING_WORKERS'])]
+
+    def _start_worker(self, i: int) -> threading.Thread:
+        worker_id = f"{uuid.uuid4().hex[:8]}-{i}"
+        t = threading.Thread(target=self._worker_loop, args=(worker_id,),
+                             name=f"grading-worker-{i}", daemon=True)
+        t.start()
+        return t
+
+    def _after_fork(self):
+        """Threads do not survive fork(); give a forked worker its own pool."""
+        had_workers = bool(self._threads)
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        if had_workers and self.app is not None:
+            self.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _worker_loop(self, worker_id: str):
+        while not self._stop.is_set():
+            processed = False
+            with self.app.app_context():
+                try:
+                    processed = self.run_once(worker_id)
+                except Exception as e:
+                    print(f"Grading worker {worker_id} error: {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+            if not processed:
+                self._wakeup.wait(self.app.config['GRADING_POLL_INTERVAL'])
+                self._wakeup.clear()
+
+    def run_once(self, worker_id: str = "inline") -> bool:
+        """
+        Claim and process a single job. Must be called inside an app context.
+
+        Returns:
+            True if a job was processed, False if the queue was empty
+        """
+        self._recover_stale_jobs()
+        job = self._claim_next(worker_id)
+        if job is None:
+            return False
+        self.process(job)
+        return True
+
+    def claim(self, job_id: int, worker_id: str):
+        """
+        Claim a specific queued job (ignoring its backoff delay).
+
+        Returns:
+            The job now marked running, or None if another worker has it or it is finished
+        """
+        from app.models import GradingJob
+
+        claimed = (GradingJob.query
+                   .filter_by(id=job_id, status='queued')
+                   .update({
+                       GradingJob.status: 'running',
+                       GradingJob.worker_id: worker_id,
+                       GradingJob.started_at: datetime.utcnow(),
+                       GradingJob.heartbeat_at: datetime.utcnow(),
+                       GradingJob.attempts: GradingJob.attempts + 1,
+                   }, synchronize_session=False))
+        db.session.commit()
+        return db.session.get(GradingJob, job_id) if claimed == 1 else None
+
+    def release(self, job_id: int):
+        """Hand a claimed job back to the queue without counting the attempt."""
+        from app.models import GradingJob
+
+        db.session.rollback()
+        (GradingJob.query
+         .filter_by(id=job_id, status='running')
+         .update({GradingJob.status: 'queued',
+                  GradingJob.worker_id: None,
+                  GradingJob.attempts: GradingJob.attempts - 1,
+                  GradingJob.available_at: datetime.utcnow()},
+                 synchronize_session=False))
+        db.session.commit()
+        self._wakeup.set()
+
+    def _claim_next(self, worker_id: str):
+        from app.models import GradingJob
+
+        while True:
+            now = datetime.utcnow()
+            candidate = (GradingJob.query
+                         .filter(GradingJob.status == 'queued', GradingJob.available_at <= now)
+                         .order_by(GradingJob.available_at, GradingJob.id)
+                         .first())
+            if candidate is None:
+                db.session.rollback()
+                return None
+
+            claimed = (GradingJob.query
+                       .filter_by(id=candidate.id, status='queued')
+                       .update({
+                           GradingJob.status: 'running',
+                           GradingJob.worker_id: worker_id,
+                           GradingJob.started_at: now,
+                           GradingJob.heartbeat_at: now,
+                           GradingJob.attempts: GradingJob.attempts + 1,
+                       }, synchronize_session=False))
+            db.session.commit()
+            if claimed == 1:
+                return db.session.get(GradingJob, candidate.id)
+            # Another worker won the race; look for the next job.
+
+    def process(self, job):
+        """Run the handler for a claimed job and record the outcome."""
+        if self._handler is None:
+            raise RuntimeError("No grading job handler registered")
+
+        job_id, worker_id = job.id, job.worker_id
+        priority = json.loads(job.payload or "{}").get("priority", INTERACTIVE)
+        try:
+            with self.heartbeat(job), llm_priority(priority), ai_log_context(job.submission_id):
+                result = self._handler(job)
+        except Exception as e:
+            self.fail(job_id, e, worker_id)
+            return
+        self.complete(job, result, worker_id)
+
+    @contextmanager
+    def heartbeat(self, job):
+        """
+        Renew the job's lease while the enclosed block runs.
+
+        A background thread bumps heartbeat_at every quarter lease, so a slow
+        but healthy job (rate-limiter waits, long chats) is never mistaken for
+        one whose worker died.
+        """
+        job_id, worker_id = job.id, job.worker_id
+        interval = max(1.0, self.app.config['GRADING_JOB_LEASE_SECONDS'] / 4)
+        stop = threading.Event()
+
+        def beat():
+            from app.models import GradingJob
+
+            while not stop.wait(interval):
+                with self.app.app_context():
+                    try:
+                        (GradingJob.query
+                         .filter_by(id=job_id, status='running', worker_id=worker_id)
+                         .update({GradingJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False))
+                        db.session.commit()
+                    except Exception as e:
+                        print(f"Grading job {job_id} heartbeat failed: {e}")
+                        db.session.rollback()
+                    finally:
+                        db.session.remove()
+
+        thread = threading.Thread(target=beat, name=f"grading-heartbeat-{job_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+
+    def complete(self, job, result: Dict, worker_id: str) -> bool:
+        """
+        Mark a claimed job done and commit the handler's pending changes with it.
+
+        Only the worker that still owns the job may finish it: if its lease
+        expired and the job was requeued (or claimed by someone else), the
+        late result and the handler's changes are rolled back.
+
+        Returns:
+            True if the result was recorded
+        """
+        from app.models import GradingJob
+
+        job_id = job.id
+        updated = (GradingJob.query
+                   .filter_by(id=job_id, status='running', worker_id=worker_id)
+                   .update({GradingJob.status: 'done',
+                            GradingJob.result: json.dumps(result, ensure_ascii=False, default=str),
+                            GradingJob.error: None,
+                            GradingJob.finished_at: datetime.utcnow()},
+                           synchronize_session=False))
+        if updated != 1:
+            db.session.rollback()
+            print(f"Grading job {job_id} is no longer owned by {worker_id}; dropping its late result")
+            return False
+        db.session.commit()
+        return True
+
+    def fail(self, job_id: int, error: Exception, worker_id: str) -> bool:
+        """
+        Record a failed attempt: requeue with backoff, or fail for good after
+        max_attempts. Ignored if worker_id no longer owns the job.
+
+        Returns:
+            True if the failure was recorded
+        """
+        from app.models import GradingJob
+
+        db.session.rollback()
+        job = db.session.get(GradingJob, job_id)
+        if job is None:
+            return False
+        now = datetime.utcnow()
+        values = {GradingJob.error: str(error), GradingJob.worker_id: None}
+        if job.attempts >= job.max_attempts:
+            values.update({GradingJob.status: 'failed', GradingJob.finished_at: now})
+            message = f"Grading job {job_id} failed after {job.attempts} attempts: {error}"
+        else:
+            delay = self._backoff(job.attempts)
+            values.update({GradingJob.status: 'queued', GradingJob.available_at: now + timedelta(seconds=delay)})
+            message = f"Grading job {job_id} attempt {job.attempts} failed, retrying in {delay:.1f}s: {error}"
+        updated = (GradingJob.query
+                   .filter_by(id=job_id, status='running', worker_id=worker_id)
+                   .update(values, synchronize_session=False))
+        db.session.commit()
+        if updated != 1:
+            print(f"Grading job {job_id} is no longer owned by {worker_id}; dropping its late error: {error}")
+            return False
+        print(message)
+        return True
+
+    def _backoff(self, attempts: int) -> float:
+        """Exponential backoff with full jitter on top of the base delay."""
+        base = float(self.app.config['GRADING_BACKOFF_SECONDS'])
+        return base * (2 ** max(attempts - 1, 0)) + random.uniform(0, base)
+
+    def _recover_stale_jobs(self):
+        """
+        Handle jobs whose worker died mid-run (no heartbeat for a whole lease):
+        requeue them, or fail them for good once max_attempts is used up, so a
+        job that keeps killing its worker is not retried forever.
+        """
+        from app.models import GradingJob
+
+        lease = self.app.config['GRADING_JOB_LEASE_SECONDS']
+        if time.monotonic() - self._last_recovery < min(lease, 60):
+            return
+        self._last_recovery = time.monotonic()
+
+        now = datetime.utcnow()
+        stale = (GradingJob.status == 'running',
+                 func.coalesce(GradingJob.heartbeat_at, GradingJob.started_at) < now - timedelta(seconds=lease))
+        failed = (GradingJob.query
+                  .filter(*stale, GradingJob.attempts >= GradingJob.max_attempts)
+                  .update({GradingJob.status: 'failed',
+                           GradingJob.worker_id: None,
+                           GradingJob.error: 'Worker stopped responding (lease expired) on the last attempt',
+                           GradingJob.finished_at: now},
+                          synchronize_session=False))
+        requeued = (GradingJob.query
+                    .filter(*stale)
+                    .update({GradingJob.status: 'queued',
+                             GradingJob.worker_id: None,
+                             GradingJob.available_at: now},
+                            synchronize_session=False))
+        db.session.commit()
+        if failed:
+            print(f"Failed {failed} stale grading job(s) with no attempts left")
+        if requeued:
+            print(f"Requeued {requeued} stale grading job(s)")
+
+
+grading_queue = GradingQueue()
@@ -0,0 +1,29 @@
+# keys.py
+# Stable IDs and key normalization shared by the web layer and the RAG stack
+
+import hashlib
+import re
+import unicodedata
+
+
+def stable_submission_id(db_submission_id) -> str:
+    """Vectorstore submission_id for a DB Submission row (stable across resubmits)."""
+    return f"submission_{db_submission_id}"
+
+
+def partition_slug(value) -> str:
+    """
+    Collection-name-safe form of a metadata value. Values that had to be
+    changed get a short hash so different values never share a partition.
+    """
+    raw = "none" if value is None or value == "" else str(value)
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", raw).strip("-_") or "x"
+    if slug != raw:
+        slug = f"{slug[:60]}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8]}"
+    return slug
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text before hashing so trivially different copies share a key."""
+    text = unicodedata.normalize("NFC", text.replace("\r\n", "\n"))
+    return text.strip()
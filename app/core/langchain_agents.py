@@ -1,22 +1,175 @@
+import contextvars
 import json
-from typing import Dict
-from langchain_openai import ChatOpenAI
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, Optional, Tuple
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_core.runnables import RunnableSequence
 
+from app.core.scoring import ScoringEngine
+from app.core.llm_cache import ResponseCache, CachedChain, refresh_responses
+from app.core.openai_clients import chat_model
+from app.core.tracked_chain import TrackedChain
+from app.core.token_budget import PromptBudget
+
 try:
     from app.config import config
     OPENAI_MODEL = config.OPENAI_MODEL
+    AGENT_PARALLEL = config.AGENT_PARALLEL
+    AGENT_MAX_CONCURRENCY = config.AGENT_MAX_CONCURRENCY
+    AGENT_TIMEOUT = config.AGENT_TIMEOUT
+    SCORING_MODE = config.SCORING_MODE
+    ANALYSIS_MODE = config.ANALYSIS_MODE
+    LLM_CACHE_ENABLED = config.LLM_CACHE_ENABLED
+    LLM_CACHE_SIZE = config.LLM_CACHE_SIZE
+    LLM_CACHE_TTL = config.LLM_CACHE_TTL
+    LLM_CACHE_PATH = config.LLM_CACHE_PATH
 except ImportError:
     OPENAI_MODEL = "gpt-4o-mini"
+    AGENT_PARALLEL = True
+    AGENT_MAX_CONCURRENCY = 5
+    AGENT_TIMEOUT = 60.0
+    SCORING_MODE = 'local'
+    ANALYSIS_MODE = 'agents'
+    LLM_CACHE_ENABLED = True
+    LLM_CACHE_SIZE = 1024
+    LLM_CACHE_TTL = 86400
+    LLM_CACHE_PATH = None
+
+# Order in which the independent analysis agents are reported
+ANALYSIS_AGENTS = ('content', 'grammar', 'vocabulary', 'structure', 'fluency')
+
+
+def _strict_object(properties: Dict) -> Dict:
+    return {"type": "object", "properties": properties,
+            "required": list(properties), "additionalProperties": False}
+
+
+_STRINGS = {"type": "array", "items": {"type": "string"}}
+
+# Per-agent output schemas, mirroring the keys each agent prompt asks for
+ANALYSIS_SCHEMAS = {
+    'content': _strict_object({
+        "content_score": {"type": "number"},
+        "strengths": _STRINGS,
+        "weaknesses": _STRINGS,
+        "missing_concepts": _STRINGS,
+        "suggestions": _STRINGS,
+    }),
+    'grammar': _strict_object({
+        "grammar_score": {"type": "number"},
+        "errors": {"type": "array", "items": _strict_object({
+            "line": {"type": "string"},
+            "type": {"type": "string"},
+            "issue": {"type": "string"},
+            "suggestion": {"type": "string"},
+        })},
+        "overall_comment": {"type": "string"},
+    }),
+    'vocabulary': _strict_object({
+        "vocab_score": {"type": "number"},
+        "vocab_comments": {"type": "string"},
+        "suggestions": _STRINGS,
+        "advanced_words_used": _STRINGS,
+        "simple_words": _STRINGS,
+    }),
+    'structure': _strict_object({
+        "structure_score": {"type": "number"},
+        "has_intro": {"type": "boolean"},
+        "has_body": {"type": "boolean"},
+        "has_conclusion": {"type": "boolean"},
+        "suggestions": _STRINGS,
+        "paragraph_feedback": {"type": "string"},
+    }),
+    'fluency': _strict_object({
+        "fluency_score": {"type": "number"},
+        "awkward_sentences": _STRINGS,
+        "rewrites": _STRINGS,
+        "overall_comment": {"type": "string"},
+    }),
+}
+
+
+def combined_response_format(include_content: bool = True) -> Dict:
+    """OpenAI json_schema response format for the single-call combined analysis."""
+    agents = [name for name in ANALYSIS_AGENTS if include_content or name != 'content']
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "combined_analysis",
+            "strict": True,
+            "schema": _strict_object({name: ANALYSIS_SCHEMAS[name] for name in agents}),
+        },
+    }
+
+
+def parse_json_response(raw: str) -> Dict:
+    """Parse an agent's JSON reply, unwrapping a ``` code fence if the model added one."""
+    if '```json' in raw:
+        raw = raw.split('```json')[1].split('```')[0]
+    elif '```' in raw:
+        raw = raw.split('```')[1].split('```')[0]
+    return json.loads(raw.strip())
+
+
+def is_json_response(raw: str) -> bool:
+    try:
+        parse_json_response(raw)
+        return True
+    except Exception:
+        return False
 
 
 class FeedbackAgents:
     """Multi-agent system for comprehensive writing feedback."""
 
-    def __init__(self, model: str = None, temperature: float = 0.2):
+    def __init__(self,
+                 model: str = None,
+                 temperature: float = 0.2,
+                 parallel: bool = AGENT_PARALLEL,
+                 max_concurrency: int = AGENT_MAX_CONCURRENCY,
+                 agent_timeout: Optional[float] = AGENT_TIMEOUT,
+                 scoring: str = SCORING_MODE,
+                 scoring_engine: Optional[ScoringEngine] = None,
+                 analysis_mode: str = ANALYSIS_MODE,
+                 response_cache: Optional[ResponseCache] = None,
+                 budget: Optional[PromptBudget] = None):
+        """
+        Args:
+            model: OpenAI chat model name
+            temperature: Sampling temperature for every agent
+            parallel: Run the analysis agents concurrently by default
+            max_concurrency: Maximum number of analysis agents in flight at once
+            agent_timeout: Seconds an analysis agent may run before its result is dropped
+                (parallel runs only; serial runs have no agent timeout). Also used as the
+                LLM request timeout, so a dropped agent's HTTP request is cut off too.
+            scoring: 'local' computes the weighted score in-process, 'llm' asks the ScoringAgent
+            scoring_engine: Weights/grade bands for local scoring (defaults to the standard rubric)
+            analysis_mode: 'agents' runs one chain per analysis agent, 'combined' asks for all
+                five analyses in a single structured-output call
+            response_cache: Cache for chain responses (defaults to the LLM_CACHE_* settings;
+                disabled when LLM_CACHE_ENABLED is off and none is given)
+            budget: Token budgets for context/analysis inside prompts (PROMPT_*_TOKENS defaults)
+        """
+        if scoring not in ('local', 'llm'):
+            raise ValueError(f"Unknown scoring mode: {scoring}")
+        if analysis_mode not in ('agents', 'combined'):
+            raise ValueError(f"Unknown analysis mode: {analysis_mode}")
         self.model = model or OPENAI_MODEL
-        self.llm = ChatOpenAI(model=self.model, temperature=temperature)
+        self.temperature = temperature
+        self.parallel = parallel
+        self.max_concurrency = max(1, max_concurrency)
+        self.agent_timeout = agent_timeout
+        self.scoring = scoring
+        self.scoring_engine = scoring_engine or ScoringEngine()
+        self.analysis_mode = analysis_mode
+        if response_cache is None and LLM_CACHE_ENABLED:
+            response_cache = ResponseCache(max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, path=LLM_CACHE_PATH)
+        self.response_cache = response_cache
+        self.budget = budget or PromptBudget()
+        # A timed-out agent's thread cannot be stopped, but its request can be
+        llm_kwargs = {"timeout": agent_timeout} if agent_timeout else {}
+        self.llm = chat_model(self.model, temperature=temperature, **llm_kwargs)
         self._setup_prompts()
         self._setup_chains()
 
@@ -69,6 +222,17 @@ class FeedbackAgents:
             )
         )
 
+        self.combined_prompt = PromptTemplate(
+            input_variables=['text', 'context_section', 'jlpt_level', 'sections'],
+            template=(
+                "You are a Japanese writing assessment team. Analyze the student's writing (JLPT level {jlpt_level}) "
+                "and return one JSON object with these sections:\n"
+                "{sections}\n"
+                "Scores are 0-10. Grammar errors list line, type, issue and suggestion.\n\n"
+                "{context_section}Student Writing:\n{text}"
+            )
+        )
+
         self.scoring_prompt = PromptTemplate(
             input_variables=['analysis_json'],
             template=(
@@ -78,6 +242,11 @@ class FeedbackAgents:
             )
         )
 
+        self.quick_prompt = PromptTemplate(
+            input_variables=['text', 'level'],
+            template="Provide quick feedback (3-4 sentences) for {level} level writing.\nText:\n{text}"
+        )
+
         self.feedback_prompt = PromptTemplate(
             input_variables=['text', 'analysis_json', 'overall_score', 'context'],
             template=(
@@ -89,82 +258,262 @@ class FeedbackAgents:
 
     def _setup_chains(self):
         """Create modern runnable pipelines (LangChain v1.x style)."""
-        def make_chain(prompt: PromptTemplate):
-            return RunnableSequence(prompt | self.llm)
+        def make_chain(name: str, prompt: PromptTemplate, llm=None, extra=None, validate=is_json_response):
+            llm = llm or self.llm
+            if self.response_cache is None:
+                chain = RunnableSequence(prompt | llm)
+            else:
+                # JSON agents only cache responses that parse; a broken one is retried, not replayed
+                chain = CachedChain(name, prompt, llm, self.response_cache,
+                                    model=self.model, temperature=self.temperature, extra=extra,
+                                    validate=validate)
+            return TrackedChain(name, chain, model=self.model)
+
+        self.content_chain = make_chain('content', self.content_prompt)
+        self.grammar_chain = make_chain('grammar', self.grammar_prompt)
+        self.vocab_chain = make_chain('vocabulary', self.vocab_prompt)
+        self.structure_chain = make_chain('structure', self.structure_prompt)
+        self.fluency_chain = make_chain('fluency', self.fluency_prompt)
+        self.scoring_chain = make_chain('scoring', self.scoring_prompt)
+        self.feedback_chain = make_chain('feedback', self.feedback_prompt)
+        self.quick_chain = make_chain('quick_feedback', self.quick_prompt, validate=None)  # plain text
+
+        # Single-call structured analysis (with/without the content section)
+        with_content, without_content = combined_response_format(True), combined_response_format(False)
+        self.combined_chain = make_chain('combined', self.combined_prompt,
+                                         self.llm.bind(response_format=with_content), extra=with_content)
+        self.combined_chain_no_context = make_chain('combined', self.combined_prompt,
+                                                    self.llm.bind(response_format=without_content),
+                                                    extra=without_content)
 
-        self.content_chain = make_chain(self.content_prompt)
-        self.grammar_chain = make_chain(self.grammar_prompt)
-        self.vocab_chain = make_chain(self.vocab_prompt)
-        self.structure_chain = make_chain(self.structure_prompt)
-        self.fluency_chain = make_chain(self.fluency_prompt)
-        self.scoring_chain = make_chain(self.scoring_prompt)
-        self.feedback_chain = make_chain(self.feedback_prompt)
+    def cache_stats(self) -> Dict:
+        """Response cache hit ratios and saved latency (empty when caching is off)."""
+        return self.response_cache.stats() if self.response_cache is not None else {}
 
     def _safe_parse(self, raw: str) -> Dict:
         try:
-            if '```json' in raw:
-                raw = raw.split('```json')[1].split('```')[0]
-            elif '```' in raw:
-                raw = raw.split('```')[1].split('```')[0]
-            return json.loads(raw.strip())
+            return parse_json_response(raw)
         except Exception as e:
             print(f"JSON parse error: {e}")
             return {"raw": raw, "parse_error": str(e)}
 
-    def run_multi_agents(self, text: str, context: str = "", jlpt_level: str = 'N5') -> Dict:
-        results = {}
-
-        # 1. Content
+    def _analysis_tasks(self, text: str, context: str, jlpt_level: str) -> Dict[str, Tuple]:
+        """Map each analysis agent name to its (chain, inputs) pair."""
+        tasks = {}
         if context:
-            print("Running ContentAnalysisAgent...")
-            results['content'] = self._safe_parse(self.content_chain.invoke({"text": text, "context": context}).content)
+            tasks['content'] = (self.content_chain,
+                                {"text": text, "context": self.budget.context(context, 'content')})
+        tasks['grammar'] = (self.grammar_chain, {"text": text})
+        tasks['vocabulary'] = (self.vocab_chain, {"text": text, "jlpt_level": jlpt_level})
+        tasks['structure'] = (self.structure_chain, {"text": text})
+        tasks['fluency'] = (self.fluency_chain, {"text": text})
+        return tasks
+
+    def _run_agent(self, name: str, chain, inputs: Dict) -> Dict:
+        print(f"Running {name} agent...")
+        return self._safe_parse(chain.invoke(inputs).content)
+
+    def _iter_serial(self, tasks: Dict[str, Tuple]) -> Iterator[Tuple[str, Dict]]:
+        for name, (chain, inputs) in tasks.items():
+            try:
+                yield name, self._run_agent(name, chain, inputs)
+            except Exception as e:
+                print(f"{name} agent failed: {e}")
+                yield name, {"error": str(e)}
+
+    def _iter_parallel(self, tasks: Dict[str, Tuple]) -> Iterator[Tuple[str, Dict]]:
+        """
+        Run agents on a thread pool and yield results in completion order.
+
+        An agent still running after agent_timeout is reported as timed out; its
+        LLM request is cut off by the same timeout. _iter_serial has no timeout.
+        """
+        started = {}
+
+        def call(name, chain, inputs):
+            started[name] = time.monotonic()
+            return self._run_agent(name, chain, inputs)
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(tasks)) or 1,
+                                      thread_name_prefix="feedback-agent")
+        # Each agent runs in a copy of the caller's context (rate-limit lane, AI log submission)
+        pending = {executor.submit(contextvars.copy_context().run, call, name, chain, inputs): name
+                   for name, (chain, inputs) in tasks.items()}
+        try:
+            while pending:
+                done, _ = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        yield name, future.result()
+                    except Exception as e:
+                        print(f"{name} agent failed: {e}")
+                        yield name, {"error": str(e)}
+
+                if self.agent_timeout is None:
+                    continue
+                now = time.monotonic()
+                for future, name in list(pending.items()):
+                    if name in started and now - started[name] > self.agent_timeout:
+                        # The worker thread cannot be interrupted; drop its result instead.
+                        pending.pop(future)
+                        print(f"{name} agent timed out after {self.agent_timeout}s")
+                        yield name, {"error": f"timed out after {self.agent_timeout}s"}
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_combined(self, text: str, context: str, jlpt_level: str) -> Dict:
+        """All analyses in one structured-output call; returns {agent_name: result}."""
+        agents = [name for name in ANALYSIS_AGENTS if context or name != 'content']
+        sections = "\n".join(
+            f"- {name}: {', '.join(ANALYSIS_SCHEMAS[name]['properties'])}" for name in agents
+        )
+        chain = self.combined_chain if context else self.combined_chain_no_context
+        print("Running combined analysis...")
+        parsed = self._safe_parse(chain.invoke({
+            "text": text,
+            "context_section": (f"Reference Context:\n{self.budget.context(context, 'combined')}\n\n"
+                                if context else ""),
+            "jlpt_level": jlpt_level,
+            "sections": sections,
+        }).content)
+
+        missing = [name for name in agents if not isinstance(parsed.get(name), dict)]
+        if missing:
+            raise ValueError(f"combined analysis missing sections: {missing}")
+        return {name: parsed[name] for name in agents}
+
+    def iter_analysis(self,
+                      text: str,
+                      context: str = "",
+                      jlpt_level: str = 'N5',
+                      parallel: Optional[bool] = None,
+                      mode: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Run the five independent analysis agents.
+
+        Yields (agent_name, parsed_result) pairs as each agent finishes. A failed or
+        timed-out agent yields {"error": ...} so callers still get partial results.
+        In 'combined' mode all results arrive together from one call; if that call
+        fails or returns an incomplete object the per-agent chains are used instead.
+        """
+        if not context:
+            yield 'content', {'content_score': 8, 'note': 'No reference context provided'}
+
+        if (mode or self.analysis_mode) == 'combined':
+            try:
+                combined = self._run_combined(text, context, jlpt_level)
+            except Exception as e:
+                print(f"Combined analysis failed, falling back to per-agent chains: {e}")
+            else:
+                yield from combined.items()
+                return
+
+        tasks = self._analysis_tasks(text, context, jlpt_level)
+        use_parallel = self.parallel if parallel is None else parallel
+        if use_parallel and len(tasks) > 1:
+            yield from self._iter_parallel(tasks)
         else:
-            results['content'] = {'content_score': 8, 'note': 'No reference context provided'}
+            yield from self._iter_serial(tasks)
 
-        # 2. Grammar
-        print("Running GrammarAgent...")
-        results['grammar'] = self._safe_parse(self.grammar_chain.invoke({"text": text}).content)
+    def run_analysis(self,
+                     text: str,
+                     context: str = "",
+                     jlpt_level: str = 'N5',
+                     parallel: Optional[bool] = None,
+                     mode: Optional[str] = None) -> Dict:
+        """Collect the analysis agent results in their canonical order."""
+        collected = dict(self.iter_analysis(text, context, jlpt_level, parallel=parallel, mode=mode))
+        return {name: collected[name] for name in ANALYSIS_AGENTS if name in collected}
 
-        # 3. Vocabulary
-        print("Running VocabularyAgent...")
-        results['vocabulary'] = self._safe_parse(self.vocab_chain.invoke({"text": text, "jlpt_level": jlpt_level}).content)
+    def run_multi_agents(self,
+                         text: str,
+                         context: str = "",
+                         jlpt_level: str = 'N5',
+                         parallel: Optional[bool] = None,
+                         scoring: Optional[str] = None,
+                         mode: Optional[str] = None,
+                         refresh: bool = False) -> Dict:
+        """With refresh=True every agent calls the model instead of reusing a cached response."""
+        with refresh_responses(refresh):
+            # 1-5. Content, Grammar, Vocabulary, Structure, Fluency
+            results = self.run_analysis(text, context, jlpt_level, parallel=parallel, mode=mode)
 
-        # 4. Structure
-        print("Running StructureAgent...")
-        results['structure'] = self._safe_parse(self.structure_chain.invoke({"text": text}).content)
+            # 6. Scoring
+            scoring_result = self.score(results, scoring=scoring)
+            results['scoring'] = scoring_result
+            results['overall_score'] = scoring_result.get("overall_score", 0)
 
-        # 5. Fluency
-        print("Running FluencyAgent...")
-        results['fluency'] = self._safe_parse(self.fluency_chain.invoke({"text": text}).content)
+            # 7. Feedback
+            print("Running FeedbackAgent...")
+            feedback_output = self.feedback_chain.invoke(
+                self._feedback_inputs(text, results, context)).content
+            results['feedback'] = self._safe_parse(feedback_output)
 
-        # 6. Scoring
-        print("Running ScoringAgent...")
-        analysis_json = json.dumps(results, ensure_ascii=False, indent=2)
-        scoring_output = self.scoring_chain.invoke({"analysis_json": analysis_json}).content
-        scoring_result = self._safe_parse(scoring_output)
-        results['scoring'] = scoring_result
-        results['overall_score'] = scoring_result.get("overall_score", 0)
+        return results
 
-        # 7. Feedback
-        print("Running FeedbackAgent...")
-        feedback_output = self.feedback_chain.invoke({
+    def _feedback_inputs(self, text: str, results: Dict, context: str) -> Dict:
+        analysis = {name: results[name] for name in ANALYSIS_AGENTS if name in results}
+        return {
             "text": text,
-            "analysis_json": analysis_json,
+            "analysis_json": self.budget.analysis(analysis, 'feedback'),
             "overall_score": results["overall_score"],
-            "context": context or "No reference context available"
-        }).content
-        results['feedback'] = self._safe_parse(feedback_output)
+            "context": self.budget.context(context, 'feedback') or "No reference context available"
+        }
 
-        return results
+    def stream_multi_agents(self,
+                            text: str,
+                            context: str = "",
+                            jlpt_level: str = 'N5',
+                            parallel: Optional[bool] = None,
+                            scoring: Optional[str] = None,
+                            mode: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Same pipeline as run_multi_agents, reported progressively.
+
+        Yields events as they happen:
+            {"event": "agent", "agent": name, "result": parsed}   one per analysis agent
+            {"event": "scoring", "result": scoring}
+            {"event": "token", "text": chunk}                     FeedbackAgent output as it streams
+            {"event": "feedback", "result": parsed}
+            {"event": "done", "results": <run_multi_agents result>}
+        """
+        collected = {}
+        for name, result in self.iter_analysis(text, context, jlpt_level, parallel=parallel, mode=mode):
+            collected[name] = result
+            yield {"event": "agent", "agent": name, "result": result}
+        results = {name: collected[name] for name in ANALYSIS_AGENTS if name in collected}
+
+        scoring_result = self.score(results, scoring=scoring)
+        results['scoring'] = scoring_result
+        results['overall_score'] = scoring_result.get("overall_score", 0)
+        yield {"event": "scoring", "result": scoring_result}
+
+        print("Streaming FeedbackAgent...")
+        parts = []
+        for chunk in self.feedback_chain.stream(self._feedback_inputs(text, results, context)):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield {"event": "token", "text": chunk.content}
+        results['feedback'] = self._safe_parse("".join(parts))
+        yield {"event": "feedback", "result": results['feedback']}
+
+        yield {"event": "done", "results": results}
+
+    def score(self, results: Dict, analysis_json: Optional[str] = None, scoring: Optional[str] = None) -> Dict:
+        """Score the analysis results locally or with the LLM ScoringAgent."""
+        if (scoring or self.scoring) == 'local':
+            return self.scoring_engine.score(results)
+
+        print("Running ScoringAgent...")
+        if analysis_json is None:
+            analysis_json = self.budget.analysis(results, 'scoring')
+        scoring_output = self.scoring_chain.invoke({"analysis_json": analysis_json}).content
+        return self._safe_parse(scoring_output)
 
     def generate_quick_feedback(self, text: str, jlpt_level: str = 'N5') -> str:
         """Short encouraging feedback."""
-        quick_prompt = PromptTemplate(
-            input_variables=['text', 'level'],
-            template="Provide quick feedback (3-4 sentences) for {level} level writing.\nText:\n{text}"
-        )
-        chain = RunnableSequence(quick_prompt | self.llm)
-        return chain.invoke({"text": text, "level": jlpt_level}).content
+        return self.quick_chain.invoke({"text": text, "level": jlpt_level}).content
 
 
 # Convenience wrappers
@@ -172,10 +521,14 @@ _default_agents = None
 
 def get_feedback_agents(model: str = None) -> FeedbackAgents:
     global _default_agents
+    if model is None:
+        from app.core.services import ai_services
+        if ai_services.app is not None:
+            return ai_services.agents
     if _default_agents is None:
         _default_agents = FeedbackAgents(model=model)
     return _default_agents
 
-def run_multi_agents(text: str, context: str = "", jlpt_level: str = 'N5') -> Dict:
+def run_multi_agents(text: str, context: str = "", jlpt_level: str = 'N5', parallel: Optional[bool] = None) -> Dict:
     agents = get_feedback_agents()
-    return agents.run_multi_agents(text, context, jlpt_level)
+    return agents.run_multi_agents(text, context, jlpt_level, parallel=parallel)
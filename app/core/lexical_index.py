@@ -0,0 +1,235 @@
+# lexical_index.py
+# Local BM25 inverted index over character n-grams of every indexed chunk
+
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.context_compression import char_ngrams
+
+# Metadata keys stored in their own (indexed) columns, as in SubmissionIndex
+INDEXED_FIELDS = ("submission_id", "student_id", "assignment_id", "type", "timestamp")
+_PUNCTUATION_ONLY = re.compile(r"^[\W_]+$")
+
+
+def lexical_terms(text: str, ngram_range: Tuple[int, int] = (2, 3)) -> List[str]:
+    """
+    Character bi/tri-grams of NFKC-normalised text (full-width/half-width
+    and case variants collapse), without grams made only of punctuation.
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    return [gram for gram in char_ngrams(text, ngram_range) if not _PUNCTUATION_ONLY.match(gram)]
+
+
+class LexicalIndex:
+    """
+    BM25 over character n-grams, stored in SQLite next to the vectorstore.
+
+    Exact kanji/vocabulary matches score without an embeddings request.
+    Postings are keyed by (term, chunk_id), so adding, re-adding and
+    deleting chunks are incremental. Document frequencies, the chunk count
+    and the average length are read at query time, so every process
+    sharing the file scores against the same statistics.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, max_query_terms: int = 64):
+        """
+        Args:
+            path: SQLite file
+            k1: BM25 term-frequency saturation
+            b: BM25 length normalisation
+            max_query_terms: Only the rarest query n-grams are scored (long queries
+                such as whole essays would otherwise scan huge posting lists)
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_query_terms = max_query_terms
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " chunk_id TEXT PRIMARY KEY,"
+            " submission_id, student_id, assignment_id, type, timestamp,"
+            " length INTEGER NOT NULL,"
+            " document TEXT,"
+            " metadata TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,"
+            " PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_assignment ON chunks(assignment_id, type)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_submission ON chunks(submission_id)")
+        self._conn.execute("INSERT OR IGNORE INTO stats (key, value) VALUES ('chunks', 0), ('length', 0)")
+        self._conn.commit()
+
+    # ----- writes -----
+
+    def _remove(self, chunk_ids: Sequence[str]):
+        """Drop chunks and their postings. Caller holds the lock and commits."""
+        for i in range(0, len(chunk_ids), 500):
+            batch = list(chunk_ids[i:i + 500])
+            marks = ",".join("?" * len(batch))
+            count, length = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE chunk_id IN ({marks})", batch
+            ).fetchone()
+            if not count:
+                continue
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", batch)
+            self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", batch)
+            self._conn.execute("UPDATE stats SET value = value - ? WHERE key = 'chunks'", (count,))
+            self._conn.execute("UPDATE stats SET value = value - ? WHERE key = 'length'", (length,))
+
+    def add(self, chunk_ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Optional[Dict]]):
+        """Index chunks, replacing any already stored under the same ids."""
+        if not chunk_ids:
+            return
+        rows, postings, total = [], [], 0
+        for chunk_id, document, metadata in zip(chunk_ids, documents, metadatas):
+            metadata = metadata or {}
+            terms = Counter(lexical_terms(document))
+            length = sum(terms.values())
+            total += length
+            rows.append((chunk_id, *[metadata.get(field) for field in INDEXED_FIELDS], length, document,
+                         json.dumps(metadata, ensure_ascii=False, default=str)))
+            postings.extend((term, chunk_id, tf) for term, tf in terms.items())
+        with self._lock:
+            self._remove(chunk_ids)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, submission_id, student_id, assignment_id, type, timestamp,"
+                " length, document, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT OR REPLACE INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+            self._conn.execute("UPDATE stats SET value = value + ? WHERE key = 'chunks'", (len(rows),))
+            self._conn.execute("UPDATE stats SET value = value + ? WHERE key = 'length'", (total,))
+            self._conn.commit()
+
+    def update_metadata(self, chunk_ids: Sequence[str], metadatas: Sequence[Optional[Dict]]):
+        """Refresh metadata of chunks whose text did not change."""
+        params = [(*[(metadata or {}).get(field) for field in INDEXED_FIELDS],
+                   json.dumps(metadata or {}, ensure_ascii=False, default=str), chunk_id)
+                  for chunk_id, metadata in zip(chunk_ids, metadatas)]
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE chunks SET submission_id = ?, student_id = ?, assignment_id = ?, type = ?, timestamp = ?,"
+                " metadata = ? WHERE chunk_id = ?", params)
+            self._conn.commit()
+
+    def delete(self, chunk_ids: Optional[Sequence[str]] = None, submission_id: Optional[str] = None):
+        with self._lock:
+            if submission_id is not None:
+                chunk_ids = [row[0] for row in self._conn.execute(
+                    "SELECT chunk_id FROM chunks WHERE submission_id = ?", (submission_id,))]
+            self._remove(list(chunk_ids or []))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("UPDATE stats SET value = 0")
+            self._conn.commit()
+
+    # ----- reads -----
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM stats WHERE key = 'chunks'").fetchone()[0]
+
+    def is_empty(self) -> bool:
+        return self.count() == 0
+
+    @staticmethod
+    def _where(filter_dict: Optional[Dict]) -> Tuple[str, List]:
+        if not filter_dict:
+            return "", []
+        clauses, params = [], []
+        for key, value in filter_dict.items():
+            if key in INDEXED_FIELDS:
+                clauses.append(f"c.{key} = ?")
+            else:
+                clauses.append("json_extract(c.metadata, ?) = ?")
+                params.append(f'$."{key}"')
+            params.append(value)
+        return " AND " + " AND ".join(clauses), params
+
+    def _document_frequencies(self, terms: List[str], where: str = "", where_params: Sequence = ()) -> Dict[str, int]:
+        """Number of chunks containing each term (only chunks matching where, if given). Caller holds the lock."""
+        df = {}
+        for i in range(0, len(terms), 500):
+            batch = terms[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            if where:
+                df.update(self._conn.execute(
+                    "SELECT p.term, COUNT(*) FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id"
+                    f" WHERE p.term IN ({marks}){where} GROUP BY p.term", batch + list(where_params)))
+            else:
+                df.update(self._conn.execute(
+                    f"SELECT term, COUNT(*) FROM postings WHERE term IN ({marks}) GROUP BY term", batch))
+        return df
+
+    def search(self, query: str, k: int = 4, filter_dict: Optional[Dict] = None) -> List[Tuple[str, str, Dict, float]]:
+        """
+        BM25 top-k chunks for query.
+
+        Args:
+            query: Query text
+            k: Number of results
+            filter_dict: Exact-match metadata filters
+
+        Returns:
+            Up to k (chunk_id, text, metadata, score) tuples, best first
+        """
+        query_terms = Counter(lexical_terms(query))
+        if not query_terms or k <= 0:
+            return []
+        where, where_params = self._where(filter_dict)
+
+        with self._lock:
+            n_chunks, total_length = (row[0] for row in self._conn.execute(
+                "SELECT value FROM stats WHERE key IN ('chunks', 'length') ORDER BY key"))
+            if not n_chunks:
+                return []
+            avg_length = total_length / n_chunks
+
+            terms = list(query_terms)
+            df = self._document_frequencies(terms)
+            # Rarest terms carry nearly all of the BM25 weight. With a filter, rank them by
+            # their frequency among the matching chunks, so terms that are rare overall but
+            # only occur in other chunks (e.g. the student's own essay) cannot fill the cap.
+            candidates = self._document_frequencies(terms, where, where_params) if where else df
+            chosen = sorted(candidates, key=lambda term: candidates[term])[:self.max_query_terms]
+            if not chosen:
+                return []
+
+            marks = ",".join("?" * len(chosen))
+            rows = self._conn.execute(
+                "SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id"
+                f" WHERE p.term IN ({marks}){where}", chosen + where_params).fetchall()
+
+            scores = {}
+            for term, chunk_id, tf, length in rows:
+                idf = math.log(1.0 + (n_chunks - df[term] + 0.5) / (df[term] + 0.5))
+                norm = tf + self.k1 * (1.0 - self.b + self.b * length / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + query_terms[term] * idf * tf * (self.k1 + 1.0) / norm
+            best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+            if not best:
+                return []
+
+            marks = ",".join("?" * len(best))
+            stored = {row[0]: row[1:] for row in self._conn.execute(
+                f"SELECT chunk_id, document, metadata FROM chunks WHERE chunk_id IN ({marks})",
+                [chunk_id for chunk_id, _ in best])}
+        return [(chunk_id, stored[chunk_id][0], json.loads(stored[chunk_id][1] or "{}"), score)
+                for chunk_id, score in best if chunk_id in stored]
@@ -0,0 +1,228 @@
+# llm_cache.py
+# Response cache for FeedbackAgents chains
+
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import Runnable
+
+_refresh = contextvars.ContextVar("llm_cache_refresh", default=False)
+
+
+@contextlib.contextmanager
+def refresh_responses(enabled: bool = True):
+    """Skip cache lookups in the enclosed block; fresh responses still replace the cached ones."""
+    token = _refresh.set(enabled)
+    try:
+        yield
+    finally:
+        _refresh.reset(token)
+
+
+class ResponseCache:
+    """
+    Two-tier LLM response cache.
+
+    An in-memory LRU sits in front of an optional SQLite file so cached
+    responses survive restarts and are shared between worker processes.
+    Entries expire after ttl seconds (None = never).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 86400, path: Optional[str] = None):
+        """
+        Args:
+            max_entries: In-memory LRU size
+            ttl: Seconds a response stays valid
+            path: SQLite file for the persistent tier (None = memory only)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._memory = OrderedDict()  # key -> (chain, value, expires_at, latency)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._conn = None
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, chain TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL, latency REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_chain ON responses(chain)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, chain: str, prompt: str, extra: str = "") -> str:
+        payload = json.dumps([model, temperature, chain, prompt, extra], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _record(self, chain: str, hit: bool, saved: float = 0.0):
+        entry = self._stats.setdefault(chain, {"hits": 0, "misses": 0, "saved_seconds": 0.0})
+        entry["hits" if hit else "misses"] += 1
+        entry["saved_seconds"] += saved
+
+    def get(self, chain: str, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None and (item[2] is None or item[2] > now):
+                self._memory.move_to_end(key)
+                self._record(chain, True, item[3])
+                return item[1]
+            if item is not None:
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at, latency FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and (row[1] is None or row[1] > now):
+                    self._store_memory(key, chain, row[0], row[1], row[2] or 0.0)
+                    self._record(chain, True, row[2] or 0.0)
+                    return row[0]
+
+            self._record(chain, False)
+            return None
+
+    def put(self, chain: str, key: str, value: str, latency: float = 0.0):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._store_memory(key, chain, value, expires_at, latency)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, chain, value, expires_at, latency) VALUES (?, ?, ?, ?, ?)",
+                    (key, chain, value, expires_at, latency),
+                )
+                self._conn.commit()
+
+    def _store_memory(self, key, chain, value, expires_at, latency):
+        self._memory[key] = (chain, value, expires_at, latency)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def invalidate(self, chain: Optional[str] = None, key: Optional[str] = None) -> int:
+        """
+        Drop cached responses.
+
+        Args:
+            chain: Only entries of this chain (e.g. 'grammar', 'feedback')
+            key: Only this exact entry
+
+        Returns:
+            Number of in-memory entries removed
+        """
+        with self._lock:
+            if key is not None:
+                removed = 1 if self._memory.pop(key, None) else 0
+                if self._conn is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            elif chain is not None:
+                keys = [k for k, item in self._memory.items() if item[0] == chain]
+                for k in keys:
+                    del self._memory[k]
+                removed = len(keys)
+                if self._conn is not None:
+                    self._conn.execute("DELETE FROM responses WHERE chain = ?", (chain,))
+            else:
+                removed = len(self._memory)
+                self._memory.clear()
+                if self._conn is not None:
+                    self._conn.execute("DELETE FROM responses")
+            if self._conn is not None:
+                self._conn.commit()
+        return removed
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = sum(s["hits"] for s in self._stats.values())
+            misses = sum(s["misses"] for s in self._stats.values())
+            by_chain = {
+                chain: dict(s, saved_seconds=round(s["saved_seconds"], 3),
+                            hit_ratio=round(s["hits"] / (s["hits"] + s["misses"]), 3))
+                for chain, s in self._stats.items()
+            }
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+                "saved_seconds": round(sum(s["saved_seconds"] for s in self._stats.values()), 3),
+                "entries": len(self._memory),
+                "by_chain": by_chain,
+            }
+
+
+class CachedChain(Runnable):
+    """
+    prompt | llm with a response cache in front of the model call.
+
+    The key covers model, temperature, chain name and the rendered prompt, so
+    any change to the inputs or prompt template is a miss. Returns an AIMessage
+    like the plain chain.
+
+    Inside refresh_responses() the lookup is skipped and the model is always
+    called. With validate set, only responses it accepts are stored, so a
+    malformed reply is retried on the next call instead of being replayed.
+    """
+
+    def __init__(self, name: str, prompt, llm, cache: ResponseCache,
+                 model: str, temperature: float, extra: Any = None,
+                 validate: Optional[Callable[[str], bool]] = None):
+        self.name = name
+        self.prompt = prompt
+        self.llm = llm
+        self.cache = cache
+        self.model = model
+        self.temperature = temperature
+        self.extra = json.dumps(extra, sort_keys=True) if extra is not None else ""
+        self.validate = validate
+
+    def cache_key(self, inputs: Dict) -> str:
+        rendered = self.prompt.format_prompt(**inputs).to_string()
+        return self.cache.make_key(self.model, self.temperature, self.name, rendered, self.extra)
+
+    def invoke(self, input: Dict, config=None, **kwargs) -> AIMessage:
+        key = self.cache_key(input)
+        cached = None if _refresh.get() else self.cache.get(self.name, key)
+        if cached is not None:
+            return AIMessage(content=cached, response_metadata={"cache_hit": True})
+
+        start = time.perf_counter()
+        message = self.llm.invoke(self.prompt.invoke(input, config), config, **kwargs)
+        self._put(key, message.content, time.perf_counter() - start)
+        return message
+
+    def stream(self, input: Dict, config=None, **kwargs):
+        """Stream the model output; a cache hit is yielded as a single chunk."""
+        key = self.cache_key(input)
+        cached = None if _refresh.get() else self.cache.get(self.name, key)
+        if cached is not None:
+            yield AIMessageChunk(content=cached, response_metadata={"cache_hit": True})
+            return
+
+        start = time.perf_counter()
+        parts = []
+        for chunk in self.llm.stream(self.prompt.invoke(input, config), config, **kwargs):
+            parts.append(chunk.content)
+            yield chunk
+        self._put(key, "".join(parts), time.perf_counter() - start)
+
+    def _put(self, key: str, content: str, latency: float):
+        if self.validate is None or self.validate(content):
+            self.cache.put(self.name, key, content, latency=latency)
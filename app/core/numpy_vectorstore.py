@@ -0,0 +1,734 @@
+# numpy_vectorstore.py
+# Chroma-free vectorstore: float16 memory-mapped vectors + a SQLite metadata table
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+VECTORS_FILE = "vectors.f16"
+INT8_VECTORS_FILE = "vectors.i8"
+FULL_VECTORS_FILE = "full.f32"
+META_FILE = "meta.sqlite3"
+QUANTIZATIONS = ("float16", "int8")
+# Rows scored per matrix product; the float32 copy of a block stays cache-sized
+SCORE_BLOCK_ROWS = 2048
+MIN_CAPACITY = 1024
+# Change-log entries kept for readers in other processes; one that falls further behind reloads fully
+CHANGES_KEEP = 50_000
+
+
+def list_collections(directory: str) -> List[str]:
+    """Names of the collections stored under directory."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if os.path.exists(os.path.join(directory, name, META_FILE)))
+
+
+def delete_collection(directory: str, name: str):
+    path = os.path.join(directory, name)
+    for filename in (VECTORS_FILE, INT8_VECTORS_FILE, FULL_VECTORS_FILE, META_FILE, META_FILE + "-wal",
+                     META_FILE + "-shm"):
+        if os.path.exists(os.path.join(path, filename)):
+            os.remove(os.path.join(path, filename))
+    if os.path.isdir(path) and not os.listdir(path):
+        os.rmdir(path)
+
+
+def quantize(vectors: np.ndarray, search_dim: int, quantization: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    First-pass search representation of full-precision vectors.
+
+    Vectors are truncated to their first search_dim components and
+    renormalised (Matryoshka embeddings such as text-embedding-3 keep most
+    of their quality this way), then stored as float16 or as int8 with one
+    scale per row.
+
+    Returns:
+        (stored matrix, squared norms of the dequantised rows, per-row scales)
+    """
+    truncated = np.asarray(vectors, dtype=np.float32)[:, :search_dim]
+    if search_dim < vectors.shape[1]:
+        norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+        truncated = truncated / np.where(norms > 0, norms, 1.0)
+    if quantization == "int8":
+        scales = np.abs(truncated).max(axis=1) / 127.0
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        stored = np.clip(np.rint(truncated / scales[:, None]), -127, 127).astype(np.int8)
+        dequantized = stored.astype(np.float32) * scales[:, None]
+    else:
+        scales = np.ones(len(truncated), dtype=np.float32)
+        stored = truncated.astype(np.float16)
+        dequantized = stored.astype(np.float32)
+    return stored, np.einsum("ij,ij->i", dequantized, dequantized), scales
+
+
+_COMPARISONS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+
+def _matches(metadata: Dict, where: Dict) -> bool:
+    """Evaluate a Chroma-style where clause against one metadata dict."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$eq":
+                    ok = value == operand
+                elif op == "$ne":
+                    ok = value != operand
+                elif op == "$in":
+                    ok = value in operand
+                elif op == "$nin":
+                    ok = value not in operand
+                elif op in _COMPARISONS:
+                    ok = value is not None and _COMPARISONS[op](value, operand)
+                else:
+                    raise ValueError(f"Unsupported where operator: {op}")
+                if not ok:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class NumpyCollection:
+    """
+    One collection: an (rows x dim) float16 memmap plus a SQLite table of
+    ids, documents and metadata.
+
+    Implements the part of the Chroma Collection API the pipeline uses
+    (count, get, upsert, delete, query). Search is exact: batched dot
+    products over the rows that pass the metadata prefilter. Distances are
+    squared L2, like Chroma's default space, so results from both backends
+    merge the same way.
+
+    The first-pass matrix can be reduced (see quantize): truncated to
+    search_dimensions and/or stored as int8. In that case the full float32
+    vectors are also kept on disk, and the top k * rerank_factor
+    candidates are reranked exactly against them. The layout is fixed when
+    the collection receives its first vectors.
+
+    Writers serialise through SQLite and append the ids they touch to a
+    change log. Every process maps the vector files read-only and, when
+    another connection commits (PRAGMA data_version), re-reads only the
+    chunks logged since its last refresh, so workers share the vectors
+    through the page cache without re-parsing every row.
+    """
+
+    def __init__(self,
+                 path: str,
+                 quantization: str = "float16",
+                 search_dimensions: Optional[int] = None,
+                 rerank_factor: int = 4):
+        """
+        Args:
+            path: Collection directory
+            quantization: 'float16' or 'int8' storage of the first-pass matrix (new collections)
+            search_dimensions: Leading dimensions used by the first pass (new collections;
+                None keeps every dimension)
+            rerank_factor: Candidates per requested result reranked at full precision
+                (only for reduced layouts; 0 or 1 disables reranking)
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.path = path
+        self.name = os.path.basename(path)
+        self.quantization = quantization
+        self.search_dimensions = search_dimensions
+        self.rerank_factor = rerank_factor
+        os.makedirs(path, exist_ok=True)
+        self._full_path = os.path.join(path, FULL_VECTORS_FILE)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(path, META_FILE), check_same_thread=False,
+                                     timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " id TEXT NOT NULL UNIQUE,"
+            " row INTEGER NOT NULL UNIQUE,"
+            " norm_sq REAL NOT NULL,"
+            " document TEXT,"
+            " metadata TEXT)"
+        )
+        if "scale" not in {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN scale REAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS changes (version INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL)")
+
+        # In-memory view, patched from the change log whenever the table changed
+        self._version = None
+        self._change_version = None
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._seqs = np.zeros(0, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._row_scales = np.zeros(0, dtype=np.float32)
+        self._scales = None
+        self._metadatas: List[Dict] = []
+        self._layout = None
+        self._vectors = None
+        self._full = None
+        self._columns: Dict[str, Dict] = {}
+
+    # ----- loading -----
+
+    def _read_layout(self) -> Optional[Tuple[int, int, str, bool]]:
+        """(dim, search_dim, quantization, keeps_full) of the stored vectors, None while empty."""
+        settings = dict(self._conn.execute("SELECT key, value FROM settings"))
+        if "dim" not in settings:
+            return None
+        dim = int(settings["dim"])
+        # Collections written before reduced layouts existed only record 'dim'
+        return (dim, int(settings.get("search_dim", dim)), settings.get("quantization", "float16"),
+                bool(int(settings.get("full", 0))))
+
+    def _dim(self) -> Optional[int]:
+        layout = self._read_layout()
+        return layout[0] if layout else None
+
+    def _search_path(self, quantization: str) -> str:
+        return os.path.join(self.path, INT8_VECTORS_FILE if quantization == "int8" else VECTORS_FILE)
+
+    @staticmethod
+    def _map(path: str, dtype, width: int):
+        if not os.path.exists(path):
+            return None
+        capacity = os.path.getsize(path) // (width * np.dtype(dtype).itemsize)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(capacity, width)) if capacity else None
+
+    def _refresh(self):
+        """Bring ids/metadata (and the vector maps) up to date with the table. Caller holds the lock."""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._version:
+            return
+        conn = self._conn
+        conn.execute("BEGIN")  # one snapshot for the log and the rows
+        try:
+            first, last = conn.execute("SELECT MIN(version), MAX(version) FROM changes").fetchone()
+            last = last or 0
+            if self._change_version is None or (first is not None and first > self._change_version + 1):
+                # First load, or the log was trimmed past what this process has seen
+                self._clear()
+                self._patch(conn.execute(
+                    "SELECT id, seq, row, norm_sq, metadata, scale FROM chunks ORDER BY seq").fetchall(), [])
+            elif last > self._change_version:
+                changed = [r[0] for r in conn.execute("SELECT DISTINCT id FROM changes WHERE version > ?",
+                                                      (self._change_version,))]
+                rows = []
+                for i in range(0, len(changed), 500):
+                    batch = changed[i:i + 500]
+                    marks = ",".join("?" * len(batch))
+                    rows.extend(conn.execute(
+                        f"SELECT id, seq, row, norm_sq, metadata, scale FROM chunks WHERE id IN ({marks})", batch))
+                self._patch(rows, changed)
+            self._layout = self._read_layout()
+        finally:
+            conn.execute("COMMIT")
+
+        self._vectors = self._full = None
+        if self._layout is not None:
+            dim, search_dim, quantization, keeps_full = self._layout
+            dtype = np.int8 if quantization == "int8" else np.float16
+            self._vectors = self._map(self._search_path(quantization), dtype, search_dim)
+            if keeps_full:
+                self._full = self._map(self._full_path, np.float32, dim)
+        self._scales = self._row_scales if self._layout is not None and self._layout[2] == "int8" else None
+        self._change_version = last
+        self._version = version
+
+    def _clear(self):
+        self._ids, self._positions, self._metadatas = [], {}, []
+        self._seqs = np.zeros(0, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._row_scales = np.zeros(0, dtype=np.float32)
+
+    def _patch(self, rows: List[Tuple], changed: List[str]):
+        """
+        Apply re-read (id, seq, row, norm_sq, metadata, scale) rows to the
+        in-memory view. Changed ids without a row were deleted; a chunk whose
+        seq changed was deleted and re-added, so it moves to the end like in
+        the table's seq order.
+        """
+        current = {r[0]: r for r in rows}
+        updated, dropped = [], []
+        for chunk_id in changed:
+            p = self._positions.get(chunk_id)
+            if p is None:
+                continue
+            row = current.get(chunk_id)
+            if row is not None and row[1] == self._seqs[p]:
+                updated.append((p, row))
+            else:
+                dropped.append(p)
+
+        for p, (_, _, row, norm_sq, metadata, scale) in updated:
+            self._rows[p] = row
+            self._norms[p] = norm_sq
+            self._row_scales[p] = scale if scale is not None else 1.0
+            self._metadatas[p] = json.loads(metadata) if metadata else {}
+
+        if dropped:
+            keep = np.ones(len(self._ids), dtype=bool)
+            keep[dropped] = False
+            self._ids = [chunk_id for chunk_id, k in zip(self._ids, keep) if k]
+            self._metadatas = [metadata for metadata, k in zip(self._metadatas, keep) if k]
+            self._seqs, self._rows = self._seqs[keep], self._rows[keep]
+            self._norms, self._row_scales = self._norms[keep], self._row_scales[keep]
+            self._positions = {chunk_id: i for i, chunk_id in enumerate(self._ids)}
+
+        added = sorted((r for r in rows if r[0] not in self._positions), key=lambda r: r[1])
+        if added:
+            start = len(self._ids)
+            self._ids.extend(r[0] for r in added)
+            self._positions.update((r[0], start + i) for i, r in enumerate(added))
+            self._metadatas.extend(json.loads(r[4]) if r[4] else {} for r in added)
+            self._seqs = np.concatenate([self._seqs, np.fromiter((r[1] for r in added), dtype=np.int64)])
+            self._rows = np.concatenate([self._rows, np.fromiter((r[2] for r in added), dtype=np.int64)])
+            self._norms = np.concatenate([self._norms, np.fromiter((r[3] for r in added), dtype=np.float32)])
+            self._row_scales = np.concatenate([self._row_scales, np.fromiter(
+                (r[5] if r[5] is not None else 1.0 for r in added), dtype=np.float32)])
+
+        if updated or dropped or added:
+            self._columns = {}
+
+    @staticmethod
+    def _log_changes(conn, ids: Iterable[str]):
+        """Record ids touched by the caller's transaction for other processes' refreshes."""
+        conn.executemany("INSERT INTO changes (id) VALUES (?)", [(chunk_id,) for chunk_id in dict.fromkeys(ids)])
+        conn.execute("DELETE FROM changes WHERE version <= (SELECT MAX(version) FROM changes) - ?", (CHANGES_KEEP,))
+
+    def _column(self, key: str) -> Dict:
+        """value -> positions for one metadata key (built on first use)."""
+        column = self._columns.get(key)
+        if column is None:
+            lists = {}
+            for i, metadata in enumerate(self._metadatas):
+                value = metadata.get(key)
+                try:
+                    lists.setdefault(value, []).append(i)
+                except TypeError:
+                    continue
+            column = {value: np.asarray(positions, dtype=np.int64) for value, positions in lists.items()}
+            self._columns[key] = column
+        return column
+
+    def _mask(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Boolean mask over loaded positions (None means every row)."""
+        if not where:
+            return None
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    clause_mask = self._mask(clause)
+                    if clause_mask is not None:
+                        mask &= clause_mask
+            elif key.startswith("$") or (isinstance(condition, dict) and set(condition) - {"$eq", "$in"}):
+                mask &= np.fromiter((_matches(m, {key: condition}) for m in self._metadatas),
+                                    dtype=bool, count=len(self._metadatas))
+            else:
+                if isinstance(condition, dict):
+                    values = [condition["$eq"]] if "$eq" in condition else list(condition["$in"])
+                else:
+                    values = [condition]
+                column = self._column(key)
+                key_mask = np.zeros(len(self._ids), dtype=bool)
+                for value in values:
+                    positions = column.get(value)
+                    if positions is not None:
+                        key_mask[positions] = True
+                mask &= key_mask
+        return mask
+
+    def _select(self, ids: Optional[Sequence[str]], where: Optional[Dict]) -> np.ndarray:
+        if ids is not None:
+            positions = np.asarray([self._positions[i] for i in ids if i in self._positions], dtype=np.int64)
+            if where:
+                positions = positions[self._mask(where)[positions]]
+            return positions
+        mask = self._mask(where)
+        return np.arange(len(self._ids)) if mask is None else np.flatnonzero(mask)
+
+    def _documents(self, positions: Iterable[int]) -> List[Optional[str]]:
+        ids = [self._ids[p] for p in positions]
+        found = {}
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            found.update(self._conn.execute(f"SELECT id, document FROM chunks WHERE id IN ({marks})", batch))
+        return [found.get(chunk_id) for chunk_id in ids]
+
+    # ----- Chroma Collection API -----
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._ids)
+
+    def get(self,
+            ids: Optional[Sequence[str]] = None,
+            where: Optional[Dict] = None,
+            limit: Optional[int] = None,
+            offset: Optional[int] = None,
+            include: Sequence[str] = ("metadatas", "documents")) -> Dict:
+        with self._lock:
+            self._refresh()
+            positions = self._select(ids, where)
+            start = offset or 0
+            positions = positions[start:start + limit] if limit is not None else positions[start:]
+            result = {"ids": [self._ids[p] for p in positions], "metadatas": None, "documents": None,
+                      "embeddings": None}
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[p] for p in positions]
+            if "documents" in include:
+                result["documents"] = self._documents(positions)
+            if "embeddings" in include:
+                # Full precision when kept, so copies/migrations never lose accuracy
+                source = self._full if self._full is not None else self._vectors
+                if source is not None and len(positions):
+                    result["embeddings"] = np.asarray(source[self._rows[positions]], dtype=np.float32)
+                else:
+                    result["embeddings"] = np.zeros((0, self._dim() or 0), dtype=np.float32)
+            return result
+
+    def upsert(self,
+               ids: Sequence[str],
+               embeddings,
+               metadatas: Optional[Sequence[Dict]] = None,
+               documents: Optional[Sequence[str]] = None):
+        if not len(ids):
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("upsert needs one embedding per id")
+        metadatas = metadatas or [{}] * len(ids)
+        documents = documents or [None] * len(ids)
+
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                layout = self._read_layout()
+                if layout is None:
+                    dim = vectors.shape[1]
+                    search_dim = min(self.search_dimensions or dim, dim)
+                    keeps_full = self.quantization != "float16" or search_dim < dim
+                    layout = (dim, search_dim, self.quantization, keeps_full)
+                    conn.executemany("INSERT INTO settings (key, value) VALUES (?, ?)",
+                                     [("dim", dim), ("search_dim", search_dim),
+                                      ("quantization", self.quantization), ("full", int(keeps_full))])
+                dim, search_dim, quantization, keeps_full = layout
+                if dim != vectors.shape[1]:
+                    raise ValueError(f"Collection {self.name} stores {dim}-d vectors, got {vectors.shape[1]}-d")
+
+                existing = {}
+                unique_ids = list(dict.fromkeys(ids))
+                for i in range(0, len(unique_ids), 500):
+                    batch = unique_ids[i:i + 500]
+                    marks = ",".join("?" * len(batch))
+                    existing.update(conn.execute(f"SELECT id, row FROM chunks WHERE id IN ({marks})", batch))
+
+                # New ids reuse rows freed by deletes before growing the file
+                new_count = sum(1 for chunk_id in unique_ids if chunk_id not in existing)
+                next_row = conn.execute(
+                    "SELECT COALESCE(MAX(row), -1) + 1 FROM"
+                    " (SELECT row FROM chunks UNION ALL SELECT row FROM free_rows)").fetchone()[0]
+                free = [r[0] for r in conn.execute("SELECT row FROM free_rows ORDER BY row LIMIT ?", (new_count,))]
+                conn.executemany("DELETE FROM free_rows WHERE row = ?", [(r,) for r in free])
+                rows = {}
+                for chunk_id in unique_ids:
+                    if chunk_id in existing:
+                        rows[chunk_id] = existing[chunk_id]
+                    elif free:
+                        rows[chunk_id] = free.pop(0)
+                    else:
+                        rows[chunk_id] = next_row
+                        next_row += 1
+
+                target = np.asarray([rows[chunk_id] for chunk_id in ids], dtype=np.int64)
+                stored, norms, scales = quantize(vectors, search_dim, quantization)
+                self._write_matrix(self._search_path(quantization), target, stored)
+                if keeps_full:
+                    self._write_matrix(self._full_path, target, vectors)
+                conn.executemany(
+                    "INSERT INTO chunks (id, row, norm_sq, scale, document, metadata) VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(id) DO UPDATE SET norm_sq = excluded.norm_sq, scale = excluded.scale,"
+                    " document = excluded.document, metadata = excluded.metadata",
+                    [(chunk_id, int(row), float(norm), float(scale), document,
+                      json.dumps(metadata or {}, ensure_ascii=False, default=str))
+                     for chunk_id, row, norm, scale, document, metadata
+                     in zip(ids, target, norms, scales, documents, metadatas)],
+                )
+                self._log_changes(conn, ids)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            # Our own commits do not change data_version on this connection
+            self._version = None
+
+    def update(self,
+               ids: Sequence[str],
+               embeddings=None,
+               metadatas: Optional[Sequence[Dict]] = None,
+               documents: Optional[Sequence[str]] = None):
+        """Change stored chunks in place; unknown ids are ignored, like Chroma."""
+        if embeddings is not None:
+            current = self.get(ids=ids, include=["metadatas", "documents"])
+            known = {chunk_id: i for i, chunk_id in enumerate(current["ids"])}
+            positions = [i for i, chunk_id in enumerate(ids) if chunk_id in known]
+            if positions:
+                self.upsert(ids=[ids[i] for i in positions],
+                            embeddings=[embeddings[i] for i in positions],
+                            metadatas=[metadatas[i] if metadatas else current["metadatas"][known[ids[i]]]
+                                       for i in positions],
+                            documents=[documents[i] if documents else current["documents"][known[ids[i]]]
+                                       for i in positions])
+            return
+        if metadatas is None and documents is None:
+            return
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for i, chunk_id in enumerate(ids):
+                    if metadatas is not None:
+                        conn.execute("UPDATE chunks SET metadata = ? WHERE id = ?",
+                                     (json.dumps(metadatas[i] or {}, ensure_ascii=False, default=str), chunk_id))
+                    if documents is not None:
+                        conn.execute("UPDATE chunks SET document = ? WHERE id = ?", (documents[i], chunk_id))
+                self._log_changes(conn, ids)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._version = None
+
+    def add(self, ids, embeddings, metadatas=None, documents=None):
+        self.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    @staticmethod
+    def _write_matrix(path: str, rows: np.ndarray, values: np.ndarray):
+        """Write values into rows of a memmapped matrix file, growing it geometrically."""
+        row_bytes = values.shape[1] * values.dtype.itemsize
+        needed = int(rows.max()) + 1
+        capacity = (os.path.getsize(path) if os.path.exists(path) else 0) // row_bytes
+        if needed > capacity:
+            capacity = max(needed, capacity * 2, MIN_CAPACITY)
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        matrix = np.memmap(path, dtype=values.dtype, mode="r+", shape=(capacity, values.shape[1]))
+        matrix[rows] = values
+        matrix.flush()
+        del matrix
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None):
+        with self._lock:
+            self._refresh()
+            if ids is None and not where:
+                return
+            positions = self._select(ids, where)
+            if not len(positions):
+                return
+            doomed = [self._ids[p] for p in positions]
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for i in range(0, len(doomed), 500):
+                    batch = doomed[i:i + 500]
+                    marks = ",".join("?" * len(batch))
+                    freed = conn.execute(f"SELECT row FROM chunks WHERE id IN ({marks})", batch).fetchall()
+                    conn.execute(f"DELETE FROM chunks WHERE id IN ({marks})", batch)
+                    conn.executemany("INSERT OR IGNORE INTO free_rows (row) VALUES (?)", freed)
+                self._log_changes(conn, doomed)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._version = None
+
+    def query(self,
+              query_embeddings,
+              n_results: int = 10,
+              where: Optional[Dict] = None,
+              include: Sequence[str] = ("metadatas", "documents", "distances")) -> Dict:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        with self._lock:
+            self._refresh()
+            positions = self._select(None, where)
+            hits = self._search(queries, positions, n_results)
+            result = {"ids": [], "metadatas": None, "documents": None, "distances": None}
+            if "metadatas" in include:
+                result["metadatas"] = []
+            if "documents" in include:
+                result["documents"] = []
+            if "distances" in include:
+                result["distances"] = []
+            for top, distances in hits:
+                result["ids"].append([self._ids[p] for p in top])
+                if result["metadatas"] is not None:
+                    result["metadatas"].append([self._metadatas[p] for p in top])
+                if result["documents"] is not None:
+                    result["documents"].append(self._documents(top))
+                if result["distances"] is not None:
+                    result["distances"].append(distances.tolist())
+            return result
+
+    def _search(self, queries: np.ndarray, positions: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Nearest positions per query, reranked at full precision for reduced layouts."""
+        if self._vectors is None or not len(positions) or k <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        dim, search_dim, _, _ = self._layout
+        if queries.shape[1] != dim:
+            raise ValueError(f"Collection {self.name} stores {dim}-d vectors, got {queries.shape[1]}-d queries")
+
+        search_queries = queries[:, :search_dim]
+        if search_dim < dim:
+            norms = np.linalg.norm(search_queries, axis=1, keepdims=True)
+            search_queries = search_queries / np.where(norms > 0, norms, 1.0)
+        if self._full is None or self.rerank_factor <= 1:
+            return self._top_k(search_queries, positions, k)
+
+        reranked = []
+        for query, (candidates, _) in zip(queries, self._top_k(search_queries, positions, k * self.rerank_factor)):
+            vectors = np.asarray(self._full[self._rows[candidates]], dtype=np.float32)
+            distances = np.einsum("ij,ij->i", vectors - query, vectors - query)
+            order = np.argsort(distances, kind="stable")[:k]
+            reranked.append((candidates[order], distances[order]))
+        return reranked
+
+    def _top_k(self, queries: np.ndarray, positions: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Nearest positions per query over the first-pass matrix (squared L2), nearest first."""
+
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        best_positions = np.zeros((len(queries), 0), dtype=np.int64)
+        best_distances = np.zeros((len(queries), 0), dtype=np.float32)
+        # Visit rows in file order so scans read the memmap sequentially
+        positions = positions[np.argsort(self._rows[positions], kind="stable")]
+        buffer = np.empty((min(SCORE_BLOCK_ROWS, len(positions)), queries.shape[1]), dtype=np.float32)
+        for start in range(0, len(positions), SCORE_BLOCK_ROWS):
+            block = positions[start:start + SCORE_BLOCK_ROWS]
+            rows = self._rows[block]
+            if rows[-1] - rows[0] == len(rows) - 1:
+                source = self._vectors[rows[0]:rows[-1] + 1]  # contiguous: a slice, no gather
+            else:
+                source = self._vectors[rows]
+            vectors = buffer[:len(block)]
+            np.copyto(vectors, source)
+            dots = queries @ vectors.T
+            if self._scales is not None:
+                dots *= self._scales[block][None, :]
+            distances = self._norms[block][None, :] + query_norms[:, None] - 2.0 * dots
+            candidates = np.concatenate([best_distances, distances], axis=1)
+            candidate_positions = np.concatenate([best_positions, np.broadcast_to(block, distances.shape)], axis=1)
+            keep = min(k, candidates.shape[1])
+            top = np.argpartition(candidates, keep - 1, axis=1)[:, :keep]
+            best_distances = np.take_along_axis(candidates, top, axis=1)
+            best_positions = np.take_along_axis(candidate_positions, top, axis=1)
+
+        order = np.argsort(best_distances, axis=1, kind="stable")
+        best_distances = np.maximum(np.take_along_axis(best_distances, order, axis=1), 0.0)
+        best_positions = np.take_along_axis(best_positions, order, axis=1)
+        return list(zip(best_positions, best_distances))
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    LangChain vectorstore over a NumpyCollection, a drop-in for
+    langchain_chroma.Chroma in RAGPipeline (the raw collection is
+    exposed as `_collection` the same way).
+    """
+
+    def __init__(self, directory: str, collection_name: str, embedding_function, **layout):
+        self._embedding_function = embedding_function
+        self._collection = NumpyCollection(os.path.join(directory, collection_name), **layout)
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def add_texts(self,
+                  texts: Iterable[str],
+                  metadatas: Optional[List[Dict]] = None,
+                  ids: Optional[List[str]] = None,
+                  **kwargs) -> List[str]:
+        texts = list(texts)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        if texts:
+            vectors = self._embedding_function.embed_documents(texts)
+            self._collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+        return ids
+
+    def add_documents(self, documents: List[Document], **kwargs) -> List[str]:
+        return self.add_texts([doc.page_content for doc in documents],
+                              metadatas=[doc.metadata for doc in documents],
+                              ids=kwargs.get("ids"))
+
+    def similarity_search_with_score(self,
+                                     query: str,
+                                     k: int = 4,
+                                     filter: Optional[Dict] = None,
+                                     **kwargs) -> List[Tuple[Document, float]]:
+        vector = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_score(vector, k=k, filter=filter)
+
+    def similarity_search_by_vector_with_score(self,
+                                               embedding: List[float],
+                                               k: int = 4,
+                                               filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        result = self._collection.query(query_embeddings=[embedding], n_results=k, where=filter)
+        return [(Document(page_content=text or "", metadata=metadata or {}, id=chunk_id), distance)
+                for chunk_id, text, metadata, distance in zip(result["ids"][0], result["documents"][0],
+                                                              result["metadatas"][0], result["distances"][0])]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_by_vector(self,
+                                    embedding: List[float],
+                                    k: int = 4,
+                                    filter: Optional[Dict] = None,
+                                    **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None) -> Dict:
+        return self._collection.get(ids=ids, where=where, limit=limit, offset=offset,
+                                    include=include or ("metadatas", "documents"))
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs) -> None:
+        self._collection.delete(ids=ids, where=kwargs.get("where"))
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None,
+                   persist_directory: str = "./numpy_vectors", collection_name: str = "langchain", **kwargs):
+        store = cls(persist_directory, collection_name, embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,221 @@
+# openai_clients.py
+# Process-wide pooled HTTP client shared by every OpenAI chat/embedding model
+
+import os
+import threading
+from typing import Dict, Optional
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from app.core.rate_limiter import get_rate_limiter
+from app.core.tokens import estimate_tokens
+
+try:
+    from app.config import config
+    OPENAI_BASE_URL = config.OPENAI_BASE_URL
+    OPENAI_POOL_SIZE = config.OPENAI_POOL_SIZE
+    OPENAI_CONNECT_TIMEOUT = config.OPENAI_CONNECT_TIMEOUT
+    OPENAI_READ_TIMEOUT = config.OPENAI_READ_TIMEOUT
+    OPENAI_KEEPALIVE_EXPIRY = config.OPENAI_KEEPALIVE_EXPIRY
+    LLM_RATE_LIMIT_ENABLED = config.LLM_RATE_LIMIT_ENABLED
+except ImportError:
+    OPENAI_BASE_URL = None
+    OPENAI_POOL_SIZE = 20
+    OPENAI_CONNECT_TIMEOUT = 5.0
+    OPENAI_READ_TIMEOUT = 120.0
+    OPENAI_KEEPALIVE_EXPIRY = 60.0
+    LLM_RATE_LIMIT_ENABLED = True
+
+
+def _messages_tokens(messages) -> int:
+    return sum(estimate_tokens(m.content if isinstance(m.content, str) else str(m.content)) for m in messages)
+
+
+class RateLimitedChatOpenAI(ChatOpenAI):
+    """ChatOpenAI whose requests go through the shared rate limiter."""
+
+    expected_output_tokens: int = 500
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter = get_rate_limiter()
+        estimate = _messages_tokens(messages) + self.expected_output_tokens
+        result = limiter.call("chat", lambda: super(RateLimitedChatOpenAI, self)._generate(
+            messages, stop=stop, run_manager=run_manager, **kwargs), tokens=estimate)
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        if usage.get("total_tokens"):
+            limiter.adjust("chat", usage["total_tokens"] - estimate)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        limiter = get_rate_limiter()
+        estimate = _messages_tokens(messages) + self.expected_output_tokens
+        # Retry only until the stream has started; the first chunk is pulled under the limiter.
+        stream = None
+
+        def start():
+            nonlocal stream
+            stream = super(RateLimitedChatOpenAI, self)._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return next(stream, None)
+
+        first = limiter.call("chat", start, tokens=estimate)
+        if first is not None:
+            yield first
+            yield from stream
+
+
+class RateLimitedOpenAIEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings whose requests go through the shared rate limiter (embed_query goes via embed_documents)."""
+
+    def embed_documents(self, texts, chunk_size=None, **kwargs):
+        limiter = get_rate_limiter()
+        size = chunk_size or self.chunk_size
+        embeddings = []
+        # One limiter slot per API request
+        for i in range(0, len(texts), size):
+            batch = texts[i:i + size]
+            embeddings.extend(limiter.call(
+                "embeddings",
+                lambda: super(RateLimitedOpenAIEmbeddings, self).embed_documents(batch, chunk_size=size, **kwargs),
+                tokens=sum(estimate_tokens(t) for t in batch)))
+        return embeddings
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    """HTTP transport that counts requests and newly opened connections."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = 0
+        self.errors = 0
+        self._seen = set()
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    def handle_request(self, request):
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            with self._lock:
+                self.requests += 1
+                self.errors += 1
+            raise
+        with self._lock:
+            self.requests += 1
+            for connection in self._pool.connections:
+                if id(connection) not in self._seen:
+                    self._seen.add(id(connection))
+                    self.connections_opened += 1
+        return response
+
+
+class OpenAIClientFactory:
+    """
+    Builds ChatOpenAI / OpenAIEmbeddings objects that all share one keep-alive pool.
+
+    Without this each model object ends up with its own connection pool, so a
+    grading run opens (and TLS-handshakes) several connections per worker.
+    """
+
+    def __init__(self,
+                 pool_size: int = OPENAI_POOL_SIZE,
+                 connect_timeout: float = OPENAI_CONNECT_TIMEOUT,
+                 read_timeout: float = OPENAI_READ_TIMEOUT,
+                 keepalive_expiry: float = OPENAI_KEEPALIVE_EXPIRY,
+                 base_url: Optional[str] = OPENAI_BASE_URL,
+                 rate_limited: bool = LLM_RATE_LIMIT_ENABLED):
+        """
+        Args:
+            pool_size: Maximum open connections (size it to worker concurrency)
+            connect_timeout: Seconds to establish a connection
+            read_timeout: Seconds to wait for a response
+            keepalive_expiry: Seconds an idle connection is kept open
+            base_url: OpenAI-compatible API base (e.g. a local stub server)
+            rate_limited: Route calls through the shared rate limiter (which also owns retries)
+        """
+        self.pool_size = pool_size
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.keepalive_expiry = keepalive_expiry
+        self.base_url = base_url
+        self.rate_limited = rate_limited
+        self._client = None
+        self._transport = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def http_client(self) -> httpx.Client:
+        """The shared client; rebuilt in a forked child (sockets are not fork-safe)."""
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    limits = httpx.Limits(max_connections=self.pool_size,
+                                          max_keepalive_connections=self.pool_size,
+                                          keepalive_expiry=self.keepalive_expiry)
+                    self._transport = _CountingTransport(limits=limits)
+                    self._client = httpx.Client(transport=self._transport, timeout=self.timeout)
+                    self._pid = os.getpid()
+        return self._client
+
+    def _common_kwargs(self, kwargs: Dict) -> Dict:
+        kwargs.setdefault("http_client", self.http_client)
+        kwargs.setdefault("timeout", self.timeout)
+        if self.base_url:
+            kwargs.setdefault("base_url", self.base_url)
+        if self.rate_limited:
+            # The limiter retries with jittered backoff; SDK retries would bypass it
+            kwargs.setdefault("max_retries", 0)
+        return kwargs
+
+    def chat_model(self, model: str, temperature: float = 0.2, **kwargs) -> ChatOpenAI:
+        kwargs.setdefault("stream_usage", True)  # token usage on streamed responses too (AI log)
+        cls = RateLimitedChatOpenAI if self.rate_limited else ChatOpenAI
+        return cls(model=model, temperature=temperature, **self._common_kwargs(kwargs))
+
+    def embeddings(self, model: str, **kwargs) -> OpenAIEmbeddings:
+        cls = RateLimitedOpenAIEmbeddings if self.rate_limited else OpenAIEmbeddings
+        return cls(model=model, **self._common_kwargs(kwargs))
+
+    def stats(self) -> Dict:
+        """Connection reuse metrics for the shared pool."""
+        transport = self._transport
+        if transport is None or self._pid != os.getpid():
+            return {"requests": 0, "connections_opened": 0, "errors": 0, "reuse_ratio": 0.0,
+                    "pool_size": self.pool_size}
+        requests, opened = transport.requests, transport.connections_opened
+        return {
+            "requests": requests,
+            "connections_opened": opened,
+            "errors": transport.errors,
+            "reuse_ratio": round(1 - opened / requests, 3) if requests else 0.0,
+            "pool_size": self.pool_size,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._transport = None
+
+
+_factory = None
+_factory_lock = threading.Lock()
+
+
+def get_client_factory() -> OpenAIClientFactory:
+    """Get or create the process-wide client factory."""
+    global _factory
+    if _factory is None:
+        with _factory_lock:
+            if _factory is None:
+                _factory = OpenAIClientFactory()
+    return _factory
+
+
+def chat_model(model: str, temperature: float = 0.2, **kwargs) -> ChatOpenAI:
+    return get_client_factory().chat_model(model, temperature, **kwargs)
+
+
+def embeddings_model(model: str, **kwargs) -> OpenAIEmbeddings:
+    return get_client_factory().embeddings(model, **kwargs)
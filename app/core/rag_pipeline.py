@@ -1,20 +1,156 @@
 # rag_pipeline.py
 # RAG infrastructure for managing submission vectorstore
 
+import contextvars
+import hashlib
 import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 from langchain_text_splitters import CharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
+from app.core.embedding_cache import EmbeddingCache, CachedEmbeddings
+from app.core.keys import normalize_text, partition_slug
+from app.core.openai_clients import chat_model, embeddings_model
+from app.core.ai_telemetry import ai_telemetry
+from app.core import numpy_vectorstore
+from app.core.numpy_vectorstore import NumpyVectorStore
+from app.core.context_compression import ContextCompressor
+from app.core.tokens import estimate_tokens
+from app.core.submission_index import SubmissionIndex
+from app.core.lexical_index import LexicalIndex
+from app.core.retrieval_cache import RetrievalCache, canonical_filter
+from app.core.llm_cache import ResponseCache
 
 load_dotenv()
 
+try:
+    from app.config import config
+    CONTEXT_COMPRESSION = config.CONTEXT_COMPRESSION
+    RETRIEVAL_MODE = config.RETRIEVAL_MODE
+    RETRIEVAL_MAX_QUERIES = config.RETRIEVAL_MAX_QUERIES
+    VECTORSTORE_PARTITIONING = config.VECTORSTORE_PARTITIONING
+    VECTORSTORE_MAX_OPEN_COLLECTIONS = config.VECTORSTORE_MAX_OPEN_COLLECTIONS
+    VECTORSTORE_BACKEND = config.VECTORSTORE_BACKEND
+    SEARCH_MODE = config.SEARCH_MODE
+    EMBEDDING_DIMENSIONS = config.EMBEDDING_DIMENSIONS
+    VECTOR_QUANTIZATION = config.VECTOR_QUANTIZATION
+    VECTOR_SEARCH_DIMENSIONS = config.VECTOR_SEARCH_DIMENSIONS
+    VECTOR_RERANK_FACTOR = config.VECTOR_RERANK_FACTOR
+    RETRIEVAL_CACHE = config.RETRIEVAL_CACHE
+    RETRIEVAL_CACHE_SIZE = config.RETRIEVAL_CACHE_SIZE
+    RETRIEVAL_CACHE_SHARED = config.RETRIEVAL_CACHE_SHARED
+    QA_CHAIN_CACHE_SIZE = config.QA_CHAIN_CACHE_SIZE
+    QA_ANSWER_CACHE_SIZE = config.QA_ANSWER_CACHE_SIZE
+    QA_ANSWER_CACHE_TTL = config.QA_ANSWER_CACHE_TTL
+except ImportError:
+    CONTEXT_COMPRESSION = True
+    RETRIEVAL_MODE = "multi"
+    RETRIEVAL_MAX_QUERIES = 5
+    VECTORSTORE_PARTITIONING = "none"
+    VECTORSTORE_MAX_OPEN_COLLECTIONS = 32
+    VECTORSTORE_BACKEND = "chroma"
+    SEARCH_MODE = "hybrid"
+    EMBEDDING_DIMENSIONS = None
+    VECTOR_QUANTIZATION = "float16"
+    VECTOR_SEARCH_DIMENSIONS = None
+    VECTOR_RERANK_FACTOR = 4
+    RETRIEVAL_CACHE = True
+    RETRIEVAL_CACHE_SIZE = 1000
+    RETRIEVAL_CACHE_SHARED = False
+    QA_CHAIN_CACHE_SIZE = 32
+    QA_ANSWER_CACHE_SIZE = 256
+    QA_ANSWER_CACHE_TTL = 86400
+
+PARTITIONING_MODES = ("none", "assignment", "assignment_type")
+BACKENDS = ("chroma", "numpy")
+SEARCH_MODES = ("vector", "hybrid", "lexical")
+
+# Question answering over submissions (built once, shared by every cached chain)
+QA_CHAIN_NAME = "submission_qa"
+QA_PROMPT = PromptTemplate.from_template(
+    """Use the context below to answer the question about student submissions. 
+        If the context doesn't contain enough information, reply that you don't know.
+
+        Context:
+        {context}
+
+        Question:
+        {query}
+
+        Answer:"""
+)
+
+
+def chroma_where(filter_dict: Optional[Dict]) -> Optional[Dict]:
+    """Chroma needs an explicit $and to filter on more than one field."""
+    if not filter_dict:
+        return None
+    if len(filter_dict) == 1 or any(key.startswith("$") for key in filter_dict):
+        return dict(filter_dict)
+    return {"$and": [{key: value} for key, value in filter_dict.items()]}
+
+
+def split_essay_queries(text: str,
+                        max_queries: int = RETRIEVAL_MAX_QUERIES,
+                        min_chars: int = 40,
+                        max_chars: int = 400) -> List[str]:
+    """
+    Split an essay into retrieval queries: one per paragraph, short paragraphs
+    merged with the next, long ones cut at sentence ends, and neighbours merged
+    until there are at most max_queries.
+    """
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n|\n", text or "") if p.strip()]
+    pieces = []
+    for paragraph in paragraphs:
+        while len(paragraph) > max_chars:
+            cut = max(paragraph.rfind(mark, 0, max_chars) for mark in ("。", "！", "？", ". "))
+            cut = cut + 1 if cut > min_chars else max_chars
+            pieces.append(paragraph[:cut])
+            paragraph = paragraph[cut:].strip()
+        if paragraph:
+            pieces.append(paragraph)
+
+    queries = []
+    for piece in pieces:
+        if queries and len(queries[-1]) < min_chars:
+            queries[-1] += piece
+        else:
+            queries.append(piece)
+    while len(queries) > max(1, max_queries):
+        # Merge the shortest adjacent pair
+        i = min(range(len(queries) - 1), key=lambda j: len(queries[j]) + len(queries[j + 1]))
+        queries[i:i + 2] = [queries[i] + queries[i + 1]]
+    return queries
+
+
+def chunk_ids(submission_id: str, texts: List[str]) -> List[str]:
+    """
+    Deterministic chunk IDs derived from chunk content.
+
+    Repeated identical chunks within one submission get an occurrence suffix so
+    IDs stay unique.
+    """
+    seen = {}
+    ids = []
+    for text in texts:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+        n = seen.get(digest, 0)
+        seen[digest] = n + 1
+        ids.append(f"{submission_id}:{digest}" + (f"-{n}" if n else ""))
+    return ids
+
 
 class RAGPipeline:
     """RAG pipeline for indexing and retrieving student submissions."""
@@ -24,7 +160,29 @@ class RAGPipeline:
                  embedding_model: str = "text-embedding-3-large",
                  llm_model: str = "gpt-4o-mini",
                  chunk_size: int = 1000,
-                 chunk_overlap: int = 200):
+                 chunk_overlap: int = 200,
+                 embed_batch_size: int = 256,
+                 embed_concurrency: int = 4,
+                 use_embedding_cache: bool = True,
+                 embedding_cache_size: int = 100_000,
+                 context_compressor: Optional[ContextCompressor] = None,
+                 compress_context: bool = CONTEXT_COMPRESSION,
+                 retrieval_mode: str = RETRIEVAL_MODE,
+                 collection_name: str = "submissions_collection",
+                 partitioning: str = VECTORSTORE_PARTITIONING,
+                 max_open_collections: int = VECTORSTORE_MAX_OPEN_COLLECTIONS,
+                 backend: str = VECTORSTORE_BACKEND,
+                 search_mode: str = SEARCH_MODE,
+                 embedding_dimensions: Optional[int] = EMBEDDING_DIMENSIONS,
+                 vector_quantization: str = VECTOR_QUANTIZATION,
+                 vector_search_dimensions: Optional[int] = VECTOR_SEARCH_DIMENSIONS,
+                 rerank_factor: int = VECTOR_RERANK_FACTOR,
+                 use_retrieval_cache: bool = RETRIEVAL_CACHE,
+                 retrieval_cache_size: int = RETRIEVAL_CACHE_SIZE,
+                 share_retrieval_cache: bool = RETRIEVAL_CACHE_SHARED,
+                 qa_chain_cache_size: int = QA_CHAIN_CACHE_SIZE,
+                 qa_answer_cache_size: int = QA_ANSWER_CACHE_SIZE,
+                 qa_answer_cache_ttl: Optional[float] = QA_ANSWER_CACHE_TTL):
         """
         Initialize RAG pipeline.
 
@@ -34,19 +192,105 @@ class RAGPipeline:
             llm_model: OpenAI LLM model name
             chunk_size: Text chunk size for splitting
             chunk_overlap: Overlap between chunks
+            embed_batch_size: Number of chunks sent per embeddings request
+            embed_concurrency: Maximum embeddings requests in flight during bulk ingestion
+            use_embedding_cache: Reuse embeddings of previously seen chunks/queries
+            embedding_cache_size: Maximum cached vectors before LRU eviction
+            context_compressor: Sentence-level compressor for retrieved context
+            compress_context: Compress context returned by get_context_for_submission
+                (a default ContextCompressor is used when none is given)
+            retrieval_mode: 'single' embeds the query as one search, 'multi' splits it into
+                paragraph queries searched together (see query_multi)
+            collection_name: Vectorstore collection (the name prefix when partitioned)
+            partitioning: 'none' keeps every chunk in one collection; 'assignment' or
+                'assignment_type' routes chunks into one collection per assignment_id
+                (and type), so searches only scan the relevant assignment
+            max_open_collections: Collection handles kept open (LRU) when partitioned
+            backend: 'chroma', or 'numpy' for exact search over float16 memory-mapped
+                vectors (see numpy_vectorstore) without loading Chroma in every worker
+            search_mode: 'vector' (embeddings only), 'hybrid' (embeddings fused with the
+                local BM25 n-gram index) or 'lexical' (BM25 only, no embeddings request)
+            embedding_dimensions: Output dimensions requested from the embedding model
+                (Matryoshka truncation; None keeps the model's native size)
+            vector_quantization: 'float16' or 'int8' first-pass vectors (numpy backend)
+            vector_search_dimensions: Leading dimensions searched in the first pass
+                (numpy backend; None searches all of them)
+            rerank_factor: Candidates per result reranked against the full-precision
+                vectors when the first pass is reduced (numpy backend)
+            use_retrieval_cache: Cache query results until a write touches their filter
+            retrieval_cache_size: Cached results kept before LRU eviction
+            share_retrieval_cache: Also store cached results in SQLite for other workers
+            qa_chain_cache_size: Compiled question-answering chains kept (one per filter)
+            qa_answer_cache_size: Answers kept per (question, filter, generation); 0 disables
+            qa_answer_cache_ttl: Seconds a cached answer stays valid
         """
+        if retrieval_mode not in ('single', 'multi'):
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        if partitioning not in PARTITIONING_MODES:
+            raise ValueError(f"Unknown partitioning: {partitioning}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown vectorstore backend: {backend}")
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {search_mode}")
         self.persist_directory = persist_directory or "./chroma_db"
         self.embedding_model = embedding_model
         self.llm_model = llm_model
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.embed_concurrency = max(1, embed_concurrency)
+        self.retrieval_mode = retrieval_mode
+        self.collection_name = collection_name
+        self.partitioning = partitioning
+        self.max_open_collections = max(1, max_open_collections)
+        self.backend = backend
+        self.search_mode = search_mode
+        self.embedding_dimensions = embedding_dimensions
+        self.vector_layout = {"quantization": vector_quantization,
+                              "search_dimensions": vector_search_dimensions,
+                              "rerank_factor": rerank_factor}
 
         # Initialize embeddings and LLM
-        self.embeddings = OpenAIEmbeddings(model=self.embedding_model, chunk_size=1)
-        self.llm = ChatOpenAI(model=self.llm_model, temperature=0.2)
+        self.embeddings = embeddings_model(self.embedding_model, chunk_size=self.embed_batch_size,
+                                           dimensions=embedding_dimensions)
+        self.embedding_cache = None
+        if use_embedding_cache:
+            self.embedding_cache = EmbeddingCache(
+                os.path.join(self.persist_directory, "embedding_cache.sqlite3"),
+                max_entries=embedding_cache_size
+            )
+            self.embeddings = CachedEmbeddings(self.embeddings, self.embedding_cache)
+        self.llm = chat_model(self.llm_model, temperature=0.2)
+        self.context_compressor = None
+        if compress_context:
+            self.context_compressor = context_compressor or ContextCompressor()
 
-        # Initialize vectorstore
-        self.vectorstore = None
+        # Vectorstore handles, opened lazily (LRU of open collections)
+        self._client = None
+        self._stores = OrderedDict()
+        self._partitions = None
+        self._stores_lock = threading.Lock()
+        self._index_checked = False
+
+        # Submission-level index kept in sync with the collection
+        self.submission_index = SubmissionIndex(os.path.join(self.persist_directory, "submission_index.sqlite3"))
+        # Character n-gram BM25 index over the same chunks (used by hybrid/lexical search)
+        self.lexical_index = LexicalIndex(os.path.join(self.persist_directory, "lexical_index.sqlite3"))
+        # Query results, invalidated per filter by the writes below
+        self.retrieval_cache = None
+        if use_retrieval_cache:
+            self.retrieval_cache = RetrievalCache(os.path.join(self.persist_directory, "retrieval_cache.sqlite3"),
+                                                  max_entries=retrieval_cache_size, shared=share_retrieval_cache)
+
+        # Question answering: compiled chains per filter (LRU) and their answers
+        self._rag_chains = OrderedDict()
+        self._rag_chains_lock = threading.Lock()
+        self.qa_chain_cache_size = max(1, qa_chain_cache_size)
+        self.qa_k = 4
+        # Keys carry the filter's generation, so answers need the retrieval cache's counters
+        self.answer_cache = None
+        if qa_answer_cache_size > 0 and self.retrieval_cache is not None:
+            self.answer_cache = ResponseCache(max_entries=qa_answer_cache_size, ttl=qa_answer_cache_ttl)
 
         # Text splitter
         self.text_splitter = CharacterTextSplitter(
@@ -55,16 +299,194 @@ class RAGPipeline:
             length_function=len
         )
 
-    def get_vectorstore(self, collection_name: str = "submissions_collection"):
-        if self.vectorstore is not None:
-            return self.vectorstore
+    def get_vectorstore(self, collection_name: Optional[str] = None):
+        """
+        Open a vectorstore collection (the main, unpartitioned one by default).
+
+        Handles are kept in an LRU of at most max_open_collections.
+        """
+        store = self._store(collection_name or self.collection_name)
+
+        # Stores created before the indexes existed: build them once from the collections
+        if not self._index_checked:
+            self._index_checked = True
+            if any(self._store(name)._collection.count() > 0 for name in self._partition_names()):
+                if self.submission_index.is_empty():
+                    self.rebuild_submission_index()
+                if self.lexical_index.is_empty():
+                    self.rebuild_lexical_index()
+        return store
 
-        self.vectorstore = Chroma(
-            collection_name=collection_name,
-            persist_directory=self.persist_directory,
-            embedding_function=self.embeddings
-        )
-        return self.vectorstore
+    def _chroma_client(self):
+        if self._client is None:
+            # chromadb is slow to import; only pay for it when the store is opened
+            import chromadb
+            self._client = chromadb.PersistentClient(path=self.persist_directory)
+        return self._client
+
+    @property
+    def numpy_directory(self) -> str:
+        return os.path.join(self.persist_directory, "numpy_vectors")
+
+    def _open_store(self, name: str, backend: str):
+        if backend == "numpy":
+            return NumpyVectorStore(self.numpy_directory, name, self.embeddings, **self.vector_layout)
+
+        from langchain_chroma import Chroma
+
+        return Chroma(client=self._chroma_client(), collection_name=name, embedding_function=self.embeddings)
+
+    def _list_collections(self, backend: Optional[str] = None) -> List[str]:
+        if (backend or self.backend) == "numpy":
+            return numpy_vectorstore.list_collections(self.numpy_directory)
+        return [c if isinstance(c, str) else c.name for c in self._chroma_client().list_collections()]
+
+    def _drop_collection(self, name: str, backend: Optional[str] = None):
+        backend = backend or self.backend
+        if backend == "numpy":
+            numpy_vectorstore.delete_collection(self.numpy_directory, name)
+        else:
+            self._chroma_client().delete_collection(name)
+        if backend == self.backend:
+            with self._stores_lock:
+                self._stores.pop(name, None)
+                if self._partitions is not None:
+                    self._partitions.discard(name)
+
+    def _store(self, name: str):
+        with self._stores_lock:
+            store = self._stores.get(name)
+            if store is not None:
+                self._stores.move_to_end(name)
+                return store
+
+        store = self._open_store(name, self.backend)
+        with self._stores_lock:
+            self._stores[name] = store
+            self._stores.move_to_end(name)
+            while len(self._stores) > self.max_open_collections:
+                self._stores.popitem(last=False)
+            if self._partitions is not None:
+                self._partitions.add(name)
+        return store
+
+    def partition_for(self, metadata: Optional[Dict]) -> str:
+        """Collection a chunk with this metadata belongs to."""
+        if self.partitioning == "none":
+            return self.collection_name
+        metadata = metadata or {}
+        name = f"{self.collection_name}__{partition_slug(metadata.get('assignment_id'))}"
+        if self.partitioning == "assignment_type":
+            name += f"__{partition_slug(metadata.get('type'))}"
+        return name
+
+    def _partition_names(self, prefix: Optional[str] = None, refresh: bool = False) -> List[str]:
+        """Existing collections of this pipeline's layout, optionally limited to a name prefix."""
+        if self.partitioning == "none":
+            return [self.collection_name]
+        with self._stores_lock:
+            known = self._partitions
+        if known is None or refresh:
+            # Other processes may have created partitions since we last looked
+            known = set(self._list_collections())
+            with self._stores_lock:
+                self._partitions = known
+        prefix = prefix or f"{self.collection_name}__"
+        return sorted(name for name in known if name.startswith(prefix))
+
+    def _route(self, filter_dict: Optional[Dict]) -> Tuple[List[str], Optional[Dict]]:
+        """
+        Collections that can hold chunks matching filter_dict, and the part of
+        the filter still to apply inside them.
+        """
+        filter_dict = dict(filter_dict or {})
+        if self.partitioning == "none":
+            return [self.collection_name], filter_dict or None
+
+        assignment_id = filter_dict.get("assignment_id")
+        if assignment_id is None or isinstance(assignment_id, dict):
+            return self._partition_names(), filter_dict or None
+        del filter_dict["assignment_id"]
+        prefix = f"{self.collection_name}__{partition_slug(assignment_id)}"
+
+        doc_type = filter_dict.get("type")
+        if self.partitioning == "assignment_type" and doc_type is not None and not isinstance(doc_type, dict):
+            del filter_dict["type"]
+            target = f"{prefix}__{partition_slug(doc_type)}"
+            names = [target] if target in self._partition_names(target) else []
+            if not names and target in self._partition_names(target, refresh=True):
+                names = [target]
+            return names, filter_dict or None
+
+        if self.partitioning == "assignment_type":
+            prefix += "__"
+        names = [n for n in self._partition_names(prefix) if self.partitioning != "assignment" or n == prefix]
+        if not names:
+            names = [n for n in self._partition_names(prefix, refresh=True)
+                     if self.partitioning != "assignment" or n == prefix]
+        return names, filter_dict or None
+
+    def partition_stats(self) -> Dict[str, int]:
+        """Chunk count per collection of the current layout."""
+        return {name: self._store(name)._collection.count() for name in self._partition_names(refresh=True)}
+
+    def rebuild_submission_index(self, page_size: int = 5000) -> int:
+        """
+        Rebuild the submission index from the chunk metadata stored in Chroma.
+
+        Args:
+            page_size: Chunks fetched per page (metadata only, no documents or vectors)
+
+        Returns:
+            Number of submissions indexed
+        """
+        submissions = {}
+        for name in self._partition_names(refresh=True):
+            collection = self._store(name)._collection
+            offset = 0
+            while True:
+                page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+                metadatas = page.get("metadatas") or []
+                for meta in metadatas:
+                    if meta and "submission_id" in meta:
+                        entry = submissions.setdefault(meta["submission_id"], [meta, 0])
+                        entry[1] += 1
+                if len(metadatas) < page_size:
+                    break
+                offset += page_size
+
+        self.submission_index.clear()
+        self.submission_index.add_many([
+            (submission_id, {k: v for k, v in meta.items() if k != "submission_id"}, count)
+            for submission_id, (meta, count) in submissions.items()
+        ])
+        print(f"Rebuilt submission index: {len(submissions)} submissions")
+        return len(submissions)
+
+    def rebuild_lexical_index(self, page_size: int = 1000) -> int:
+        """
+        Rebuild the BM25 n-gram index from the chunks stored in the vectorstore.
+
+        Returns:
+            Number of chunks indexed
+        """
+        self.lexical_index.clear()
+        total = 0
+        for name in self._partition_names(refresh=True):
+            collection = self._store(name)._collection
+            offset = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                ids = page["ids"]
+                self.lexical_index.add(ids, page["documents"], page["metadatas"])
+                total += len(ids)
+                if len(ids) < page_size:
+                    break
+                offset += page_size
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.invalidate_all()
+        print(f"Rebuilt lexical index: {total} chunks")
+        return total
 
     def add_submission(self,
                        submission_id: str,
@@ -78,41 +500,225 @@ class RAGPipeline:
             content: Submission text content
             metadata: Additional metadata (student_id, assignment_id, type, etc.)
         """
-        vs = self.get_vectorstore()
+        self.get_vectorstore()
+        vs = self._store(self.partition_for(metadata))
 
+        # Split text into chunks carrying submission_id + your metadata
+        texts = self._split_submission(submission_id, content, metadata)
 
-        # Split text into chunks
-        texts = self.text_splitter.create_documents([content])
+        # Save to vectorstore
+        with ai_telemetry.track("embedding", "add_documents", self.embedding_model,
+                                prompt_tokens=sum(estimate_tokens(doc.page_content) for doc in texts)):
+            ids = vs.add_documents(texts, ids=[str(uuid.uuid4()) for _ in texts])
+        self.lexical_index.add(ids, [doc.page_content for doc in texts], [doc.metadata for doc in texts])
+        self.submission_index.add(submission_id, metadata, len(texts))
+        self._invalidate_cached([doc.metadata for doc in texts])
+
+        return True
+
+    def upsert_submission(self,
+                          submission_id: str,
+                          content: str,
+                          metadata: Optional[Dict] = None) -> Dict:
+        """
+        Index a submission idempotently.
+
+        Chunk IDs are content hashes, so re-indexing the same submission_id only
+        embeds new or changed chunks, deletes chunks that disappeared and
+        refreshes metadata on the unchanged ones.
+
+        Args:
+            submission_id: Stable identifier (see keys.stable_submission_id)
+            content: Submission text content
+            metadata: Additional metadata (student_id, assignment_id, type, etc.)
+
+        Returns:
+            Counts of added, removed and unchanged chunks
+        """
+        return self.upsert_submissions([{"submission_id": submission_id, "content": content,
+                                         "metadata": metadata}])
+
+    def upsert_submissions(self, submissions: List[Dict]) -> Dict:
+        """
+        Idempotently index several submissions, embedding all of their new or
+        changed chunks in one batched request (see upsert_submission).
+
+        Args:
+            submissions: List of dicts with keys: submission_id, content, metadata
+
+        Returns:
+            Counts of added, removed and unchanged chunks over all submissions
+        """
+        self.get_vectorstore()
+        new_ids, new_docs, index_rows, touched = [], [], [], []
+        counts = {"added": 0, "removed": 0, "unchanged": 0}
+        for sub in submissions:
+            submission_id, metadata = sub["submission_id"], sub.get("metadata")
+            target = self.partition_for(metadata)
+            collection = self._store(target)._collection
+
+            # Moved to another assignment/type: drop the chunks from the old partition
+            previous = self.submission_index.get(submission_id)
+            if previous is not None and self.partition_for(previous) != target:
+                for name in self._route({"assignment_id": previous["assignment_id"], "type": previous["type"]})[0]:
+                    old = self._store(name)._collection
+                    touched.extend(old.get(where={"submission_id": submission_id}, include=["metadatas"],
+                                           limit=1)["metadatas"])
+                    old.delete(where={"submission_id": submission_id})
 
-        # Add submission_id + your metadata directly to the Document objects
+            docs = self._split_submission(submission_id, sub["content"], metadata)
+            ids = chunk_ids(submission_id, [doc.page_content for doc in docs])
+            page = collection.get(where={"submission_id": submission_id}, include=["metadatas"])
+            existing = dict(zip(page["ids"], page["metadatas"]))
+
+            kept = [(chunk_id, doc) for chunk_id, doc in zip(ids, docs) if chunk_id in existing]
+            stale = list(set(existing) - set(ids))
+            # Unchanged text and metadata leaves every cached result valid
+            if stale or any(existing[chunk_id] != doc.metadata for chunk_id, doc in kept):
+                touched.extend(existing.values())
+                touched.extend(doc.metadata for _, doc in kept)
+            for chunk_id, doc in zip(ids, docs):
+                if chunk_id not in existing:
+                    new_ids.append(chunk_id)
+                    new_docs.append(doc)
+                    counts["added"] += 1
+
+            if kept:
+                collection.update(ids=[chunk_id for chunk_id, _ in kept],
+                                  metadatas=[doc.metadata for _, doc in kept])
+                self.lexical_index.update_metadata([chunk_id for chunk_id, _ in kept],
+                                                   [doc.metadata for _, doc in kept])
+            if stale:
+                collection.delete(ids=stale)
+                self.lexical_index.delete(stale)
+            counts["removed"] += len(stale)
+            counts["unchanged"] += len(kept)
+            index_rows.append((submission_id, metadata, len(ids)))
+
+        if new_docs:
+            embeddings = self._embed_batch([doc.page_content for doc in new_docs])
+            self._write_embedded(new_docs, embeddings, ids=new_ids)
+        for submission_id, metadata, chunk_count in index_rows:
+            self.submission_index.set(submission_id, metadata, chunk_count)
+        self._invalidate_cached(touched)
+        return counts
+
+    def _split_submission(self,
+                          submission_id: str,
+                          content: str,
+                          metadata: Optional[Dict] = None):
+        """Split a submission into Documents carrying its metadata."""
+        texts = self.text_splitter.create_documents([content])
         for doc in texts:
             doc.metadata = doc.metadata or {}
             doc.metadata.update(metadata or {})
             doc.metadata["submission_id"] = submission_id
+        return texts
 
-        # Save to vectorstore
-        vs.add_documents(texts)
-
-        return True
-
-    def add_multiple_submissions(self, submissions: List[Dict]):
+    def add_multiple_submissions(self,
+                                 submissions: List[Dict],
+                                 batch_size: Optional[int] = None,
+                                 max_concurrency: Optional[int] = None,
+                                 write_batch_size: int = 4096) -> Dict:
         """
-        Batch add multiple submissions.
+        Bulk add multiple submissions.
+
+        All submissions are split up front, chunks are embedded in large batches
+        with bounded concurrency, and the vectors are written to Chroma in a few
+        large add calls.
 
         Args:
             submissions: List of dicts with keys: submission_id, content, metadata
+            batch_size: Chunks per embeddings request (defaults to embed_batch_size)
+            max_concurrency: Embeddings requests in flight (defaults to embed_concurrency)
+            write_batch_size: Chunks per Chroma add call
+
+        Returns:
+            Throughput stats: submissions, chunks, requests, seconds, chunks_per_sec
         """
+        batch_size = batch_size or self.embed_batch_size
+        max_concurrency = max_concurrency or self.embed_concurrency
+        start = time.perf_counter()
+
+        # 1. Split everything up front
+        docs = []
+        index_rows = []
         for sub in submissions:
-            self.add_submission(
-                submission_id=sub['submission_id'],
-                content=sub['content'],
-                metadata=sub.get('metadata', {})
-            )
+            sub_docs = self._split_submission(sub['submission_id'], sub['content'], sub.get('metadata', {}))
+            docs.extend(sub_docs)
+            index_rows.append((sub['submission_id'], sub.get('metadata') or {}, len(sub_docs)))
+
+        # 2. Embed in large batches, a bounded number of requests at a time
+        texts = [doc.page_content for doc in docs]
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        embeddings = []
+        if batches:
+            # Batches run in copies of the caller's context (rate-limit lane, AI log submission)
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, self._embed_batch, batch)
+                           for batch in batches]
+                for vectors in (f.result() for f in futures):
+                    embeddings.extend(vectors)
+
+        # 3. Write to Chroma in a few large calls
+        self._write_embedded(docs, embeddings, write_batch_size=write_batch_size)
+        self.submission_index.add_many(index_rows)
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            "submissions": len(submissions),
+            "chunks": len(docs),
+            "requests": len(batches),
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(len(docs) / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        print(f"Bulk ingestion: {stats['chunks']} chunks from {stats['submissions']} submissions "
+              f"in {stats['requests']} embedding requests, {stats['chunks_per_sec']} chunks/sec")
+        return stats
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch of chunk texts (a single embeddings request)."""
+        with ai_telemetry.track("embedding", "embed_documents", self.embedding_model,
+                                prompt_tokens=sum(estimate_tokens(t) for t in texts)):
+            return self.embeddings.embed_documents(texts, chunk_size=len(texts))
+
+    def _write_embedded(self,
+                        docs,
+                        embeddings: List[List[float]],
+                        ids: Optional[List[str]] = None,
+                        write_batch_size: int = 4096):
+        """Write already-embedded Documents straight to their collection(s)."""
+        if not docs:
+            return
+        self.get_vectorstore()
+        ids = ids or [str(uuid.uuid4()) for _ in docs]
+
+        groups = {}
+        for chunk_id, doc, vector in zip(ids, docs, embeddings):
+            group = groups.setdefault(self.partition_for(doc.metadata), ([], [], []))
+            group[0].append(chunk_id)
+            group[1].append(doc)
+            group[2].append(vector)
+
+        self.lexical_index.add(ids, [doc.page_content for doc in docs], [doc.metadata for doc in docs])
+        for name, (group_ids, group_docs, group_vectors) in groups.items():
+            collection = self._store(name)._collection
+            for i in range(0, len(group_docs), write_batch_size):
+                collection.upsert(
+                    ids=group_ids[i:i + write_batch_size],
+                    embeddings=group_vectors[i:i + write_batch_size],
+                    metadatas=[doc.metadata for doc in group_docs[i:i + write_batch_size]],
+                    documents=[doc.page_content for doc in group_docs[i:i + write_batch_size]],
+                )
+        self._invalidate_cached(doc.metadata for doc in docs)
 
     def query_similar_submissions(self,
                                   query: str,
                                   k: int = 4,
-                                  filter_dict: Optional[Dict] = None):
+                                  filter_dict: Optional[Dict] = None,
+                                  search_mode: Optional[str] = None,
+                                  fetch_k: Optional[int] = None,
+                                  rrf_k: int = 60):
         """
         Query for similar submission content.
 
@@ -120,36 +726,202 @@ class RAGPipeline:
             query: Query text
             k: Number of results to return
             filter_dict: Metadata filters (e.g., {'assignment_id': 'assign_1', 'type': 'reference'})
+            search_mode: Override the pipeline's search_mode
+            fetch_k: Hits fetched from each retriever before hybrid fusion (default 2 * k)
+            rrf_k: Rank-fusion damping constant
 
         Returns:
             List of documents
         """
-        vs = self.get_vectorstore()
+        search_mode = search_mode or self.search_mode
+        return self._cached(query, k, filter_dict,
+                            lambda: self._query_similar(query, k, filter_dict, search_mode, fetch_k, rrf_k),
+                            search="similar", search_mode=search_mode, fetch_k=fetch_k, rrf_k=rrf_k)
 
-        if filter_dict:
-            results = vs.similarity_search(query, k=k, filter=filter_dict)
-        else:
-            results = vs.similarity_search(query, k=k)
+    def _query_similar(self, query: str, k: int, filter_dict: Optional[Dict], search_mode: str,
+                       fetch_k: Optional[int], rrf_k: int) -> List[Document]:
+        if search_mode == "lexical":
+            return self.query_lexical(query, k=k, filter_dict=filter_dict)
+        self.get_vectorstore()
+        fetch_k = fetch_k or (2 * k if search_mode == "hybrid" else k)
+
+        with ai_telemetry.track("retrieval", "similarity_search", self.embedding_model,
+                                prompt_tokens=estimate_tokens(query)):
+            hits = self._search([self.embeddings.embed_query(query)], fetch_k, filter_dict)[0]
+
+        ranked = [hits]
+        if search_mode == "hybrid":
+            ranked.append(self._search_lexical([query], fetch_k, filter_dict)[0])
+        return self._fuse(ranked, k, rrf_k)
+
+    def query_lexical(self, query: str, k: int = 4, filter_dict: Optional[Dict] = None) -> List[Document]:
+        """
+        BM25 search over character n-grams; local only, no embeddings request.
+
+        Args:
+            query: Query text
+            k: Number of results to return
+            filter_dict: Metadata filters
+
+        Returns:
+            List of documents, best first
+        """
+        self.get_vectorstore()
+        hits = self._search_lexical([query], k, filter_dict)[0]
+        return [Document(page_content=text, metadata=metadata) for _, text, metadata, _ in hits]
+
+    def _search_lexical(self, queries: List[str], k: int, filter_dict: Optional[Dict]) -> List[List[Tuple]]:
+        """Per query, up to k (id, text, metadata, score) tuples from the BM25 index, best first."""
+        with ai_telemetry.track("retrieval", "lexical_search", "bm25"):
+            return [self.lexical_index.search(query, k=k, filter_dict=filter_dict) for query in queries]
+
+    @staticmethod
+    def _fuse(ranked_lists: List[List[Tuple]], k: int, rrf_k: int = 60) -> List[Document]:
+        """
+        Reciprocal rank fusion of (id, text, metadata, ...) hit lists.
+
+        A chunk found by several lists (queries or retrievers) ranks higher;
+        ties keep the order of first appearance.
+        """
+        fused = {}
+        for hits in ranked_lists:
+            for rank, (chunk_id, text, metadata, _) in enumerate(hits):
+                entry = fused.get(chunk_id)
+                if entry is None:
+                    entry = fused[chunk_id] = {"score": 0.0, "order": len(fused), "text": text,
+                                               "metadata": metadata or {}}
+                entry["score"] += 1.0 / (rrf_k + rank + 1)
+
+        best = sorted(fused.values(), key=lambda e: (-e["score"], e["order"]))[:k]
+        return [Document(page_content=e["text"], metadata=e["metadata"]) for e in best]
+
+    def _search(self, vectors: List[List[float]], k: int, filter_dict: Optional[Dict]) -> List[List[Tuple]]:
+        """
+        Nearest chunks for each query vector across the routed collections.
+
+        Returns:
+            Per query, up to k (id, text, metadata, distance) tuples, nearest first
+        """
+        names, where = self._route(filter_dict)
+        per_query = [[] for _ in vectors]
+        for name in names:
+            result = self._store(name)._collection.query(query_embeddings=vectors,
+                                                         n_results=k,
+                                                         where=chroma_where(where),
+                                                         include=["documents", "metadatas", "distances"])
+            for hits, ids, documents, metadatas, distances in zip(per_query, result["ids"], result["documents"],
+                                                                  result["metadatas"], result["distances"]):
+                hits.extend(zip(ids, documents, metadatas, distances))
+        if len(names) > 1:
+            per_query = [sorted(hits, key=lambda hit: hit[3])[:k] for hits in per_query]
+        return per_query
 
-        return results
+    def query_multi(self,
+                    queries: List[str],
+                    k: int = 4,
+                    filter_dict: Optional[Dict] = None,
+                    fetch_k: Optional[int] = None,
+                    rrf_k: int = 60,
+                    search_mode: Optional[str] = None) -> List[Document]:
+        """
+        Search with several queries at once and fuse the hits.
+
+        All queries are embedded in one batched request and searched in a single
+        collection query; hits are merged with reciprocal rank fusion (a chunk
+        found by several queries ranks higher) and deduplicated under one k.
+        In hybrid mode each query's BM25 hits join the fusion; in lexical mode
+        nothing is embedded.
+
+        Args:
+            queries: Query texts (e.g. the essay's paragraphs)
+            k: Number of fused results to return
+            filter_dict: Metadata filters
+            fetch_k: Hits fetched per query before fusion (default k)
+            rrf_k: Rank-fusion damping constant
+            search_mode: Override the pipeline's search_mode
+
+        Returns:
+            List of documents, best first
+        """
+        queries = [q for q in queries if q and q.strip()]
+        if not queries:
+            return []
+        search_mode = search_mode or self.search_mode
+        return self._cached(queries, k, filter_dict,
+                            lambda: self._query_multi(queries, k, filter_dict, fetch_k, rrf_k, search_mode),
+                            search="multi", search_mode=search_mode, fetch_k=fetch_k, rrf_k=rrf_k)
+
+    def _query_multi(self, queries: List[str], k: int, filter_dict: Optional[Dict], fetch_k: Optional[int],
+                     rrf_k: int, search_mode: str) -> List[Document]:
+        self.get_vectorstore()
+
+        ranked = []
+        if search_mode != "lexical":
+            with ai_telemetry.track("retrieval", "multi_query", self.embedding_model,
+                                    prompt_tokens=sum(estimate_tokens(q) for q in queries)):
+                vectors = self.embeddings.embed_documents(queries, chunk_size=len(queries))
+                ranked.extend(self._search(vectors, fetch_k or k, filter_dict))
+        if search_mode != "vector":
+            ranked.extend(self._search_lexical(queries, fetch_k or k, filter_dict))
+        return self._fuse(ranked, k, rrf_k)
+
+    def _cached(self, query, k: int, filter_dict: Optional[Dict], compute: Callable[[], List[Document]],
+                **options) -> List[Document]:
+        """Run compute() through the retrieval cache (directly when it is disabled)."""
+        if self.retrieval_cache is None:
+            return compute()
+        return self.retrieval_cache.get_or_compute(query, k, filter_dict, compute, **options)
+
+    def _invalidate_cached(self, metadatas):
+        """
+        Expire cached results of every filter matched by these chunk metadatas.
+        Called after the write, so a search racing it can only cache under the old generation.
+        """
+        if self.retrieval_cache is None:
+            return
+        unique = {}
+        for metadata in metadatas:
+            unique.setdefault(canonical_filter(metadata), metadata or {})
+        if unique:
+            self.retrieval_cache.invalidate(list(unique.values()))
 
     def get_context_for_submission(self,
                                    query: str,
                                    k: int = 3,
-                                   filter_dict: Optional[Dict] = None) -> str:
+                                   filter_dict: Optional[Dict] = None,
+                                   compress_against: Optional[str] = None,
+                                   mode: Optional[str] = None,
+                                   search_mode: Optional[str] = None) -> str:
         """
         Retrieve relevant context as formatted string.
 
         Args:
-            query: Query to find relevant context
+            query: Query to find relevant context (may be a whole essay in 'multi' mode)
             k: Number of context chunks
             filter_dict: Metadata filters
+            compress_against: Text the compressor ranks sentences against (e.g. the
+                whole essay); defaults to the query
+            mode: Override the pipeline's retrieval_mode
+            search_mode: Override the pipeline's search_mode ('lexical' needs no network call)
 
         Returns:
             Formatted context string
         """
-        docs = self.query_similar_submissions(query, k=k, filter_dict=filter_dict)
-        return "\n\n".join([doc.page_content for doc in docs])
+        if (mode or self.retrieval_mode) == 'multi':
+            docs = self.query_multi(split_essay_queries(query), k=k, filter_dict=filter_dict,
+                                    search_mode=search_mode)
+        else:
+            docs = self.query_similar_submissions(query, k=k, filter_dict=filter_dict, search_mode=search_mode)
+        context = "\n\n".join([doc.page_content for doc in docs])
+        return self.compress_context(compress_against or query, context)
+
+    def compress_context(self, query: str, context: str) -> str:
+        """Keep the parts of context most relevant to query (local; no-op without a compressor)."""
+        if self.context_compressor is not None and context:
+            compressed = self.context_compressor.compress(query, context)
+            print(f"Context compressed: {len(context)} -> {len(compressed)} chars")
+            context = compressed
+        return context
 
     def build_rag_chain(self, filter_dict: Optional[Dict] = None):
         """
@@ -161,37 +933,88 @@ class RAGPipeline:
         Returns:
             Runnable RAG chain
         """
-        vs = self.get_vectorstore()
-        search_kwargs = {'k': 4}
-        if filter_dict:
-            search_kwargs['filter'] = filter_dict
-
-        retriever = vs.as_retriever(search_kwargs=search_kwargs)
+        # Routed like every other query, so partitioned stores work too
+        retriever = RunnableLambda(
+            lambda query: self.query_similar_submissions(query, k=self.qa_k, filter_dict=filter_dict))
 
         def format_docs(docs):
             return "\n\n".join(doc.page_content for doc in docs)
 
-        prompt_template = """Use the context below to answer the question about student submissions. 
-        If the context doesn't contain enough information, reply that you don't know.
-
-        Context:
-        {context}
-
-        Question:
-        {query}
-
-        Answer:"""
-
-        custom_rag_prompt = PromptTemplate.from_template(prompt_template)
-
         rag_chain = (
                 {"context": retriever | format_docs, "query": RunnablePassthrough()}
-                | custom_rag_prompt
+                | QA_PROMPT
                 | self.llm
                 | StrOutputParser()
         )
         return rag_chain
 
+    def get_rag_chain(self, filter_dict: Optional[Dict] = None):
+        """The compiled RAG chain for this filter, built on first use and kept in an LRU."""
+        key = canonical_filter(filter_dict)
+        with self._rag_chains_lock:
+            chain = self._rag_chains.get(key)
+            if chain is not None:
+                self._rag_chains.move_to_end(key)
+                return chain
+        chain = self.build_rag_chain(dict(filter_dict) if filter_dict else None)
+        with self._rag_chains_lock:
+            chain = self._rag_chains.setdefault(key, chain)
+            self._rag_chains.move_to_end(key)
+            while len(self._rag_chains) > self.qa_chain_cache_size:
+                self._rag_chains.popitem(last=False)
+        return chain
+
+    def _answer_key(self, question: str, filter_dict: Optional[Dict]) -> Optional[str]:
+        """
+        Answer-cache key for (question, filter, filter generation), or None when
+        answers are not cached. Read before retrieval, so an answer computed
+        while a write lands is stored under the old generation.
+        """
+        if self.answer_cache is None:
+            return None
+        scope = f"{canonical_filter(filter_dict)}|{self.retrieval_cache.generation(filter_dict)}|k={self.qa_k}"
+        return ResponseCache.make_key(self.llm_model, getattr(self.llm, "temperature", None), QA_CHAIN_NAME,
+                                      normalize_text(question), scope)
+
+    def answer_question(self, question: str, filter_dict: Optional[Dict] = None) -> str:
+        """
+        Answer a question about the submissions matching filter_dict.
+
+        Args:
+            question: Question text (e.g. "Which students confuse は and が?")
+            filter_dict: Metadata filters (e.g. one task's student submissions)
+
+        Returns:
+            Answer text (cached until a submission matching the filter changes)
+        """
+        return "".join(self.stream_answer(question, filter_dict))
+
+    def stream_answer(self, question: str, filter_dict: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Like answer_question, but yields the answer as the model generates it.
+
+        A cached answer is yielded as one piece. An answer is only cached when
+        the stream is read to the end.
+        """
+        key = self._answer_key(question, filter_dict)
+        with ai_telemetry.track("llm", QA_CHAIN_NAME, self.llm_model,
+                                prompt_tokens=estimate_tokens(question)) as record:
+            cached = self.answer_cache.get(QA_CHAIN_NAME, key) if key is not None else None
+            if cached is not None:
+                record.update(cache_hit=True, completion_tokens=estimate_tokens(cached), response=cached)
+                yield cached
+                return
+
+            start = time.perf_counter()
+            parts = []
+            for piece in self.get_rag_chain(filter_dict).stream(question):
+                parts.append(piece)
+                yield piece
+            answer = "".join(parts)
+            record.update(completion_tokens=estimate_tokens(answer), response=answer)
+            if key is not None:
+                self.answer_cache.put(QA_CHAIN_NAME, key, answer, latency=time.perf_counter() - start)
+
     def delete_submission(self, submission_id: str):
         """
         Delete a submission from vectorstore.
@@ -199,39 +1022,224 @@ class RAGPipeline:
         Args:
             submission_id: ID of submission to delete
         """
-        vs = self.get_vectorstore()
+        self.get_vectorstore()
+        row = self.submission_index.get(submission_id)
+        if row is not None:
+            names = self._route({"assignment_id": row["assignment_id"], "type": row["type"]})[0]
+        else:
+            names = self._partition_names(refresh=True)
         # Delete by metadata filter
-        vs.delete(where={"submission_id": submission_id})
+        touched = []
+        for name in names:
+            collection = self._store(name)._collection
+            touched.extend(collection.get(where={"submission_id": submission_id}, include=["metadatas"],
+                                          limit=1)["metadatas"])
+            collection.delete(where={"submission_id": submission_id})
+        self.lexical_index.delete(submission_id=submission_id)
+        self.submission_index.delete(submission_id)
+        self._invalidate_cached(touched)
         return True
 
-    def list_submissions(self, filter_dict: Optional[Dict] = None) -> List[str]:
+    def compact_submissions(self,
+                            resolve_id: Optional[Callable[[Dict], Optional[str]]] = None,
+                            page_size: int = 5000) -> Dict:
         """
-        List all submission IDs in the vectorstore.
+        One-off cleanup of duplicate student submissions left by append-only indexing.
+
+        Student submissions are grouped by (student_id, assignment_id). Only the
+        newest one (by timestamp metadata) in each group is kept. Its chunks are
+        moved to content-hash IDs under resolve_id(metadata) when that returns a
+        stable id. Vectors are copied, so nothing is re-embedded.
+
+        Args:
+            resolve_id: Maps a chunk's metadata to its stable submission_id (or None to keep the id)
+            page_size: Chunks fetched per page while scanning
+
+        Returns:
+            Counts of submissions removed, submissions re-keyed and chunks deleted
+        """
+        self.get_vectorstore()
+        stats = {"submissions_removed": 0, "submissions_rekeyed": 0, "chunks_deleted": 0}
+        # Groups are per assignment, so they never span partitions
+        for name in self._partition_names(refresh=True):
+            for key, value in self._compact_collection(self._store(name)._collection, resolve_id, page_size).items():
+                stats[key] += value
+
+        self.rebuild_submission_index(page_size=page_size)
+        # Survivors were re-keyed to new chunk ids
+        self.rebuild_lexical_index()
+        print(f"Compaction: {stats}")
+        return stats
+
+    def _compact_collection(self, collection, resolve_id, page_size: int) -> Dict:
+        # 1. Scan metadata only and find the newest submission per group
+        latest = {}
+        groups = {}
+        offset = 0
+        while True:
+            page = collection.get(where={"type": "student_submission"}, include=["metadatas"],
+                                  limit=page_size, offset=offset)
+            for meta in page["metadatas"]:
+                if not meta or "submission_id" not in meta:
+                    continue
+                group = (meta.get("student_id"), meta.get("assignment_id"))
+                groups.setdefault(group, {})[meta["submission_id"]] = meta
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+
+        for group, submissions in groups.items():
+            latest[group] = max(submissions.items(), key=lambda item: str(item[1].get("timestamp", "")))
+
+        # 2. Drop superseded submissions
+        removed = 0
+        chunks_deleted = 0
+        for group, submissions in groups.items():
+            keep_id = latest[group][0]
+            for submission_id in submissions:
+                if submission_id != keep_id:
+                    chunks_deleted += len(collection.get(where={"submission_id": submission_id}, include=[])["ids"])
+                    collection.delete(where={"submission_id": submission_id})
+                    removed += 1
+
+        # 3. Move the survivors to stable, content-hash chunk IDs
+        rekeyed = 0
+        if resolve_id is not None:
+            for keep_id, meta in latest.values():
+                new_id = resolve_id(meta)
+                if not new_id or new_id == keep_id:
+                    continue
+                old = collection.get(where={"submission_id": keep_id},
+                                     include=["documents", "metadatas", "embeddings"])
+                if not old["ids"]:
+                    continue
+                # Replace any chunks already indexed under the stable id
+                collection.delete(where={"submission_id": new_id})
+                metadatas = [dict(m, submission_id=new_id) for m in old["metadatas"]]
+                collection.upsert(
+                    ids=chunk_ids(new_id, old["documents"]),
+                    embeddings=old["embeddings"],
+                    metadatas=metadatas,
+                    documents=old["documents"],
+                )
+                collection.delete(ids=old["ids"])
+                rekeyed += 1
+
+        return {"submissions_removed": removed, "submissions_rekeyed": rekeyed, "chunks_deleted": chunks_deleted}
+
+    def repartition(self,
+                    source_collections: Optional[List[str]] = None,
+                    page_size: int = 1000,
+                    delete_source: bool = False,
+                    source_backend: Optional[str] = None) -> Dict:
+        """
+        Move existing chunks into this pipeline's collection layout without re-embedding.
+
+        Chunks are copied with their stored vectors and ids, so the run is
+        idempotent and can be repeated after an interruption. By default a
+        partitioned pipeline reads the single main collection, and an
+        unpartitioned one gathers every partition back into it. With
+        source_backend set, every collection of that backend is copied into
+        this pipeline's backend instead (e.g. Chroma -> numpy).
+
+        Args:
+            source_collections: Collections to read (default: the other layout's collections)
+            page_size: Chunks copied per page
+            delete_source: Drop each source collection once it is fully copied
+            source_backend: Backend to read from (default: this pipeline's backend)
+
+        Returns:
+            Counts of source collections, chunks copied and target partitions
+        """
+        source_backend = source_backend or self.backend
+        if source_backend not in BACKENDS:
+            raise ValueError(f"Unknown vectorstore backend: {source_backend}")
+        same_backend = source_backend == self.backend
+        existing = set(self._list_collections(source_backend))
+        if source_collections is None:
+            if not same_backend:
+                source_collections = sorted(n for n in existing if n == self.collection_name
+                                            or n.startswith(f"{self.collection_name}__"))
+            elif self.partitioning == "none":
+                source_collections = sorted(n for n in existing if n.startswith(f"{self.collection_name}__"))
+            else:
+                source_collections = [self.collection_name] if self.collection_name in existing else []
+
+        copied = 0
+        targets = set()
+        for source in source_collections:
+            collection = (self._store(source) if same_backend
+                          else self._open_store(source, source_backend))._collection
+            offset = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas", "embeddings"],
+                                      limit=page_size, offset=offset)
+                if not len(page["ids"]):
+                    break
+                groups = {}
+                for chunk_id, text, metadata, vector in zip(page["ids"], page["documents"],
+                                                            page["metadatas"], page["embeddings"]):
+                    group = groups.setdefault(self.partition_for(metadata), ([], [], [], []))
+                    for part, value in zip(group, (chunk_id, text, metadata, vector)):
+                        part.append(value)
+                for name, (ids, texts, metadatas, vectors) in groups.items():
+                    if same_backend and name == source:
+                        continue
+                    self._store(name)._collection.upsert(ids=ids, documents=texts,
+                                                         metadatas=metadatas, embeddings=vectors)
+                    copied += len(ids)
+                    targets.add(name)
+                offset += len(page["ids"])
+                print(f"Repartition {source}: {offset} chunks read, {copied} copied")
+
+            if delete_source and not (same_backend and source in targets):
+                self._drop_collection(source, source_backend)
+
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.invalidate_all()
+        stats = {"sources": len(source_collections), "chunks_copied": copied, "partitions": len(targets)}
+        print(f"Repartition: {stats}")
+        return stats
+
+    def list_submissions(self,
+                         filter_dict: Optional[Dict] = None,
+                         limit: Optional[int] = None,
+                         offset: int = 0) -> List[str]:
+        """
+        List submission IDs in the vectorstore.
+
+        Served from the submission index, so only matching rows are read.
 
         Args:
             filter_dict: Optional metadata filter
+            limit: Page size (None returns every match)
+            offset: Number of matches to skip
 
         Returns:
-            List of unique submission IDs
+            Sorted list of unique submission IDs
         """
-        vs = self.get_vectorstore()
-        # Get all documents
-        all_docs = vs.get()
+        self.get_vectorstore()
+        rows = self.submission_index.query(filter_dict, limit=limit, offset=offset)
+        return [row["submission_id"] for row in rows]
 
-        # Extract unique submission IDs
-        submission_ids = set()
-        if all_docs and 'metadatas' in all_docs:
-            for meta in all_docs['metadatas']:
-                if meta and 'submission_id' in meta:
-                    # Apply filter if provided
-                    if filter_dict:
-                        match = all(meta.get(k) == v for k, v in filter_dict.items())
-                        if match:
-                            submission_ids.add(meta['submission_id'])
-                    else:
-                        submission_ids.add(meta['submission_id'])
+    def iter_submissions(self, filter_dict: Optional[Dict] = None, page_size: int = 500):
+        """
+        Stream submission index rows.
+
+        Args:
+            filter_dict: Optional metadata filter
+            page_size: Rows read from the index per page
+
+        Yields:
+            Dicts with submission_id, student_id, assignment_id, type, timestamp, chunk_count
+        """
+        self.get_vectorstore()
+        yield from self.submission_index.iter_rows(filter_dict, page_size=page_size)
 
-        return sorted(list(submission_ids))
+    def count_submissions(self, filter_dict: Optional[Dict] = None) -> int:
+        """Number of submissions matching filter_dict."""
+        self.get_vectorstore()
+        return self.submission_index.count(filter_dict)
 
 
 # Convenience functions for backward compatibility
@@ -239,8 +1247,12 @@ _default_pipeline = None
 
 
 def get_pipeline(persist_directory: Optional[str] = None) -> RAGPipeline:
-    """Get or create a default RAG pipeline instance."""
+    """Get or create a default RAG pipeline instance (the app's shared one inside Flask)."""
     global _default_pipeline
+    if persist_directory is None:
+        from app.core.services import ai_services
+        if ai_services.app is not None:
+            return ai_services.pipeline
     if _default_pipeline is None:
         _default_pipeline = RAGPipeline(persist_directory=persist_directory)
     return _default_pipeline
@@ -0,0 +1,239 @@
+# rate_limiter.py
+# Cross-process token-bucket rate limiting and priority scheduling for OpenAI calls
+
+import contextlib
+import contextvars
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+try:
+    from app.config import config
+    LLM_RATE_LIMIT_PATH = config.LLM_RATE_LIMIT_PATH
+    LLM_RATE_LIMITS = config.LLM_RATE_LIMITS
+    LLM_MAX_RETRIES = config.LLM_MAX_RETRIES
+except ImportError:
+    LLM_RATE_LIMIT_PATH = "./instance/rate_limit.sqlite3"
+    LLM_RATE_LIMITS = {"chat": (500, 200_000), "embeddings": (3000, 1_000_000)}
+    LLM_MAX_RETRIES = 5
+
+# Priority lanes: lower value goes first
+INTERACTIVE = 0  # a student waiting for their grade
+BULK = 1         # teacher re-grades, imports, maintenance
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+def retryable_errors() -> tuple:
+    """Errors worth retrying with backoff (openai is only imported once a call fails)."""
+    import openai
+    return (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+@contextlib.contextmanager
+def llm_priority(priority: int):
+    """Run the enclosed LLM/embedding calls in the given priority lane."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+class RateLimiter:
+    """
+    Token buckets for requests/min and tokens/min, shared through SQLite.
+
+    Every worker process opens the same file, so the limits hold for the
+    whole deployment on one host. Callers that have to wait register in a
+    waiters table; a caller only takes capacity when no live waiter with a
+    higher priority is queued for the same bucket.
+    """
+
+    WAITER_TTL = 30.0  # seconds without heartbeat before a waiter is considered dead
+
+    def __init__(self, path: str = LLM_RATE_LIMIT_PATH, limits: Optional[Dict] = None):
+        """
+        Args:
+            path: SQLite file holding bucket state
+            limits: bucket name -> (requests per minute, tokens per minute); 0 disables a limit
+        """
+        self.path = path
+        self.limits = limits if limits is not None else LLM_RATE_LIMITS
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"acquired": 0, "waited": 0, "waited_seconds": 0.0, "retries": 0, "timeouts": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL, updated REAL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS waiters ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, bucket TEXT, priority INTEGER, heartbeat REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread and process (SQLite handles must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enabled(self, bucket: str) -> bool:
+        rpm, tpm = self.limits.get(bucket, (0, 0))
+        return bool(rpm or tpm)
+
+    def _take(self, conn, bucket: str, tokens: int, priority: int) -> float:
+        """Try to take capacity. Returns 0 on success, otherwise seconds to wait."""
+        rpm, tpm = self.limits[bucket]
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ahead = conn.execute(
+                "SELECT COUNT(*) FROM waiters WHERE bucket = ? AND priority < ? AND heartbeat > ?",
+                (bucket, priority, now - self.WAITER_TTL),
+            ).fetchone()[0]
+            if ahead:
+                conn.execute("COMMIT")
+                return 0.2
+
+            levels = {}
+            wait = 0.0
+            for kind, per_minute, need in (("requests", rpm, 1), ("tokens", tpm, tokens)):
+                if not per_minute:
+                    continue
+                name = f"{bucket}:{kind}"
+                row = conn.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                rate = per_minute / 60.0
+                level = per_minute if row is None else min(per_minute, row[0] + (now - row[1]) * rate)
+                need = min(need, per_minute)
+                levels[name] = (level, need)
+                if level < need:
+                    wait = max(wait, (need - level) / rate)
+
+            for name, (level, need) in levels.items():
+                conn.execute("INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                             (name, level - need if not wait else level, now))
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def acquire(self, bucket: str, tokens: int = 0, priority: Optional[int] = None,
+                timeout: Optional[float] = 300) -> float:
+        """
+        Block until one request and `tokens` tokens are available in `bucket`.
+
+        Returns:
+            Seconds spent waiting
+        """
+        if not self.enabled(bucket):
+            return 0.0
+        priority = current_priority() if priority is None else priority
+        conn = self._connect()
+        start = time.monotonic()
+        waiter_id = None
+        try:
+            while True:
+                wait = self._take(conn, bucket, tokens, priority)
+                if wait == 0:
+                    waited = time.monotonic() - start
+                    with self._stats_lock:
+                        self._stats["acquired"] += 1
+                        if waiter_id is not None:
+                            self._stats["waited"] += 1
+                            self._stats["waited_seconds"] += waited
+                    return waited
+
+                if waiter_id is None:
+                    waiter_id = conn.execute(
+                        "INSERT INTO waiters (bucket, priority, heartbeat) VALUES (?, ?, ?)",
+                        (bucket, priority, time.time()),
+                    ).lastrowid
+                else:
+                    conn.execute("UPDATE waiters SET heartbeat = ? WHERE id = ?", (time.time(), waiter_id))
+
+                if timeout is not None and time.monotonic() - start + wait > timeout:
+                    with self._stats_lock:
+                        self._stats["timeouts"] += 1
+                    raise RateLimitTimeout(f"waited {time.monotonic() - start:.1f}s for '{bucket}' capacity")
+                time.sleep(min(wait, 1.0) * random.uniform(1.0, 1.2))
+        finally:
+            if waiter_id is not None:
+                conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+
+    def adjust(self, bucket: str, tokens: int):
+        """Correct the tokens bucket once the real usage of a call is known (positive = used more)."""
+        rpm, tpm = self.limits.get(bucket, (0, 0))
+        if not tpm or not tokens:
+            return
+        conn = self._connect()
+        conn.execute("UPDATE buckets SET level = MIN(?, level - ?) WHERE name = ?", (tpm, tokens, f"{bucket}:tokens"))
+
+    def call(self, bucket: str, fn: Callable, tokens: int = 0, priority: Optional[int] = None,
+             max_retries: int = LLM_MAX_RETRIES, base_delay: float = 1.0, max_delay: float = 30.0) -> Any:
+        """Run fn() under the limiter, retrying rate-limit and transient errors with jittered backoff."""
+        attempt = 0
+        while True:
+            self.acquire(bucket, tokens, priority)
+            try:
+                return fn()
+            except retryable_errors() as e:
+                attempt += 1
+                if attempt > max_retries:
+                    raise
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+                retry_after = getattr(getattr(e, "response", None), "headers", {}).get("retry-after")
+                if retry_after:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+                with self._stats_lock:
+                    self._stats["retries"] += 1
+                print(f"{bucket} call failed ({type(e).__name__}), retry {attempt}/{max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def queue_depth(self) -> Dict:
+        """Live waiters per bucket and priority lane, across all processes."""
+        rows = self._connect().execute(
+            "SELECT bucket, priority, COUNT(*) FROM waiters WHERE heartbeat > ? GROUP BY bucket, priority",
+            (time.time() - self.WAITER_TTL,),
+        ).fetchall()
+        depth = {}
+        for bucket, priority, count in rows:
+            depth.setdefault(bucket, {})[priority] = count
+        return depth
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats, waited_seconds=round(self._stats["waited_seconds"], 3))
+        stats["queue_depth"] = self.queue_depth()
+        return stats
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
@@ -0,0 +1,225 @@
+# retrieval_cache.py
+# Cache of retrieval results, invalidated per filter when matching documents change
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from langchain_core.documents import Document
+
+from app.core.keys import normalize_text
+
+# Generation row bumped by invalidate_all (compaction, repartition, index rebuilds)
+ALL = "*"
+
+
+def canonical_filter(filter_dict: Optional[Dict]) -> str:
+    return json.dumps(filter_dict or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def may_match(conditions: Dict, metadata: Dict) -> bool:
+    """
+    Whether a document with this metadata can match the filter. Operator
+    filters ($and, $in, ...) are treated as always matching, so they are
+    invalidated by every write rather than risk serving stale results.
+    """
+    for key, value in conditions.items():
+        if key.startswith("$") or isinstance(value, dict):
+            return True
+    return all(metadata.get(key) == value for key, value in conditions.items())
+
+
+class RetrievalCache:
+    """
+    Retrieval results keyed by (normalized query, k, filter, search options).
+
+    Every filter that has been looked up gets a generation counter in a small
+    SQLite table shared by all processes using the same store. A write
+    through RAGPipeline bumps the counters of exactly the filters its
+    documents match. The generation is part of each cache key, so stale
+    entries are simply never hit again and age out of the LRU. For example,
+    a student submission does not invalidate the reference lookups of its
+    assignment.
+
+    Entries live in an in-process LRU. With shared=True they are also
+    written to SQLite, so other workers can reuse them.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1000, shared: bool = False):
+        self.path = path
+        self.max_entries = max_entries
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._registered = set()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations (filter TEXT PRIMARY KEY, generation INTEGER NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, documents TEXT NOT NULL, latency REAL NOT NULL, last_access REAL NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO generations (filter, generation) VALUES (?, 0)", (ALL,))
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    # ----- generations -----
+
+    def generation(self, filter_dict: Optional[Dict]) -> str:
+        """Current generation of a filter; changes whenever a write matches it."""
+        return self._generation(canonical_filter(filter_dict))
+
+    def _generation(self, filter_key: str) -> str:
+        with self._lock:
+            # Register once per process; lookups are then read-only
+            if filter_key not in self._registered:
+                self._conn.execute("INSERT OR IGNORE INTO generations (filter, generation) VALUES (?, 0)",
+                                   (filter_key,))
+                self._conn.commit()
+                self._registered.add(filter_key)
+            rows = dict(self._conn.execute("SELECT filter, generation FROM generations WHERE filter IN (?, ?)",
+                                           (filter_key, ALL)))
+        return f"{rows[ALL]}.{rows[filter_key]}"
+
+    def invalidate(self, metadatas: Iterable[Optional[Dict]]) -> int:
+        """
+        Bump the generation of every cached filter that matches one of these
+        documents' metadata (an empty filter matches everything).
+
+        Returns:
+            Number of filters invalidated
+        """
+        metadatas = [m or {} for m in metadatas]
+        if not metadatas:
+            return 0
+        with self._lock:
+            filters = [row[0] for row in self._conn.execute("SELECT filter FROM generations WHERE filter != ?", (ALL,))]
+            matched = []
+            for filter_key in filters:
+                conditions = json.loads(filter_key)
+                if any(may_match(conditions, m) for m in metadatas):
+                    matched.append(filter_key)
+            if matched:
+                self._conn.executemany("UPDATE generations SET generation = generation + 1 WHERE filter = ?",
+                                       [(f,) for f in matched])
+                self._conn.commit()
+            self.invalidations += len(matched)
+        return len(matched)
+
+    def invalidate_all(self):
+        with self._lock:
+            self._conn.execute("UPDATE generations SET generation = generation + 1 WHERE filter = ?", (ALL,))
+            if self.shared:
+                # Unreachable under the new generation anyway; free the rows now
+                self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._entries.clear()
+            self.invalidations += 1
+
+    # ----- entries -----
+
+    def make_key(self, query: Union[str, List[str]], k: int, filter_dict: Optional[Dict], **options) -> str:
+        filter_key = canonical_filter(filter_dict)
+        query = [normalize_text(q) for q in query] if isinstance(query, (list, tuple)) else normalize_text(query)
+        parts = json.dumps([query, k, filter_key, options, self._generation(filter_key)],
+                           sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(parts.encode("utf-8")).hexdigest()
+
+    def _get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+            if not self.shared:
+                return None
+            row = self._conn.execute("SELECT documents, latency FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            entry = ([(text, metadata) for text, metadata in json.loads(row[0])], row[1])
+            self._remember(key, entry)
+            return entry
+
+    def _remember(self, key: str, entry):
+        """Caller holds the lock."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _put(self, key: str, documents: List, latency: float):
+        with self._lock:
+            self._remember(key, (documents, latency))
+            if self.shared:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, documents, latency, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(documents, ensure_ascii=False, default=str), latency, time.time()))
+                # Keep the shared table bounded like the in-process LRU
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access DESC"
+                    " LIMIT -1 OFFSET ?)", (self.max_entries,))
+                self._conn.commit()
+
+    def get_or_compute(self,
+                       query: Union[str, List[str]],
+                       k: int,
+                       filter_dict: Optional[Dict],
+                       compute: Callable[[], List[Document]],
+                       **options) -> List[Document]:
+        """
+        Cached documents for this lookup, or compute() them and cache the result.
+
+        Args:
+            query: Query text, or a list of queries searched together (normalized for the key)
+            k: Number of results
+            filter_dict: Metadata filter the results were restricted to
+            compute: Runs the actual retrieval
+            **options: Anything else that changes the result (modes, etc.)
+        """
+        key = self.make_key(query, k, filter_dict, **options)
+        entry = self._get(key)
+        if entry is not None:
+            documents, latency = entry
+            with self._lock:
+                self.hits += 1
+                self.saved_seconds += latency
+            return [Document(page_content=text, metadata=dict(metadata)) for text, metadata in documents]
+
+        start = time.perf_counter()
+        docs = compute()
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.misses += 1
+        self._put(key, [(doc.page_content, doc.metadata) for doc in docs], latency)
+        return docs
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "avg_saved_ms": round(self.saved_seconds * 1000 / self.hits, 1) if self.hits else 0.0,
+                "invalidations": self.invalidations,
+                "shared": self.shared,
+            }
@@ -0,0 +1,154 @@
+# scoring.py
+# Deterministic weighted scoring of the analysis agent results
+
+import json
+import re
+from typing import Dict, List, Optional, Tuple, Union
+
+# Weight of each analysis agent in the overall score
+DEFAULT_WEIGHTS = {
+    'content': 0.30,
+    'grammar': 0.25,
+    'vocabulary': 0.20,
+    'structure': 0.15,
+    'fluency': 0.10,
+}
+
+# Key each agent reports its score under
+SCORE_KEYS = {
+    'content': 'content_score',
+    'grammar': 'grammar_score',
+    'vocabulary': 'vocab_score',
+    'structure': 'structure_score',
+    'fluency': 'fluency_score',
+}
+
+# (minimum overall score, letter), checked from the top
+DEFAULT_GRADE_BANDS = [
+    (9.0, 'A'),
+    (8.0, 'B'),
+    (6.5, 'C'),
+    (5.0, 'D'),
+    (0.0, 'F'),
+]
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+class ScoringEngine:
+    """Local replacement for the LLM ScoringAgent: weighted average plus grade letter."""
+
+    def __init__(self,
+                 weights: Optional[Dict[str, float]] = None,
+                 grade_bands: Optional[List[Tuple[float, str]]] = None,
+                 scale: float = 10.0):
+        """
+        Args:
+            weights: Agent name -> weight (any positive numbers; normalized to sum to 1)
+            grade_bands: (minimum score, letter) pairs on the same scale as scores
+            scale: Maximum score per agent and overall
+        """
+        weights = weights or DEFAULT_WEIGHTS
+        unknown = set(weights) - set(SCORE_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown scoring criteria: {sorted(unknown)}")
+        if any(w < 0 for w in weights.values()) or sum(weights.values()) <= 0:
+            raise ValueError("Scoring weights must be non-negative and not all zero")
+
+        total = sum(weights.values())
+        self.weights = {name: w / total for name, w in weights.items()}
+        self.grade_bands = sorted(grade_bands or DEFAULT_GRADE_BANDS, key=lambda band: band[0], reverse=True)
+        self.scale = scale
+
+    @classmethod
+    def from_criteria(cls, criteria: Union[str, Dict], **kwargs) -> "ScoringEngine":
+        """
+        Build an engine from rubric criteria (e.g. Rubric.criteria).
+
+        Accepts either {"content": 30, "grammar": 25, ...} or
+        {"weights": {...}, "grade_bands": [[9, "A"], ...]}.
+        """
+        if isinstance(criteria, str):
+            criteria = json.loads(criteria)
+        if "weights" in criteria:
+            bands = criteria.get("grade_bands")
+            return cls(weights=criteria["weights"],
+                       grade_bands=[tuple(band) for band in bands] if bands else None,
+                       **kwargs)
+        return cls(weights=criteria, **kwargs)
+
+    def extract_score(self, result: Dict, agent: str) -> Tuple[Optional[float], Optional[str]]:
+        """
+        Pull an agent's score out of its parsed result.
+
+        Returns:
+            (score clamped to [0, scale] or None, warning message or None)
+        """
+        if not isinstance(result, dict):
+            return None, f"{agent}: no result"
+        value = result.get(SCORE_KEYS[agent], result.get('score'))
+        if value is None:
+            return None, f"{agent}: missing {SCORE_KEYS[agent]}"
+
+        if isinstance(value, bool):
+            return None, f"{agent}: invalid score {value!r}"
+        if isinstance(value, (int, float)):
+            score = float(value)
+        else:
+            # e.g. "7", "7.5/10", "80%"
+            text = str(value)
+            numbers = _NUMBER.findall(text)
+            if not numbers:
+                return None, f"{agent}: invalid score {value!r}"
+            score = float(numbers[0])
+            if '%' in text:
+                score = score / 100 * self.scale
+            elif len(numbers) > 1 and '/' in text and float(numbers[1]) > 0:
+                score = score / float(numbers[1]) * self.scale
+
+        if score < 0 or score > self.scale:
+            clamped = min(max(score, 0.0), self.scale)
+            return clamped, f"{agent}: score {score} out of range, clamped to {clamped}"
+        return score, None
+
+    def grade_letter(self, score: float) -> str:
+        for minimum, letter in self.grade_bands:
+            if score >= minimum:
+                return letter
+        return self.grade_bands[-1][1]
+
+    def score(self, results: Dict) -> Dict:
+        """
+        Compute the weighted overall score from the analysis results.
+
+        Agents without a usable score are left out and the remaining weights are
+        renormalized.
+
+        Returns:
+            Same shape as the ScoringAgent output: overall_score, breakdown, grade_letter
+            (plus warnings and scorer)
+        """
+        breakdown = {}
+        warnings = []
+        for agent, weight in self.weights.items():
+            score, warning = self.extract_score(results.get(agent), agent)
+            if warning:
+                warnings.append(warning)
+            if score is not None:
+                breakdown[agent] = {"score": round(score, 2), "weight": round(weight, 4)}
+
+        used_weight = sum(item["weight"] for item in breakdown.values())
+        if used_weight > 0:
+            overall = sum(item["score"] * item["weight"] for item in breakdown.values()) / used_weight
+        else:
+            overall = 0.0
+            warnings.append("no agent scores available")
+
+        overall = round(overall, 1)
+        return {
+            "overall_score": overall,
+            "breakdown": breakdown,
+            "grade_letter": self.grade_letter(overall),
+            "warnings": warnings,
+            "scorer": "local",
+        }
@@ -0,0 +1,97 @@
+# services.py
+# App-scoped, lazily created AI clients (RAG pipeline and feedback agents)
+
+import importlib
+import os
+import threading
+import time
+from typing import Dict
+
+
+class AIServices:
+    """
+    Flask extension owning the RAGPipeline and FeedbackAgents of a process.
+
+    Nothing is imported or constructed until first use, so workers start fast
+    and idle ones never open Chroma or the OpenAI clients. Instances are tied
+    to the process that built them: after a fork (e.g. gunicorn --preload) the
+    child builds its own instead of sharing the parent's sockets and SQLite
+    handles.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SUBMISSIONS_DB_DIR', './submissions_db')
+        app.extensions['ai_services'] = self
+        self.app = app
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._pipeline = None
+        self._agents = None
+        self._timings = {}
+        # Locks held by another thread at fork time would never be released in the child
+        self._lock = threading.Lock()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _build(self, name: str, module: str, factory):
+        start = time.perf_counter()
+        mod = importlib.import_module(module)
+        imported = time.perf_counter()
+        instance = factory(mod)
+        built = time.perf_counter()
+        self._timings[name] = {
+            "import_s": round(imported - start, 3),
+            "init_s": round(built - imported, 3),
+        }
+        print(f"Initialized {name} in {built - start:.2f}s "
+              f"(import {imported - start:.2f}s, init {built - imported:.2f}s, pid {os.getpid()})")
+        return instance
+
+    @property
+    def pipeline(self):
+        """The process-wide RAGPipeline, created on first access."""
+        self._check_pid()
+        if self._pipeline is None:
+            with self._lock:
+                if self._pipeline is None:
+                    persist_directory = self.app.config['SUBMISSIONS_DB_DIR'] if self.app else './submissions_db'
+                    self._pipeline = self._build(
+                        'pipeline', 'app.core.rag_pipeline',
+                        lambda mod: mod.RAGPipeline(persist_directory=persist_directory))
+        return self._pipeline
+
+    @property
+    def agents(self):
+        """The process-wide FeedbackAgents, created on first access."""
+        self._check_pid()
+        if self._agents is None:
+            with self._lock:
+                if self._agents is None:
+                    self._agents = self._build(
+                        'agents', 'app.core.langchain_agents',
+                        lambda mod: mod.FeedbackAgents())
+        return self._agents
+
+    def is_initialized(self, name: str) -> bool:
+        self._check_pid()
+        return getattr(self, f"_{name}") is not None
+
+    def timings(self) -> Dict:
+        """Import and construction time of each service built in this process."""
+        self._check_pid()
+        return {"pid": self._pid, **self._timings}
+
+
+ai_services = AIServices()
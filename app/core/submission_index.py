@@ -0,0 +1,152 @@
+# submission_index.py
+# Lightweight submission-level index kept next to the Chroma collection
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Metadata keys stored in their own (indexed) columns; anything else is
+# filtered through the JSON metadata column.
+INDEXED_FIELDS = ("student_id", "assignment_id", "type", "timestamp")
+
+
+class SubmissionIndex:
+    """
+    One row per submission (not per chunk) in a small SQLite table.
+
+    Lets list/count queries avoid pulling every chunk out of Chroma; filters
+    are pushed down to SQL.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.created = not os.path.exists(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Untyped columns keep the original value type (int vs str), matching
+        # Chroma's exact-match metadata filters.
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS submissions ("
+            " submission_id TEXT PRIMARY KEY,"
+            " student_id, assignment_id, type, timestamp,"
+            " chunk_count INTEGER NOT NULL DEFAULT 0,"
+            " metadata TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_submissions_assignment ON submissions(assignment_id, type)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_submissions_student ON submissions(student_id)")
+        self._conn.commit()
+
+    def add(self, submission_id: str, metadata: Optional[Dict], chunk_count: int):
+        """Record chunks added for a submission (chunk counts accumulate like Chroma appends)."""
+        self.add_many([(submission_id, metadata or {}, chunk_count)])
+
+    def add_many(self, rows: List[Tuple[str, Dict, int]]):
+        if not rows:
+            return
+        params = []
+        for submission_id, metadata, chunk_count in rows:
+            params.append((
+                submission_id,
+                *[metadata.get(field) for field in INDEXED_FIELDS],
+                chunk_count,
+                json.dumps(metadata, ensure_ascii=False, default=str),
+            ))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO submissions (submission_id, student_id, assignment_id, type, timestamp, chunk_count, metadata)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(submission_id) DO UPDATE SET"
+                " student_id = excluded.student_id, assignment_id = excluded.assignment_id,"
+                " type = excluded.type, timestamp = excluded.timestamp, metadata = excluded.metadata,"
+                " chunk_count = submissions.chunk_count + excluded.chunk_count",
+                params,
+            )
+            self._conn.commit()
+
+    def set(self, submission_id: str, metadata: Optional[Dict], chunk_count: int):
+        """Replace a submission's row (used when its chunks were rewritten)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM submissions WHERE submission_id = ?", (submission_id,))
+            self._conn.commit()
+        if chunk_count:
+            self.add(submission_id, metadata, chunk_count)
+
+    def get(self, submission_id: str) -> Optional[Dict]:
+        """The submission's row, or None if it is not indexed."""
+        rows = self.query({"submission_id": submission_id}, limit=1)
+        return rows[0] if rows else None
+
+    def delete(self, submission_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM submissions WHERE submission_id = ?", (submission_id,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM submissions")
+            self._conn.commit()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM submissions LIMIT 1").fetchone() is None
+
+    @staticmethod
+    def _where(filter_dict: Optional[Dict]) -> Tuple[str, List]:
+        if not filter_dict:
+            return "", []
+        clauses, params = [], []
+        for key, value in filter_dict.items():
+            if key == "submission_id":
+                clauses.append("submission_id = ?")
+            elif key in INDEXED_FIELDS:
+                clauses.append(f"{key} = ?")
+            else:
+                clauses.append("json_extract(metadata, ?) = ?")
+                params.append(f'$."{key}"')
+            params.append(value)
+        return " WHERE " + " AND ".join(clauses), params
+
+    def count(self, filter_dict: Optional[Dict] = None) -> int:
+        where, params = self._where(filter_dict)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM submissions{where}", params).fetchone()[0]
+
+    def query(self,
+              filter_dict: Optional[Dict] = None,
+              limit: Optional[int] = None,
+              offset: int = 0) -> List[Dict]:
+        """Return submission rows ordered by submission_id."""
+        where, params = self._where(filter_dict)
+        sql = ("SELECT submission_id, student_id, assignment_id, type, timestamp, chunk_count"
+               f" FROM submissions{where} ORDER BY submission_id")
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [limit, offset]
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            dict(zip(("submission_id", "student_id", "assignment_id", "type", "timestamp", "chunk_count"), row))
+            for row in rows
+        ]
+
+    def iter_rows(self, filter_dict: Optional[Dict] = None, page_size: int = 500) -> Iterator[Dict]:
+        """Stream submission rows page by page (keyset pagination on submission_id)."""
+        where, params = self._where(filter_dict)
+        where = where or " WHERE 1=1"
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT submission_id, student_id, assignment_id, type, timestamp, chunk_count"
+                    f" FROM submissions{where} AND submission_id > ? ORDER BY submission_id LIMIT ?",
+                    params + [last, page_size],
+                ).fetchall()
+            for row in rows:
+                yield dict(zip(("submission_id", "student_id", "assignment_id", "type", "timestamp", "chunk_count"), row))
+            if len(rows) < page_size:
+                return
+            last = rows[-1][0]
@@ -0,0 +1,158 @@
+# task_references.py
+# Teacher-written questions, hints and sample answers as grading reference material
+
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.extensions import db
+from app.core.services import ai_services
+from app.core.token_budget import fit_context
+
+try:
+    from app.config import config
+    REFERENCE_CONTEXT_TOKENS = config.REFERENCE_CONTEXT_TOKENS
+except ImportError:
+    REFERENCE_CONTEXT_TOKENS = 1500
+
+REFERENCE_TYPE = "reference"
+
+
+def reference_id(task_id: int, question_id: Optional[int] = None) -> str:
+    """Vectorstore submission_id of one reference piece of a task."""
+    suffix = f"q{question_id}" if question_id is not None else "description"
+    return f"reference_task_{task_id}_{suffix}"
+
+
+def reference_texts(task) -> List[Tuple[str, str, Optional[int]]]:
+    """
+    The task's reference pieces: its description and one per question.
+
+    Returns:
+        (reference id, text, question id) tuples in question order
+    """
+    items = []
+    if task.description:
+        items.append((reference_id(task.id), f"Task: {task.title}\n{task.description}", None))
+    for question in sorted(task.questions, key=lambda q: q.id):
+        lines = [f"Question: {question.question_text}"]
+        if question.hint:
+            lines.append(f"Hint: {question.hint}")
+        if question.sample_answer:
+            lines.append(f"Sample answer: {question.sample_answer}")
+        items.append((reference_id(task.id, question.id), "\n".join(lines), question.id))
+    return items
+
+
+def build_context_bundle(task, max_tokens: int = REFERENCE_CONTEXT_TOKENS) -> str:
+    """All of a task's reference pieces, fitted to max_tokens for the grading prompts."""
+    return fit_context("\n\n".join(text for _, text, _ in reference_texts(task)), max_tokens)
+
+
+def refresh_task_references(task, pipeline=None) -> Dict:
+    """
+    Store the task's context bundle and index its reference pieces.
+
+    The bundle is saved on the task first (no network needed), so grading can
+    use it even if embedding fails. The pieces are then upserted as
+    `type: reference` documents of the task's assignment in one batched
+    embeddings request; pieces of deleted questions are removed.
+
+    Args:
+        task: Task with its questions committed
+        pipeline: RAGPipeline (default: the app's shared one)
+
+    Returns:
+        Upsert counts plus the number of removed pieces (and an error, if indexing failed)
+    """
+    save_context_bundle(task)
+    return index_task_references(task, pipeline)
+
+
+def save_context_bundle(task):
+    """Store the task's reference bundle (no network needed) and commit."""
+    task.reference_context = build_context_bundle(task) or None
+    task.reference_context_updated_at = datetime.utcnow()
+    db.session.commit()
+
+
+def index_task_references(task, pipeline=None) -> Dict:
+    """Embed and upsert the task's reference pieces; see refresh_task_references."""
+    assignment_id = f"task_{task.id}"
+    items = reference_texts(task)
+    try:
+        # Building the pipeline can fail too (e.g. no OpenAI credentials)
+        pipeline = pipeline or ai_services.pipeline
+        current = {ref_id for ref_id, _, _ in items}
+        removed = 0
+        for ref_id in pipeline.list_submissions({"assignment_id": assignment_id, "type": REFERENCE_TYPE}):
+            if ref_id not in current:
+                pipeline.delete_submission(ref_id)
+                removed += 1
+        stats = pipeline.upsert_submissions([
+            {
+                "submission_id": ref_id,
+                "content": text,
+                "metadata": {"assignment_id": assignment_id, "type": REFERENCE_TYPE,
+                             "task_id": task.id, "question_id": question_id if question_id is not None else ""},
+            }
+            for ref_id, text, question_id in items
+        ])
+        stats["deleted_pieces"] = removed
+    except Exception as e:
+        print(f"Reference indexing for task {task.id} failed: {e}")
+        return {"error": str(e)}
+
+    print(f"Reference material for task {task.id}: {stats}")
+    return stats
+
+
+def refresh_task_references_in_background(task, app) -> threading.Thread:
+    """
+    Save the context bundle now and index the pieces on a daemon thread, so a
+    teacher's request does not wait on the embeddings round trip.
+
+    Args:
+        task: Task with its questions committed
+        app: Flask app the thread runs in
+
+    Returns:
+        The started thread
+    """
+    save_context_bundle(task)
+    task_id = task.id
+
+    def target():
+        from app.models import Task
+
+        with app.app_context():
+            try:
+                task = db.session.get(Task, task_id)
+                if task is not None:
+                    index_task_references(task)
+            finally:
+                db.session.remove()
+
+    thread = threading.Thread(target=target, name=f"task-references-{task_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def remove_task_references(task_id: int, pipeline=None) -> int:
+    """Delete a task's reference documents from the vectorstore. Returns the number removed."""
+    pipeline = pipeline or ai_services.pipeline
+    ref_ids = pipeline.list_submissions({"assignment_id": f"task_{task_id}", "type": REFERENCE_TYPE})
+    for ref_id in ref_ids:
+        pipeline.delete_submission(ref_id)
+    return len(ref_ids)
+
+
+def grading_context(task, essay: str, pipeline=None) -> Optional[str]:
+    """
+    Reference context for grading an essay from the task's precomputed bundle,
+    compressed against the essay locally. None if the task has no bundle yet.
+    """
+    if task is None or not task.reference_context:
+        return None
+    pipeline = pipeline or ai_services.pipeline
+    return pipeline.compress_context(essay, task.reference_context)
@@ -0,0 +1,129 @@
+# token_budget.py
+# Per-prompt token budgets: compact analysis JSON and size-limited reference context
+
+import json
+from typing import Dict, List, Optional
+
+from app.core.tokens import estimate_tokens, truncate_to_tokens
+
+try:
+    from app.config import config
+    PROMPT_CONTEXT_TOKENS = config.PROMPT_CONTEXT_TOKENS
+    PROMPT_ANALYSIS_TOKENS = config.PROMPT_ANALYSIS_TOKENS
+except ImportError:
+    PROMPT_CONTEXT_TOKENS = 1500
+    PROMPT_ANALYSIS_TOKENS = 1200
+
+# Keys agents add when something went wrong; useless (and long) in downstream prompts
+NOISE_KEYS = {"raw", "parse_error"}
+
+# Progressive shrinking steps for the analysis: (max list items, max string chars)
+_SHRINK_STEPS = [(None, None), (5, 300), (3, 160), (2, 80), (1, 40)]
+
+
+def _shrink(value, max_items: Optional[int], max_chars: Optional[int]):
+    if isinstance(value, dict):
+        return {k: _shrink(v, max_items, max_chars) for k, v in value.items()
+                if k not in NOISE_KEYS and v not in (None, "", [], {})}
+    if isinstance(value, list):
+        items = value if max_items is None else value[:max_items]
+        return [_shrink(v, max_items, max_chars) for v in items]
+    if isinstance(value, str) and max_chars is not None and len(value) > max_chars:
+        return value[:max_chars] + "…"
+    return value
+
+
+def compact_analysis(results: Dict, max_tokens: Optional[int] = None) -> str:
+    """
+    Serialize agent results for the scoring/feedback prompts.
+
+    Drops raw/parse_error noise and empty fields, uses no whitespace, and if
+    the result is still over max_tokens, caps list lengths and long strings
+    step by step. An agent with nothing usable left is marked "unavailable".
+    """
+    serialized = ""
+    for max_items, max_chars in _SHRINK_STEPS:
+        compact = {}
+        for name, result in results.items():
+            shrunk = _shrink(result, max_items, max_chars) if isinstance(result, dict) else result
+            compact[name] = shrunk if shrunk not in (None, {}) else "unavailable"
+        serialized = json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+        if max_tokens is None or estimate_tokens(serialized) <= max_tokens:
+            break
+    return serialized
+
+
+def fit_context(context: str, max_tokens: int, separator: str = "\n\n") -> str:
+    """
+    Trim retrieved context to max_tokens.
+
+    Chunks arrive most relevant first, so whole chunks are kept in order
+    (skipping exact duplicates) and the first chunk that does not fit is cut
+    at a sentence boundary.
+    """
+    if not context or estimate_tokens(context) <= max_tokens:
+        return context
+    kept: List[str] = []
+    seen = set()
+    used = 0
+    sep_tokens = estimate_tokens(separator)
+    for chunk in context.split(separator):
+        chunk = chunk.strip()
+        if not chunk or chunk in seen:
+            continue
+        seen.add(chunk)
+        cost = estimate_tokens(chunk) + (sep_tokens if kept else 0)
+        if used + cost <= max_tokens:
+            kept.append(chunk)
+            used += cost
+            continue
+        remaining = max_tokens - used - (sep_tokens if kept else 0)
+        if remaining > 20:
+            kept.append(truncate_to_tokens(chunk, remaining))
+        break
+    return separator.join(kept)
+
+
+class PromptBudget:
+    """
+    Token budgets for the variable parts of each prompt.
+
+    Defaults apply to every prompt; ``limits`` overrides them per prompt,
+    e.g. {"feedback": {"context": 800}}. Every fit is logged with its
+    before/after token counts.
+    """
+
+    def __init__(self,
+                 context_tokens: int = PROMPT_CONTEXT_TOKENS,
+                 analysis_tokens: int = PROMPT_ANALYSIS_TOKENS,
+                 limits: Optional[Dict[str, Dict[str, int]]] = None):
+        """
+        Args:
+            context_tokens: Default budget for retrieved reference context
+            analysis_tokens: Default budget for serialized analysis results
+            limits: Per-prompt overrides {prompt_name: {"context"|"analysis": tokens}}
+        """
+        self.defaults = {"context": context_tokens, "analysis": analysis_tokens}
+        self.limits = limits or {}
+
+    def limit(self, prompt: str, part: str) -> int:
+        return self.limits.get(prompt, {}).get(part, self.defaults[part])
+
+    def context(self, context: str, prompt: str) -> str:
+        """Reference context for `prompt`, trimmed to its budget."""
+        if not context:
+            return context
+        fitted = fit_context(context, self.limit(prompt, "context"))
+        self._log(prompt, "context", estimate_tokens(context), estimate_tokens(fitted))
+        return fitted
+
+    def analysis(self, results: Dict, prompt: str) -> str:
+        """Compact analysis JSON for `prompt`, shrunk to its budget."""
+        before = estimate_tokens(json.dumps(results, ensure_ascii=False, indent=2))
+        serialized = compact_analysis(results, self.limit(prompt, "analysis"))
+        self._log(prompt, "analysis", before, estimate_tokens(serialized))
+        return serialized
+
+    @staticmethod
+    def _log(prompt: str, part: str, before: int, after: int):
+        print(f"Prompt budget [{prompt}] {part}: {before} -> {after} tokens")
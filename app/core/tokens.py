@@ -0,0 +1,42 @@
+# tokens.py
+# Offline token estimates for prompts (no tokenizer download needed)
+
+import re
+
+# Hiragana, katakana, CJK ideographs, full-width forms and CJK punctuation
+_CJK = re.compile(r'[　-〿぀-ヿ㐀-䶿一-鿿豈-﫿＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for mixed Japanese/English text.
+
+    OpenAI tokenizers spend about one token per Japanese character and about
+    one per four characters of English/ASCII; good enough for budgeting and
+    rate limiting.
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Cut text to roughly max_tokens (same estimate as estimate_tokens),
+    preferring to end at a sentence or line break.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    used = 0.0
+    end = 0
+    for i, ch in enumerate(text):
+        used += 1.0 if _CJK.match(ch) else 0.25
+        if used > max_tokens:
+            break
+        end = i + 1
+    cut = text[:end]
+    boundary = max(cut.rfind(mark) for mark in ("。", "！", "？", ". ", "\n"))
+    if boundary > end * 0.6:
+        cut = cut[:boundary + 1]
+    return cut.rstrip()
@@ -0,0 +1,62 @@
+# tracked_chain.py
+# Runnable wrapper that logs every chain call through ai_telemetry
+
+from typing import Any, Dict, Optional
+
+from langchain_core.runnables import Runnable
+
+from app.core.ai_telemetry import AITelemetry, ai_telemetry
+from app.core.tokens import estimate_tokens
+
+
+def _input_tokens(inputs: Any) -> int:
+    if isinstance(inputs, dict):
+        return sum(estimate_tokens(v) for v in inputs.values() if isinstance(v, str))
+    return estimate_tokens(str(inputs))
+
+
+class TrackedChain(Runnable):
+    """
+    Wraps a chain (prompt | llm, or a CachedChain) and logs every invoke/stream.
+
+    Token counts come from the model's usage metadata; when the response has
+    none (cache hits, providers without usage) they are estimated.
+    """
+
+    def __init__(self, name: str, chain, model: Optional[str] = None, telemetry: AITelemetry = None):
+        self.name = name
+        self.chain = chain
+        self.model = model
+        self.telemetry = telemetry or ai_telemetry
+
+    def _finish(self, record: Dict, inputs: Any, content: str, usage: Optional[Dict], metadata: Dict):
+        record["cache_hit"] = bool(metadata.get("cache_hit"))
+        if record["cache_hit"]:
+            # Served from the response cache: nothing was billed
+            record["prompt_tokens"] = 0
+            record["completion_tokens"] = 0
+        elif usage:
+            record["prompt_tokens"] = usage.get("input_tokens")
+            record["completion_tokens"] = usage.get("output_tokens")
+        else:
+            record["prompt_tokens"] = _input_tokens(inputs)
+            record["completion_tokens"] = estimate_tokens(content)
+        record["prompt"] = inputs
+        record["response"] = content
+
+    def invoke(self, input, config=None, **kwargs):
+        with self.telemetry.track("llm", self.name, self.model) as record:
+            message = self.chain.invoke(input, config, **kwargs)
+            self._finish(record, input, message.content, getattr(message, "usage_metadata", None),
+                         getattr(message, "response_metadata", None) or {})
+        return message
+
+    def stream(self, input, config=None, **kwargs):
+        with self.telemetry.track("llm", self.name, self.model) as record:
+            parts, usage, metadata = [], None, {}
+            for chunk in self.chain.stream(input, config, **kwargs):
+                parts.append(chunk.content)
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                metadata = getattr(chunk, "response_metadata", None) or metadata
+                yield chunk
+            self._finish(record, input, "".join(parts), usage, metadata)
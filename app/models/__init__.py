@@ -3,9 +3,11 @@ from .task import Task, Question
 from .submission import Submission
 from .ai_log import AILog
 from .notification import Notification
+from .grading_job import GradingJob
+from .bulk_grading_run import BulkGradingRun
 
 from .teacher import Teacher
 from .student import Student
 
-__all__ = ["User", "Teacher", "Student", "Question"]
+__all__ = ["User", "Teacher", "Student", "Question", "GradingJob", "BulkGradingRun"]
 
@@ -8,4 +8,14 @@ class AILog(db.Model):
     submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'))
     prompt = db.Column(db.Text)
     ai_response = db.Column(db.Text)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    # One row per LLM chain call, embedding request or retrieval
+    kind = db.Column(db.String(20))    # 'llm', 'embedding' or 'retrieval'
+    agent = db.Column(db.String(50))   # chain / operation name, e.g. 'grammar', 'similarity_search'
+    model = db.Column(db.String(100))
+    latency_ms = db.Column(db.Float)
+    prompt_tokens = db.Column(db.Integer)
+    completion_tokens = db.Column(db.Integer)
+    cache_hit = db.Column(db.Boolean, default=False)
+    error = db.Column(db.Text)
@@ -0,0 +1,52 @@
+from datetime import datetime
+from ..extensions import db
+
+
+class BulkGradingRun(db.Model):
+    __tablename__ = 'bulk_grading_run'
+
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False, index=True)
+    started_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    status = db.Column(db.String(20), default='running', nullable=False)  # running, done, failed, cancelled
+    force = db.Column(db.Boolean, default=False, nullable=False)  # re-grade even unchanged submissions
+    workers = db.Column(db.Integer, default=4, nullable=False)
+    total = db.Column(db.Integer, default=0, nullable=False)
+    graded = db.Column(db.Integer, default=0, nullable=False)
+    skipped = db.Column(db.Integer, default=0, nullable=False)
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    last_submission_id = db.Column(db.Integer, default=0, nullable=False)  # checkpoint: all ids <= this are finished
+    grading_seconds = db.Column(db.Float, default=0.0, nullable=False)  # wall time spent, summed over resumes
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # heartbeat, bumped at every checkpoint
+    finished_at = db.Column(db.DateTime)
+
+    task = db.relationship('Task', backref=db.backref('bulk_grading_runs', lazy=True, cascade="all, delete-orphan"))
+
+    @property
+    def processed(self):
+        return self.graded + self.skipped + self.failed
+
+    def to_dict(self):
+        remaining = max(self.total - self.processed, 0)
+        rate = self.graded / self.grading_seconds if self.grading_seconds else 0.0
+        return {
+            "id": self.id,
+            "task_id": self.task_id,
+            "status": self.status,
+            "total": self.total,
+            "graded": self.graded,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "remaining": remaining,
+            "graded_per_minute": round(rate * 60, 2),
+            "eta_seconds": round(remaining / rate) if rate and self.status == 'running' else None,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<BulkGradingRun {self.id} task={self.task_id} ({self.status})>'
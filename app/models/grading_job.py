@@ -0,0 +1,39 @@
+from datetime import datetime
+from ..extensions import db
+
+
+class GradingJob(db.Model):
+    __tablename__ = 'grading_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # queued, running, done, failed
+    payload = db.Column(db.Text)  # JSON: content, jlpt_level, assignment_id, ...
+    result = db.Column(db.Text)   # JSON: full run_multi_agents output
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # not picked up before this (backoff)
+    worker_id = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # renewed while a worker runs the job (lease)
+    finished_at = db.Column(db.DateTime)
+
+    submission = db.relationship('Submission', backref=db.backref('grading_jobs', lazy=True))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "submission_id": self.submission_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<GradingJob {self.id} ({self.status})>'
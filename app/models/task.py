@@ -14,6 +14,9 @@ class Task(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_done = db.Column(db.Boolean, default=False, nullable=False)
+    # Questions, hints and sample answers, pre-fitted for grading prompts (see task_references)
+    reference_context = db.Column(db.Text)
+    reference_context_updated_at = db.Column(db.DateTime)
 
     questions = db.relationship('Question', backref='task', lazy=True, cascade="all, delete-orphan")
 
@@ -0,0 +1,62 @@
+# schema.py
+# In-place upgrade of databases created before columns were added to existing tables
+
+import sqlalchemy as sa
+
+# Columns added to tables that may already exist; db.create_all() never alters a table.
+# The Alembic revisions in migrations/versions add the same columns for `flask db upgrade`.
+ADDED_COLUMNS = {
+    "task": [
+        ("reference_context", "TEXT"),
+        ("reference_context_updated_at", "DATETIME"),
+    ],
+    "ai_log": [
+        ("kind", "VARCHAR(20)"),
+        ("agent", "VARCHAR(50)"),
+        ("model", "VARCHAR(100)"),
+        ("latency_ms", "FLOAT"),
+        ("prompt_tokens", "INTEGER"),
+        ("completion_tokens", "INTEGER"),
+        ("cache_hit", "BOOLEAN DEFAULT 0"),
+        ("error", "TEXT"),
+    ],
+    "grading_job": [
+        ("heartbeat_at", "DATETIME"),
+    ],
+}
+
+# Indexes added to existing tables: name -> (table, columns)
+ADDED_INDEXES = {
+    "ix_ai_log_timestamp": ("ai_log", ["timestamp"]),
+}
+
+
+def upgrade_schema(engine) -> list:
+    """
+    Add any missing ADDED_COLUMNS and ADDED_INDEXES to existing tables.
+    Idempotent; tables that do not exist yet are left to db.create_all().
+
+    Returns:
+        "table.column" (and index) names that were added
+    """
+    inspector = sa.inspect(engine)
+    tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as conn:
+        for table, columns in ADDED_COLUMNS.items():
+            if table not in tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table)}
+            for name, ddl in columns:
+                if name not in existing:
+                    conn.execute(sa.text(f'ALTER TABLE "{table}" ADD COLUMN "{name}" {ddl}'))
+                    added.append(f"{table}.{name}")
+        for name, (table, columns) in ADDED_INDEXES.items():
+            if table not in tables or name in {index["name"] for index in inspector.get_indexes(table)}:
+                continue
+            conn.execute(sa.text(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" '
+                                 f'({", ".join(columns)})'))
+            added.append(name)
+    if added:
+        print(f"Upgraded database schema: added {', '.join(added)}")
+    return added
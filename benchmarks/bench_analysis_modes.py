@@ -0,0 +1,64 @@
+"""
+Compare FeedbackAgents analysis modes against a stub LLM.
+
+    python benchmarks/bench_analysis_modes.py [--runs 3]
+
+Reports wall time, LLM calls and prompt tokens for the per-agent chains
+(serial and parallel) and for the single-call combined analysis.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("OPENAI_MODEL", "gpt-4o-mini")
+
+from benchmarks.stub_llm import StubChatModel  # noqa: E402
+from app.core.langchain_agents import FeedbackAgents  # noqa: E402
+
+ESSAY = ("私の夏休みについて書きます。今年の夏、家族と一緒に京都へ行きました。"
+         "お寺や神社をたくさん見て、とても楽しかったです。特に金閣寺がきれいでした。\n\n") * 6
+CONTEXT = ("京都は日本の古い都で、多くの寺院や神社があります。金閣寺は一三九七年に建てられました。"
+           "旅行の作文では、いつ、どこで、だれと、何をしたかを具体的に書くことが大切です。\n\n") * 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    agents = FeedbackAgents()
+    stub = StubChatModel()
+    agents.llm = stub
+    agents.response_cache = None  # measure real calls, not cache hits
+    agents._setup_chains()
+
+    modes = [
+        ("agents (serial)", dict(mode="agents", parallel=False)),
+        ("agents (parallel)", dict(mode="agents", parallel=True)),
+        ("combined", dict(mode="combined")),
+    ]
+    print(f"{'mode':<20}{'analysis s':>12}{'end-to-end s':>14}{'LLM calls':>11}{'prompt tokens':>15}")
+    for label, kwargs in modes:
+        analysis_time = total_time = 0.0
+        calls = tokens = 0
+        for _ in range(args.runs):
+            stub.reset()
+            start = time.perf_counter()
+            agents.run_analysis(ESSAY, CONTEXT, "N4", **kwargs)
+            analysis_time += time.perf_counter() - start
+            calls += stub.calls
+            tokens += stub.prompt_tokens
+
+            stub.reset()
+            start = time.perf_counter()
+            agents.run_multi_agents(ESSAY, CONTEXT, "N4", **kwargs)
+            total_time += time.perf_counter() - start
+        print(f"{label:<20}{analysis_time / args.runs:>12.2f}{total_time / args.runs:>14.2f}"
+              f"{calls / args.runs:>11.0f}{tokens / args.runs:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Measure extractive context compression against a stub LLM.
+
+    python benchmarks/bench_context_compression.py [--runs 3] [--max-chars 1200]
+
+Retrieves nothing: three 1000-character reference chunks (a mix of sentences
+related and unrelated to the essay) stand in for get_context_for_submission.
+Reports compression time, context size and the prompt tokens / end-to-end
+grading time of FeedbackAgents with the raw and the compressed context.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("OPENAI_MODEL", "gpt-4o-mini")
+
+from benchmarks.stub_llm import StubChatModel, rough_tokens  # noqa: E402
+from app.core.context_compression import ContextCompressor  # noqa: E402
+from app.core.langchain_agents import FeedbackAgents  # noqa: E402
+
+ESSAY = ("私の夏休みについて書きます。今年の夏、家族と一緒に京都へ行きました。"
+         "お寺や神社をたくさん見て、とても楽しかったです。特に金閣寺がきれいでした。"
+         "夜は旅館に泊まって、おいしい京料理を食べました。来年は友だちと奈良にも行きたいです。\n\n") * 3
+
+RELATED = [
+    "京都は日本の古い都で、多くの寺院や神社があります。",
+    "金閣寺は一三九七年に建てられ、金色の建物で有名です。",
+    "旅行の作文では、いつ、どこで、だれと、何をしたかを具体的に書くことが大切です。",
+    "旅館では和室に泊まり、京料理を食べるのが人気です。",
+    "奈良には大仏で有名な東大寺があり、京都から電車で一時間ぐらいです。",
+    "夏休みの思い出を書くときは、気持ちを表す言葉を使いましょう。",
+]
+UNRELATED = [
+    "二次方程式の解の公式を使って、次の問題を解きなさい。",
+    "光合成は植物が光のエネルギーを使って養分を作るはたらきです。",
+    "この文法は「〜なければならない」と同じ意味で、義務を表します。",
+    "会議の資料は前日までに担当者へメールで送ってください。",
+    "円安が進むと、輸入品の値段が上がることがあります。",
+    "サッカーの試合は雨のため来週に延期されました。",
+    "図書館の本は二週間以内に返却してください。",
+    "細胞は生物の体をつくる基本的な単位です。",
+    "敬語には尊敬語、謙譲語、丁寧語の三つの種類があります。",
+    "新しいスマートフォンは電池が長持ちします。",
+]
+
+
+def make_context(seed: int = 0, chunks: int = 3, chunk_chars: int = 1000) -> str:
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(chunks):
+        chunk = ""
+        while len(chunk) < chunk_chars:
+            pool = RELATED if rng.random() < 0.2 else UNRELATED
+            chunk += rng.choice(pool)
+        parts.append(chunk[:chunk_chars])
+    return "\n\n".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-chars", type=int, default=1200)
+    args = parser.parse_args()
+
+    context = make_context()
+    compressor = ContextCompressor(max_chars=args.max_chars)
+
+    start = time.perf_counter()
+    for _ in range(20):
+        compressed = compressor.compress(ESSAY, context)
+    compress_ms = (time.perf_counter() - start) / 20 * 1000
+    related = sum(compressed.count(s.rstrip("。")) for s in RELATED)
+    print(f"context: {len(context)} -> {len(compressed)} chars "
+          f"({rough_tokens(context)} -> {rough_tokens(compressed)} tokens), "
+          f"{compress_ms:.1f} ms per compression, {related} related sentences kept")
+
+    agents = FeedbackAgents()
+    stub = StubChatModel()
+    agents.llm = stub
+    agents.response_cache = None  # measure real calls, not cache hits
+    agents._setup_chains()
+
+    print(f"{'context':<14}{'prompt tokens':>15}{'end-to-end s':>14}")
+    for label, ctx in (("raw", context), ("compressed", None)):
+        tokens = 0
+        total_time = 0.0
+        for _ in range(args.runs):
+            stub.reset()
+            start = time.perf_counter()
+            run_ctx = ctx if ctx is not None else compressor.compress(ESSAY, context)
+            agents.run_multi_agents(ESSAY, run_ctx, "N4")
+            total_time += time.perf_counter() - start
+            tokens += stub.prompt_tokens
+        print(f"{label:<14}{tokens / args.runs:>15.0f}{total_time / args.runs:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
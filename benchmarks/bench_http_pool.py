@@ -0,0 +1,72 @@
+"""
+Shared connection pool vs. one HTTP client per model object, against a local
+OpenAI-compatible stub server.
+
+    python benchmarks/bench_http_pool.py [--threads 8] [--calls 20]
+
+Reports connections accepted by the server (each one is a TCP + TLS handshake
+against the real API), client-side reuse ratio and call latency percentiles.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.stub_openai_server import StubOpenAIServer  # noqa: E402
+from app.core.openai_clients import OpenAIClientFactory  # noqa: E402
+
+
+def run(label, make_model, threads, calls):
+    def worker(_):
+        latencies = []
+        for _ in range(calls):
+            model = make_model()
+            start = time.perf_counter()
+            model.invoke("作文を評価してください。")
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(l for chunk in executor.map(worker, range(threads)) for l in chunk)
+    p50 = statistics.median(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    return label, p50, p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    print(f"{'client':<22}{'connections':>12}{'requests':>10}{'p50 ms':>9}{'p95 ms':>9}")
+
+    # Old behaviour: every model object gets its own client/pool
+    server = StubOpenAIServer(latency=args.latency).start()
+    label, p50, p95 = run(
+        "per-model client",
+        lambda: OpenAIClientFactory(base_url=server.base_url).chat_model("gpt-4o-mini", max_retries=0),
+        args.threads, args.calls)
+    print(f"{label:<22}{server.connections:>12}{server.requests:>10}{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}")
+    server.stop()
+
+    # Shared factory: one keep-alive pool for every model object
+    server = StubOpenAIServer(latency=args.latency).start()
+    factory = OpenAIClientFactory(base_url=server.base_url, pool_size=args.threads)
+    label, p50, p95 = run(
+        "shared pool",
+        lambda: factory.chat_model("gpt-4o-mini", max_retries=0),
+        args.threads, args.calls)
+    print(f"{label:<22}{server.connections:>12}{server.requests:>10}{p50 * 1000:>9.1f}{p95 * 1000:>9.1f}")
+    print(f"shared pool stats: {factory.stats()}")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Recall and latency of the NumPy memmap backend against Chroma.
+
+    python benchmarks/bench_numpy_vectorstore.py [--size 20000] [--dim 1536] [--queries 100] [--k 10]
+
+Clustered unit vectors (--assignments clusters, one assignment_id each)
+are written into a Chroma collection and a NumpyCollection. Queries are
+perturbed copies of stored vectors. Ground truth is an exact float32
+search, so recall@k shows what HNSW (Chroma) and float16 storage (numpy)
+each lose. Both backends are timed unfiltered and filtered to one
+assignment, and the on-disk size of each store is reported.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from app.core.numpy_vectorstore import NumpyCollection  # noqa: E402
+
+
+def unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_data(size, dim, assignments, queries, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((assignments, dim)).astype(np.float32)
+    labels = rng.integers(0, assignments, size)
+    data = unit(centers[labels] + 0.8 * rng.standard_normal((size, dim)).astype(np.float32))
+    picks = rng.integers(0, size, queries)
+    query_vectors = unit(data[picks] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32))
+    return data, labels, query_vectors, labels[picks]
+
+
+def exact_top_k(data, labels, queries, query_labels, k, filtered):
+    truth = []
+    for query, label in zip(queries, query_labels):
+        candidates = np.flatnonzero(labels == label) if filtered else np.arange(len(data))
+        distances = ((data[candidates] - query) ** 2).sum(axis=1)
+        truth.append(set(candidates[np.argsort(distances)[:k]].tolist()))
+    return truth
+
+
+def run(collection, queries, query_labels, k, filtered):
+    latencies, found = [], []
+    for query, label in zip(queries, query_labels):
+        where = {"assignment_id": f"task_{label}"} if filtered else None
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, where=where, include=["distances"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append({int(chunk_id) for chunk_id in result["ids"][0]})
+    latencies.sort()
+    return found, statistics.median(latencies), latencies[max(0, int(len(latencies) * 0.95) - 1)]
+
+
+def disk_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--assignments", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    import chromadb
+
+    data, labels, queries, query_labels = make_data(args.size, args.dim, args.assignments, args.queries)
+    ids = [str(i) for i in range(args.size)]
+    metadatas = [{"assignment_id": f"task_{label}"} for label in labels]
+    root = tempfile.mkdtemp(prefix="bench_numpy_vectorstore_")
+    try:
+        stores = {}
+        start = time.perf_counter()
+        chroma = chromadb.PersistentClient(path=os.path.join(root, "chroma")).get_or_create_collection("bench")
+        for i in range(0, args.size, 5000):
+            chroma.upsert(ids=ids[i:i + 5000], embeddings=data[i:i + 5000], metadatas=metadatas[i:i + 5000],
+                          documents=ids[i:i + 5000])
+        stores["chroma"] = (chroma, time.perf_counter() - start, os.path.join(root, "chroma"))
+
+        start = time.perf_counter()
+        numpy_store = NumpyCollection(os.path.join(root, "numpy", "bench"))
+        for i in range(0, args.size, 5000):
+            numpy_store.upsert(ids=ids[i:i + 5000], embeddings=data[i:i + 5000], metadatas=metadatas[i:i + 5000],
+                               documents=ids[i:i + 5000])
+        stores["numpy"] = (numpy_store, time.perf_counter() - start, os.path.join(root, "numpy"))
+
+        print(f"{args.size} vectors x {args.dim} dims, {args.queries} queries, k={args.k}")
+        print(f"{'backend':>8} {'search':>11} {'recall':>7} {'median ms':>10} {'p95 ms':>8}")
+        for filtered in (False, True):
+            truth = exact_top_k(data, labels, queries, query_labels, args.k, filtered)
+            for name, (store, _, _) in stores.items():
+                run(store, queries[:5], query_labels[:5], args.k, filtered)  # warm up
+                found, median, p95 = run(store, queries, query_labels, args.k, filtered)
+                recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+                label = "assignment" if filtered else "all"
+                print(f"{name:>8} {label:>11} {recall:>7.3f} {median:>10.2f} {p95:>8.2f}")
+        for name, (_, load_seconds, path) in stores.items():
+            print(f"{name:>8} load {load_seconds:.1f}s, {disk_size(path) / 2 ** 20:.0f} MiB on disk")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare assignment-filtered search over one collection with per-assignment partitions.
+
+    python benchmarks/bench_partitioning.py [--sizes 2000,10000,40000] [--assignments 20] [--queries 50]
+
+For each total size, random unit vectors spread over --assignments
+assignments are written (already embedded, so no API calls) into a fresh
+store once with VECTORSTORE_PARTITIONING='none' and once with 'assignment'.
+Reports the median / p95 latency of a k=5 search restricted to one
+assignment (after a warm-up that opens every collection), plus the time `repartition` takes to move the unpartitioned
+store into partitions without re-embedding.
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("OPENAI_MODEL", "gpt-4o-mini")
+
+import numpy as np  # noqa: E402
+from langchain_core.documents import Document  # noqa: E402
+from app.core.rag_pipeline import RAGPipeline  # noqa: E402
+
+DIM = 256
+
+
+def random_vectors(rng, n):
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist()
+
+
+def fill(pipeline, size, assignments, seed):
+    rng = np.random.default_rng(seed)
+    docs = [Document(page_content=f"chunk {i}",
+                     metadata={"submission_id": f"sub_{i}",
+                               "student_id": f"student_{i % 97}",
+                               "assignment_id": f"task_{i % assignments}",
+                               "type": "student_submission",
+                               "timestamp": "2026-01-01T00:00:00"})
+            for i in range(size)]
+    pipeline._write_embedded(docs, random_vectors(rng, size), ids=[f"chunk_{i}" for i in range(size)])
+
+
+def measure(pipeline, queries, assignments):
+    # Open every collection first so the timings are for warm handles
+    for i in range(assignments):
+        pipeline._search(queries[:1], 5, {"assignment_id": f"task_{i}"})
+    latencies = []
+    for i, vector in enumerate(queries):
+        start = time.perf_counter()
+        pipeline._search([vector], 5, {"assignment_id": f"task_{i % assignments}"})
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="2000,10000,40000")
+    parser.add_argument("--assignments", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(random.randint(0, 2 ** 31))
+    queries = random_vectors(rng, args.queries)
+
+    print(f"{'chunks':>8} {'layout':>11} {'median ms':>10} {'p95 ms':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        root = tempfile.mkdtemp(prefix="bench_partitioning_")
+        try:
+            flat = RAGPipeline(persist_directory=root, partitioning="none", use_embedding_cache=False)
+            fill(flat, size, args.assignments, seed=size)
+            median, p95 = measure(flat, queries, args.assignments)
+            print(f"{size:>8} {'none':>11} {median:>10.2f} {p95:>8.2f}")
+
+            partitioned = RAGPipeline(persist_directory=root, partitioning="assignment", use_embedding_cache=False)
+            start = time.perf_counter()
+            partitioned.repartition()
+            elapsed = time.perf_counter() - start
+            median, p95 = measure(partitioned, queries, args.assignments)
+            print(f"{size:>8} {'assignment':>11} {median:>10.2f} {p95:>8.2f}   (repartitioned in {elapsed:.1f}s)")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Index size, latency and recall of reduced first-pass vectors with exact rerank.
+
+    python benchmarks/bench_quantization.py [--size 10000] [--dim 3072] [--queries 50] [--k 10]
+
+The synthetic corpus imitates Matryoshka embeddings: clustered unit
+vectors whose per-dimension variance decays, so leading dimensions carry
+the most information. Each layout is written into a fresh NumpyCollection.
+Layouts are float16 or int8, a number of search dimensions, and whether
+the top k * rerank_factor candidates are reranked against the
+full-precision vectors. recall@k is measured against an exact float32
+search over all dimensions. "search MiB" is the first-pass matrix every
+query scans; "disk MiB" adds the full-precision copy used by the rerank.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from app.core.numpy_vectorstore import NumpyCollection  # noqa: E402
+
+# (quantization, search dimensions (None = all), rerank factor)
+LAYOUTS = [
+    ("float16", None, 0),
+    ("float16", 1024, 4),
+    ("int8", None, 4),
+    ("int8", 1024, 0),
+    ("int8", 1024, 4),
+    ("int8", 512, 4),
+    ("int8", 256, 4),
+    ("int8", 256, 10),
+]
+
+
+def unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_data(size, dim, queries, clusters=50, seed=0):
+    rng = np.random.default_rng(seed)
+    decay = (1.0 / np.sqrt(1.0 + np.arange(dim) / 64.0)).astype(np.float32)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32) * decay
+    labels = rng.integers(0, clusters, size)
+    data = unit(centers[labels] + 0.8 * rng.standard_normal((size, dim)).astype(np.float32) * decay)
+    picks = rng.integers(0, size, queries)
+    query_vectors = unit(data[picks] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32) * decay)
+    return data, query_vectors
+
+
+def file_mib(path, rows, width, itemsize):
+    return rows * width * itemsize / 2 ** 20 if os.path.exists(path) else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    data, queries = make_data(args.size, args.dim, args.queries)
+    truth = [set(np.argsort(((data - q) ** 2).sum(axis=1))[:args.k].tolist()) for q in queries]
+    ids = [str(i) for i in range(args.size)]
+    root = tempfile.mkdtemp(prefix="bench_quantization_")
+
+    print(f"{args.size} vectors x {args.dim} dims, {args.queries} queries, recall@{args.k} vs exact float32")
+    print(f"{'layout':>22} {'search MiB':>11} {'disk MiB':>9} {'recall':>7} {'median ms':>10} {'p95 ms':>8}")
+    try:
+        for n, (quantization, search_dims, rerank) in enumerate(LAYOUTS):
+            path = os.path.join(root, f"layout_{n}")
+            collection = NumpyCollection(path, quantization=quantization, search_dimensions=search_dims,
+                                         rerank_factor=rerank)
+            for i in range(0, args.size, 2000):
+                collection.upsert(ids=ids[i:i + 2000], embeddings=data[i:i + 2000])
+
+            width = search_dims or args.dim
+            itemsize = 1 if quantization == "int8" else 2
+            search_file = "vectors.i8" if quantization == "int8" else "vectors.f16"
+            search_mib = file_mib(os.path.join(path, search_file), args.size, width, itemsize)
+            disk_mib = search_mib + file_mib(os.path.join(path, "full.f32"), args.size, args.dim, 4)
+
+            collection.query(query_embeddings=queries[:2], n_results=args.k)  # warm up
+            latencies, recalls = [], []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                result = collection.query(query_embeddings=[query], n_results=args.k, include=["distances"])
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(len({int(i) for i in result["ids"][0]} & expected) / args.k)
+            latencies.sort()
+
+            label = f"{quantization}/{width}" + (f" rerank x{rerank}" if rerank > 1 and (
+                quantization != "float16" or search_dims) else "")
+            print(f"{label:>22} {search_mib:>11.1f} {disk_mib:>9.1f} {statistics.mean(recalls):>7.3f} "
+                  f"{statistics.median(latencies):>10.2f} {latencies[max(0, int(len(latencies) * 0.95) - 1)]:>8.2f}")
+            shutil.rmtree(path, ignore_errors=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# stub_llm.py
+# Offline stand-in for ChatOpenAI used by the benchmarks
+
+import json
+import re
+import threading
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_CJK = re.compile(r'[　-ヿ㐀-鿿＀-￯]')
+
+
+def rough_tokens(text: str) -> int:
+    """~1 token per CJK character, ~4 characters per token otherwise."""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+SAMPLE_RESULTS = {
+    'content': {"content_score": 7, "strengths": ["clear topic"], "weaknesses": ["few examples"],
+                "missing_concepts": [], "suggestions": ["add an example"]},
+    'grammar': {"grammar_score": 6.5, "errors": [{"line": "2", "type": "particle", "issue": "は/が",
+                                                  "suggestion": "use が"}], "overall_comment": "mostly correct"},
+    'vocabulary': {"vocab_score": 7, "vocab_comments": "appropriate", "suggestions": [],
+                   "advanced_words_used": ["経験"], "simple_words": ["いい"]},
+    'structure': {"structure_score": 8, "has_intro": True, "has_body": True, "has_conclusion": False,
+                  "suggestions": ["add a conclusion"], "paragraph_feedback": "ok"},
+    'fluency': {"fluency_score": 7, "awkward_sentences": [], "rewrites": [], "overall_comment": "natural"},
+}
+
+_AGENT_MARKERS = {
+    'ContentAnalysisAgent': 'content',
+    'GrammarAgent': 'grammar',
+    'VocabularyAgent': 'vocabulary',
+    'StructureAgent': 'structure',
+    'FluencyAgent': 'fluency',
+}
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Chat model returning canned agent JSON after a simulated latency.
+
+    latency = base_latency + prompt_tokens * per_prompt_token + output_tokens * per_output_token
+    """
+
+    base_latency: float = 0.4
+    per_prompt_token: float = 0.00005
+    per_output_token: float = 0.002
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    lock: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def reset(self):
+        with self.lock:
+            self.calls = self.prompt_tokens = self.completion_tokens = 0
+
+    def _respond(self, prompt: str) -> str:
+        if 'assessment team' in prompt:
+            return json.dumps({name: result for name, result in SAMPLE_RESULTS.items()
+                               if name != 'content' or 'Reference Context' in prompt}, ensure_ascii=False)
+        for marker, name in _AGENT_MARKERS.items():
+            if marker in prompt:
+                return json.dumps(SAMPLE_RESULTS[name], ensure_ascii=False)
+        if 'ScoringAgent' in prompt:
+            return json.dumps({"overall_score": 7.0, "breakdown": {}, "grade_letter": "C"})
+        if 'FeedbackAgent' in prompt:
+            return json.dumps({"feedback_text": "よく書けています。結論を加えましょう。",
+                               "action_plan": ["結論を書く"], "practice_exercises": ["は/が"],
+                               "encouragement": "頑張って!"}, ensure_ascii=False)
+        return "よく書けています。"
+
+    def _account(self, messages: List[BaseMessage]):
+        prompt = "\n".join(str(m.content) for m in messages)
+        content = self._respond(prompt)
+        tokens_in, tokens_out = rough_tokens(prompt), rough_tokens(content)
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += tokens_in
+            self.completion_tokens += tokens_out
+        return content, tokens_in, tokens_out
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        content, tokens_in, tokens_out = self._account(messages)
+        time.sleep(self.base_latency + tokens_in * self.per_prompt_token + tokens_out * self.per_output_token)
+        usage = {"input_tokens": tokens_in, "output_tokens": tokens_out, "total_tokens": tokens_in + tokens_out}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs):
+        content, tokens_in, _ = self._account(messages)
+        time.sleep(self.base_latency + tokens_in * self.per_prompt_token)
+        for i in range(0, len(content), 4):
+            time.sleep(self.per_output_token * rough_tokens(content[i:i + 4]))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=content[i:i + 4]))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,99 @@
+# stub_openai_server.py
+# Minimal local HTTP server mimicking the OpenAI chat completions and embeddings API
+
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.stub_llm import rough_tokens
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.latency)
+
+        if self.path.endswith("/embeddings"):
+            inputs = request.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            data = []
+            for i, text in enumerate(inputs):
+                seed = hashlib.sha256(str(text).encode("utf-8")).digest()
+                vector = [(b - 128) / 128 for b in (seed * (self.server.dimensions // 32 + 1))[:self.server.dimensions]]
+                data.append({"object": "embedding", "index": i, "embedding": vector})
+            self._send_json({"object": "list", "data": data, "model": request.get("model"),
+                             "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+            return
+
+        if self.path.endswith("/chat/completions"):
+            prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+            content = self.server.reply
+            self._send_json({
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": rough_tokens(prompt), "completion_tokens": rough_tokens(content),
+                          "total_tokens": rough_tokens(prompt) + rough_tokens(content)},
+            })
+            return
+
+        self._send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    """
+    Serves /v1/chat/completions and /v1/embeddings on localhost.
+
+    Counts accepted connections and requests so connection reuse can be measured.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.05, dimensions: int = 64,
+                 reply: str = '{"feedback_text": "よく書けています。"}'):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.dimensions = dimensions
+        self.reply = reply
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
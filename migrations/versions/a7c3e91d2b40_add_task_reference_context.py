@@ -0,0 +1,43 @@
+"""add task reference context
+
+Revision ID: a7c3e91d2b40
+Revises: f1b408d1ee64
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e91d2b40'
+down_revision = 'f1b408d1ee64'
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    inspector = sa.inspect(op.get_bind())
+    if table not in inspector.get_table_names():
+        return None
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade():
+    # create_app() may already have added these (app.schema.upgrade_schema)
+    existing = _columns('task')
+    if existing is None:
+        return
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        if 'reference_context' not in existing:
+            batch_op.add_column(sa.Column('reference_context', sa.Text(), nullable=True))
+        if 'reference_context_updated_at' not in existing:
+            batch_op.add_column(sa.Column('reference_context_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    existing = _columns('task') or set()
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        for name in ('reference_context_updated_at', 'reference_context'):
+            if name in existing:
+                batch_op.drop_column(name)
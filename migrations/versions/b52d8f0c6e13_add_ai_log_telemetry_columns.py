@@ -0,0 +1,60 @@
+"""add ai log telemetry columns
+
+Revision ID: b52d8f0c6e13
+Revises: a7c3e91d2b40
+Create Date: 2026-10-18 10:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52d8f0c6e13'
+down_revision = 'a7c3e91d2b40'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column('kind', sa.String(length=20), nullable=True),
+    sa.Column('agent', sa.String(length=50), nullable=True),
+    sa.Column('model', sa.String(length=100), nullable=True),
+    sa.Column('latency_ms', sa.Float(), nullable=True),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=True),
+    sa.Column('completion_tokens', sa.Integer(), nullable=True),
+    sa.Column('cache_hit', sa.Boolean(), server_default=sa.false(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+]
+
+
+def _inspect(table):
+    inspector = sa.inspect(op.get_bind())
+    if table not in inspector.get_table_names():
+        return None, None
+    return ({column['name'] for column in inspector.get_columns(table)},
+            {index['name'] for index in inspector.get_indexes(table)})
+
+
+def upgrade():
+    # create_app() may already have added these (app.schema.upgrade_schema)
+    columns, indexes = _inspect('ai_log')
+    if columns is None:
+        return
+    with op.batch_alter_table('ai_log', schema=None) as batch_op:
+        for column in COLUMNS:
+            if column.name not in columns:
+                batch_op.add_column(column.copy())
+        if 'ix_ai_log_timestamp' not in indexes:
+            batch_op.create_index('ix_ai_log_timestamp', ['timestamp'], unique=False)
+
+
+def downgrade():
+    columns, indexes = _inspect('ai_log')
+    if columns is None:
+        return
+    with op.batch_alter_table('ai_log', schema=None) as batch_op:
+        if 'ix_ai_log_timestamp' in indexes:
+            batch_op.drop_index('ix_ai_log_timestamp')
+        for column in reversed(COLUMNS):
+            if column.name in columns:
+                batch_op.drop_column(column.name)
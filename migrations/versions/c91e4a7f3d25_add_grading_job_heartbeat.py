@@ -0,0 +1,40 @@
+"""add grading job heartbeat
+
+Revision ID: c91e4a7f3d25
+Revises: b52d8f0c6e13
+Create Date: 2026-10-18 10:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c91e4a7f3d25'
+down_revision = 'b52d8f0c6e13'
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    inspector = sa.inspect(op.get_bind())
+    if table not in inspector.get_table_names():
+        return None
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade():
+    # create_app() may already have added it (app.schema.upgrade_schema)
+    existing = _columns('grading_job')
+    if existing is None or 'heartbeat_at' in existing:
+        return
+    with op.batch_alter_table('grading_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    existing = _columns('grading_job')
+    if existing is None or 'heartbeat_at' not in existing:
+        return
+    with op.batch_alter_table('grading_job', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy.pool import StaticPool
+
+from app import create_app
+from app.config import Config
+from app.extensions import db
+
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'test'
+    # One shared in-memory database for every thread (workers, heartbeats)
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+    GRADING_WORKERS = 0
+    GRADING_BACKOFF_SECONDS = 5.0
+    GRADING_JOB_LEASE_SECONDS = 60
+    AI_LOG_ENABLED = False
+
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.grading_queue import grading_queue
+from app.extensions import db
+from app.models import GradingJob, Student, Submission, Task
+
+
+@pytest.fixture
+def submission(app):
+    student = Student(username='student', password_hash='x')
+    db.session.add(student)
+    db.session.commit()
+    task = Task(title='Summer holiday', description='Write about your summer', created_by=student.id)
+    db.session.add(task)
+    db.session.commit()
+    submission = Submission(task_id=task.id, student_id=student.id, content='夏休みに京都へ行きました。',
+                            status='submitted')
+    db.session.add(submission)
+    db.session.commit()
+    return submission
+
+
+@pytest.fixture
+def handler():
+    """Stub grading handler; restores the app's real one afterwards."""
+    previous = grading_queue._handler
+    calls = []
+
+    @grading_queue.job_handler
+    def grade(job):
+        calls.append(job.id)
+        job.submission.ai_score = 7.5
+        return {"overall_score": 7.5}
+
+    yield calls
+    grading_queue._handler = previous
+
+
+def enqueue(submission, max_attempts=3):
+    return grading_queue.enqueue(submission.id, {"content": submission.content}, max_attempts=max_attempts)
+
+
+def test_only_one_claim_of_a_job_succeeds(submission):
+    job_id = enqueue(submission).id
+
+    first = grading_queue.claim(job_id, "worker-a")
+    second = grading_queue.claim(job_id, "worker-b")
+
+    assert first is not None and first.worker_id == "worker-a"
+    assert second is None
+    job = db.session.get(GradingJob, job_id)
+    assert (job.status, job.worker_id, job.attempts) == ('running', 'worker-a', 1)
+
+
+def test_fail_requeues_with_backoff_until_max_attempts(submission):
+    job_id = enqueue(submission, max_attempts=2).id
+
+    grading_queue.claim(job_id, "worker-a")
+    assert grading_queue.fail(job_id, RuntimeError("rate limited"), "worker-a")
+    job = db.session.get(GradingJob, job_id)
+    assert job.status == 'queued'
+    assert job.available_at > datetime.utcnow()
+    assert job.error == "rate limited"
+
+    grading_queue.claim(job_id, "worker-a")
+    assert grading_queue.fail(job_id, RuntimeError("rate limited again"), "worker-a")
+    job = db.session.get(GradingJob, job_id)
+    assert (job.status, job.attempts) == ('failed', 2)
+    assert job.finished_at is not None
+
+
+def test_release_does_not_use_up_an_attempt(submission):
+    job_id = enqueue(submission).id
+
+    grading_queue.claim(job_id, "stream-1")
+    grading_queue.release(job_id)
+
+    job = db.session.get(GradingJob, job_id)
+    assert (job.status, job.attempts, job.worker_id) == ('queued', 0, None)
+    assert grading_queue.claim(job_id, "worker-a") is not None
+
+
+def _expire_lease(job_id):
+    job = db.session.get(GradingJob, job_id)
+    job.heartbeat_at = datetime.utcnow() - timedelta(seconds=grading_queue.app.config['GRADING_JOB_LEASE_SECONDS'] + 1)
+    db.session.commit()
+
+
+def test_stale_job_is_requeued_or_failed_when_out_of_attempts(submission):
+    retryable = enqueue(submission, max_attempts=3).id
+    exhausted = enqueue(submission, max_attempts=1).id
+    healthy = enqueue(submission).id
+    for job_id in (retryable, exhausted, healthy):
+        grading_queue.claim(job_id, "dead-worker")
+    _expire_lease(retryable)
+    _expire_lease(exhausted)
+
+    grading_queue._last_recovery = float('-inf')
+    grading_queue._recover_stale_jobs()
+    db.session.expire_all()
+
+    assert db.session.get(GradingJob, retryable).status == 'queued'
+    assert db.session.get(GradingJob, exhausted).status == 'failed'
+    assert db.session.get(GradingJob, healthy).status == 'running'
+
+
+def test_late_result_of_a_requeued_job_is_dropped(submission, handler):
+    job = grading_queue.claim(enqueue(submission).id, "slow-worker")
+    _expire_lease(job.id)
+    grading_queue._last_recovery = float('-inf')
+    grading_queue._recover_stale_jobs()
+    grading_queue.claim(job.id, "new-worker")
+    db.session.expire_all()
+
+    assert not grading_queue.complete(job, {"overall_score": 1.0}, "slow-worker")
+    assert not grading_queue.fail(job.id, RuntimeError("late"), "slow-worker")
+
+    job = db.session.get(GradingJob, job.id)
+    assert (job.status, job.worker_id, job.result) == ('running', 'new-worker', None)
+
+
+def test_run_once_processes_a_job_with_the_handler(submission, handler):
+    job_id = enqueue(submission).id
+
+    assert grading_queue.run_once("worker-a")
+
+    job = db.session.get(GradingJob, job_id)
+    assert job.status == 'done'
+    assert handler == [job_id]
+    assert job.submission.ai_score == 7.5
+
+
+def test_submit_test_returns_202_with_status_urls(client, submission):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(submission.student_id)
+        session['_fresh'] = True
+
+    response = client.post(f'/student/tasks/submit_test/{submission.task_id}',
+                           data={'content': '夏休みに奈良へ行きました。', 'jlpt_level': 'N4'},
+                           headers={'Accept': 'application/json'})
+
+    assert response.status_code == 202
+    data = response.get_json()
+    assert data["status"] == 'queued'
+    assert data["status_url"] == f'/student/api/grading_jobs/{data["job_id"]}'
+    assert data["events_url"] == f'/student/grading/{data["job_id"]}/events'
+    assert data["progress_url"] == f'/student/grading/{data["job_id"]}'
+    assert client.get(data["status_url"]).get_json()["status"] == 'queued'
@@ -0,0 +1,31 @@
+from app.core.lexical_index import LexicalIndex
+
+ESSAY = ("私の夏休みについて書きます。今年の夏、家族と一緒に京都へ行きました。"
+         "お寺や神社をたくさん見て、とても楽しかったです。特に金閣寺がきれいでした。"
+         "夜は旅館に泊まって、おいしい京料理を食べました。来年は友だちと奈良にも行きたいです。")
+
+
+def test_filtered_search_finds_reference_while_student_chunk_is_indexed(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"), max_query_terms=64)
+    index.add(
+        ["r1", "s1"],
+        ["金閣寺は京都にある有名なお寺です。", ESSAY],
+        [{"assignment_id": "task_1", "type": "reference"},
+         {"assignment_id": "task_1", "type": "submission", "student_id": 1}],
+    )
+
+    # Every n-gram of the essay is in the student's chunk, so the rarest 64 overall are all
+    # terms the reference does not contain.
+    results = index.search(ESSAY, k=3, filter_dict={"assignment_id": "task_1", "type": "reference"})
+
+    assert [chunk_id for chunk_id, _, _, _ in results] == ["r1"]
+    assert results[0][2]["type"] == "reference"
+
+
+def test_unfiltered_search_ranks_the_matching_chunk_first(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    index.add(["r1", "s1"], ["金閣寺は京都にある有名なお寺です。", ESSAY], [{}, {}])
+
+    results = index.search("金閣寺がきれいでした", k=2)
+
+    assert results[0][0] == "s1"
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from app.core.numpy_vectorstore import NumpyCollection
+
+
+def brute_force(vectors, query, k, keep=None):
+    """Squared-L2 top-k over float32 vectors: (indices, distances)."""
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    if keep is not None:
+        distances = np.where(keep, distances, np.inf)
+    order = np.argsort(distances, kind="stable")[:k]
+    return order, distances
+
+
+def make_vectors(count=300, dim=32, seed=0):
+    # Multiples of 1/4 are exact in float16, so the float16 layout matches float32 distances
+    rng = np.random.default_rng(seed)
+    return (rng.integers(-8, 8, size=(count, dim)) / 4).astype(np.float32)
+
+
+@pytest.fixture
+def collection(tmp_path):
+    return NumpyCollection(str(tmp_path / "essays"))
+
+
+@pytest.mark.parametrize("quantization", ["float16", "int8"])
+def test_query_matches_brute_force_top_k(tmp_path, quantization):
+    vectors = make_vectors()
+    collection = NumpyCollection(str(tmp_path / quantization), quantization=quantization)
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    collection.upsert(ids=ids, embeddings=vectors, metadatas=[{"n": i} for i in range(len(vectors))])
+
+    queries = make_vectors(count=5, seed=1)
+    result = collection.query(queries, n_results=10)
+
+    for query, got_ids, got_distances in zip(queries, result["ids"], result["distances"]):
+        order, distances = brute_force(vectors, query, 10)
+        # Ties may come back in either order; distances must match position by position
+        np.testing.assert_allclose(got_distances, distances[order], rtol=1e-5, atol=1e-4)
+        np.testing.assert_allclose([distances[ids.index(i)] for i in got_ids], got_distances,
+                                   rtol=1e-5, atol=1e-4)
+
+
+def test_where_prefilters_before_top_k(collection):
+    vectors = make_vectors(count=100)
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    metadatas = [{"task_id": i % 3, "n": i} for i in range(len(vectors))]
+    collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas)
+
+    query = vectors[1]  # task 1; its own row would win without the filter
+    where = {"$and": [{"task_id": 2}, {"n": {"$lt": 60}}]}
+    result = collection.query(query, n_results=5, where=where)
+
+    keep = np.array([m["task_id"] == 2 and m["n"] < 60 for m in metadatas])
+    order, distances = brute_force(vectors, query, 5, keep)
+    assert all(m["task_id"] == 2 and m["n"] < 60 for m in result["metadatas"][0])
+    np.testing.assert_allclose(result["distances"][0], distances[order], atol=1e-4)
+    assert collection.get(where={"task_id": 2})["ids"] == [i for i, m in zip(ids, metadatas) if m["task_id"] == 2]
+
+
+def test_deleted_row_is_reused_without_stale_vectors(collection):
+    vectors = make_vectors(count=3, dim=8)
+    collection.upsert(ids=["a", "b", "c"], embeddings=vectors)
+    assert collection.count() == 3
+    freed_row = collection._rows[collection._positions["b"]]
+
+    collection.delete(ids=["b"])
+    replacement = -vectors[1]
+    collection.upsert(ids=["d"], embeddings=[replacement])
+
+    assert collection.count() == 3
+    assert collection._rows[collection._positions["d"]] == freed_row
+    np.testing.assert_array_equal(collection.get(ids=["d"], include=["embeddings"])["embeddings"][0], replacement)
+    hit = collection.query(vectors[1], n_results=3)
+    assert "b" not in hit["ids"][0]
+    assert hit["distances"][0][0] > 0
+    hit = collection.query(replacement, n_results=1)
+    assert hit["ids"][0] == ["d"] and hit["distances"][0] == [0.0]
+
+
+def test_second_collection_on_same_path_sees_writes(tmp_path, monkeypatch):
+    path = str(tmp_path / "shared")
+    writer, reader = NumpyCollection(path), NumpyCollection(path)
+    vectors = make_vectors(count=4, dim=8)
+    writer.upsert(ids=["a", "b", "c"], embeddings=vectors[:3], metadatas=[{"v": 1}] * 3)
+    assert reader.count() == 3
+
+    patches = []
+    patch = reader._patch
+    monkeypatch.setattr(reader, "_patch", lambda rows, changed: patches.append(sorted(changed)) or patch(rows, changed))
+    writer.delete(ids=["a"])
+    writer.upsert(ids=["d"], embeddings=vectors[3:], metadatas=[{"v": 2}])
+    writer.update(ids=["c"], metadatas=[{"v": 3}])
+
+    result = reader.get()
+    assert result["ids"] == ["b", "c", "d"]
+    assert [m["v"] for m in result["metadatas"]] == [1, 3, 2]
+    assert reader.query(vectors[3], n_results=1)["ids"] == [["d"]]
+    # Only the logged ids were re-read, not the whole table
+    assert patches == [["a", "c", "d"]]
@@ -0,0 +1,119 @@
+import httpx
+import openai
+import pytest
+
+from app.core import rate_limiter
+from app.core.rate_limiter import BULK, INTERACTIVE, RateLimiter, RateLimitTimeout
+
+
+class Clock:
+    def __init__(self, now=1_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    # 60 requests/min refills one request per second
+    return RateLimiter(str(tmp_path / "rate_limit.sqlite3"), limits={"chat": (60, 600)})
+
+
+def level(limiter, name):
+    return limiter._connect().execute("SELECT level FROM buckets WHERE name = ?", (name,)).fetchone()[0]
+
+
+def test_buckets_refill_at_the_per_minute_rate(limiter, clock):
+    conn = limiter._connect()
+    for _ in range(60):
+        assert limiter._take(conn, "chat", 10, INTERACTIVE) == 0
+    assert level(limiter, "chat:requests") == 0
+    assert level(limiter, "chat:tokens") == 0
+
+    assert limiter._take(conn, "chat", 10, INTERACTIVE) == pytest.approx(1.0)
+    clock.now += 0.5
+    # Half a request and 5 tokens refilled; a failed take consumes nothing
+    assert limiter._take(conn, "chat", 10, INTERACTIVE) == pytest.approx(0.5)
+    assert level(limiter, "chat:requests") == pytest.approx(0.5)
+    assert level(limiter, "chat:tokens") == pytest.approx(5.0)
+
+    clock.now += 2.5
+    assert limiter._take(conn, "chat", 10, INTERACTIVE) == 0
+    assert level(limiter, "chat:requests") == pytest.approx(2.0)
+    assert level(limiter, "chat:tokens") == pytest.approx(20.0)
+
+    # Never refills past the per-minute capacity
+    clock.now += 3600
+    assert limiter._take(conn, "chat", 0, INTERACTIVE) == 0
+    assert level(limiter, "chat:requests") == pytest.approx(59.0)
+
+
+def test_live_interactive_waiter_blocks_bulk(limiter):
+    conn = limiter._connect()
+    waiter = conn.execute("INSERT INTO waiters (bucket, priority, heartbeat) VALUES (?, ?, ?)",
+                          ("chat", INTERACTIVE, rate_limiter.time.time())).lastrowid
+    assert limiter.queue_depth() == {"chat": {INTERACTIVE: 1}}
+
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("chat", 10, priority=BULK, timeout=0.3)
+    limiter.acquire("chat", 10, priority=INTERACTIVE, timeout=5)
+    assert level(limiter, "chat:requests") == pytest.approx(59.0, abs=0.1)
+
+    # A waiter whose process died stops blocking once its heartbeat expires
+    conn.execute("UPDATE waiters SET heartbeat = ? WHERE id = ?",
+                 (rate_limiter.time.time() - limiter.WAITER_TTL - 1, waiter))
+    limiter.acquire("chat", 10, priority=BULK, timeout=5)
+    assert limiter.stats()["acquired"] == 2
+
+
+def test_acquire_times_out(tmp_path):
+    limiter = RateLimiter(str(tmp_path / "rate_limit.sqlite3"), limits={"chat": (1, 0)})
+    limiter.acquire("chat")
+
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("chat", timeout=0.2)
+
+    assert limiter.stats()["timeouts"] == 1
+    assert limiter.queue_depth() == {}
+
+
+def rate_limit_error(retry_after):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_call_honors_retry_after_and_stops_after_max_retries(limiter, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limiter.time, "sleep", sleeps.append)
+    calls = []
+
+    def always_limited():
+        calls.append(1)
+        raise rate_limit_error("7")
+
+    with pytest.raises(openai.RateLimitError):
+        limiter.call("chat", always_limited, max_retries=2, base_delay=0.01)
+    assert len(calls) == 3
+    assert sleeps == [7.0, 7.0]
+    assert limiter.stats()["retries"] == 2
+
+    attempts = iter([rate_limit_error("3"), None])
+
+    def limited_once():
+        error = next(attempts)
+        if error:
+            raise error
+        return "ok"
+
+    sleeps.clear()
+    assert limiter.call("chat", limited_once, max_retries=2, base_delay=0.01) == "ok"
+    assert sleeps == [3.0]
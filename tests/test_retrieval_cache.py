@@ -0,0 +1,64 @@
+import pytest
+from langchain_core.documents import Document
+
+from app.core.retrieval_cache import RetrievalCache
+
+REFERENCES = {"assignment_id": "task_1", "type": "reference"}
+SUBMISSIONS = {"assignment_id": "task_1", "type": "student_submission"}
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "retrieval_cache.db")
+
+
+@pytest.fixture
+def cache(cache_path):
+    return RetrievalCache(cache_path, shared=True)
+
+
+def lookup(cache, filter_dict, query="敬語の使い方", text="result"):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [Document(page_content=text, metadata=dict(filter_dict))]
+
+    docs = cache.get_or_compute(query, 4, filter_dict, compute)
+    return docs, bool(calls)
+
+
+def test_matching_write_invalidates_only_that_filter(cache):
+    lookup(cache, REFERENCES)
+    lookup(cache, SUBMISSIONS)
+    assert lookup(cache, REFERENCES)[1] is False
+
+    # A new reference piece of the task matches the reference filter only
+    assert cache.invalidate([{"assignment_id": "task_1", "type": "reference", "question_id": 3}]) == 1
+
+    docs, computed = lookup(cache, REFERENCES, text="fresh")
+    assert computed and docs[0].page_content == "fresh"
+    assert lookup(cache, SUBMISSIONS)[1] is False
+
+
+def test_non_matching_write_keeps_entries_cached(cache):
+    lookup(cache, REFERENCES)
+    lookup(cache, SUBMISSIONS)
+
+    assert cache.invalidate([{"assignment_id": "task_2", "type": "reference"}]) == 0
+
+    assert lookup(cache, REFERENCES)[1] is False
+    assert lookup(cache, SUBMISSIONS)[1] is False
+    assert cache.stats()["hits"] == 2
+
+
+def test_invalidate_all_clears_the_shared_tier(cache, cache_path):
+    other = RetrievalCache(cache_path, shared=True)
+    lookup(cache, REFERENCES)
+    assert lookup(other, REFERENCES)[1] is False  # served from SQLite
+
+    cache.invalidate_all()
+
+    assert cache._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0
+    assert lookup(other, REFERENCES)[1] is True
+    assert lookup(cache, REFERENCES)[1] is False  # other's recomputed result is shared again